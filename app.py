@@ -1,30 +1,160 @@
 import os
-import subprocess
+import asyncio
 import concurrent.futures
+import functools
 import uuid
-import threading
 import time
 import json
 import re
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, send_file, flash, redirect, url_for, jsonify, session
-import google.generativeai as genai
-from werkzeug.utils import secure_filename
+from flask import Flask, render_template, request, send_file, flash, redirect, url_for, jsonify, session, Response, abort
 from dotenv import load_dotenv
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from pypdf import PdfReader
+from sqlalchemy.orm import sessionmaker
+from latex_compiler import CompilePool
+from pdf_store import PDFStore, DIGEST_NAME_RE
+from janitor import Janitor
+from result_cache import ResultCache
+from llm_client import LLMClient, ResponseCache, CircuitBreaker
+from model_registry import ModelRegistry, load_catalog
+from job_store import create_job_store, JobWriter, TERMINAL_STATUSES
+from ats_scorer import ATSScorer
+from prompts import PromptBuilder, PROMPT_VERSION, artifacts_config, estimate_tokens
+from ingest import TextExtractor, store_upload, upload_path
+from work_queue import SQLiteWorkQueue, QueueWorker, QueueFull
+from credits import CreditLedger
+from db_writer import BatchWriter
+from async_engine import AsyncQueueWorker
+from metrics import Registry, span, CONTENT_TYPE as METRICS_CONTENT_TYPE
+import sqlite_tuning
 
 load_dotenv()
 
-app = Flask(__name__)
+# Databases and caches go to INSTANCE_PATH (default: instance/ next to app.py)
+INSTANCE_PATH = os.getenv('INSTANCE_PATH')
+app = Flask(__name__, instance_path=os.path.abspath(INSTANCE_PATH) if INSTANCE_PATH else None)
 app.secret_key = 'supersecretkey'  # Change this in production
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['OUTPUT_FOLDER'] = 'outputs'
+app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'uploads')
+app.config['OUTPUT_FOLDER'] = os.getenv('OUTPUT_FOLDER', 'outputs')
+# pdflatex is CPU bound: size its pool to the cores, independently of the LLM executor
+app.config['COMPILE_WORKERS'] = int(os.getenv('COMPILE_WORKERS', os.cpu_count() or 1))
+app.config['COMPILE_TIMEOUT'] = int(os.getenv('COMPILE_TIMEOUT', 60))
+# Per-job pdflatex scratch directories; point it at tmpfs (e.g. /dev/shm/cv-tailor) to keep
+# .aux/.log churn off the disk. Only the final PDFs are kept, in outputs/pdf/ by content hash.
+app.config['COMPILE_SCRATCH_DIR'] = os.getenv('COMPILE_SCRATCH_DIR', os.path.join(app.config['OUTPUT_FOLDER'], 'build'))
+# Retention of generated files, enforced by a background janitor every JANITOR_INTERVAL seconds (0: off).
+# PDFs of saved applications and cached results are never deleted.
+app.config['OUTPUT_RETENTION_DAYS'] = int(os.getenv('OUTPUT_RETENTION_DAYS', 30))
+app.config['OUTPUT_MAX_MB'] = int(os.getenv('OUTPUT_MAX_MB', 2048))
+app.config['UPLOAD_RETENTION_DAYS'] = int(os.getenv('UPLOAD_RETENTION_DAYS', 7))
+app.config['JANITOR_INTERVAL'] = int(os.getenv('JANITOR_INTERVAL', 3600))
+# PDF transfers can be handed to the front proxy: 'x-sendfile' (Apache, lighttpd) or
+# 'x-accel-redirect' (nginx, with an internal location mapping PDF_ACCEL_PREFIX to outputs/)
+app.config['PDF_SENDFILE'] = os.getenv('PDF_SENDFILE', '')
+app.config['PDF_ACCEL_PREFIX'] = os.getenv('PDF_ACCEL_PREFIX', '/_outputs/')
+app.config['USE_X_SENDFILE'] = app.config['PDF_SENDFILE'] == 'x-sendfile'
+# Precompiled .fmt per template preamble, so jobs skip reloading babel/tikz/fontawesome5...
+app.config['LATEX_FORMAT_CACHE'] = os.getenv('LATEX_FORMAT_CACHE', '1') == '1'
+# Whole-run cache: identical (CV, job, language, templates, model) resubmissions reuse the stored result
+app.config['RESULT_CACHE'] = os.getenv('RESULT_CACHE', '1') == '1'
+app.config['RESULT_CACHE_TTL'] = int(os.getenv('RESULT_CACHE_TTL', 7 * 24 * 3600))
+app.config['RESULT_CACHE_MAX_MB'] = int(os.getenv('RESULT_CACHE_MAX_MB', 512))
+# Per-prompt cache: memory LRU in front of a SQLite tier shared by all processes
+app.config['LLM_CACHE'] = os.getenv('LLM_CACHE', '1') == '1'
+app.config['LLM_CACHE_MEMORY_ENTRIES'] = int(os.getenv('LLM_CACHE_MEMORY_ENTRIES', 256))
+app.config['LLM_CACHE_DISK_ENTRIES'] = int(os.getenv('LLM_CACHE_DISK_ENTRIES', 10000))
+app.config['LLM_CACHE_TTL'] = int(os.getenv('LLM_CACHE_TTL', 7 * 24 * 3600))
+# Stream the analysis and outreach message into the job as Gemini produces them
+app.config['LLM_STREAMING'] = os.getenv('LLM_STREAMING', '1') == '1'
+# Bounds on Gemini calls: a deadline per call (overridable per stage with a JSON object such as
+# {"analysis": 30, "cv": 90}), a timeout per attempt, and retries with jittered backoff on 429/5xx/timeouts
+app.config['LLM_DEADLINE'] = float(os.getenv('LLM_DEADLINE', 120))
+app.config['LLM_STAGE_DEADLINES'] = json.loads(os.getenv('LLM_STAGE_DEADLINES', '{}'))
+app.config['LLM_ATTEMPT_TIMEOUT'] = float(os.getenv('LLM_ATTEMPT_TIMEOUT', 60))
+app.config['LLM_MAX_ATTEMPTS'] = int(os.getenv('LLM_MAX_ATTEMPTS', 4))
+# Hedging: a call slower than the recent p95 (and LLM_HEDGE_MIN_DELAY) gets a duplicate request
+app.config['LLM_HEDGE'] = os.getenv('LLM_HEDGE', '0') == '1'
+app.config['LLM_HEDGE_MIN_DELAY'] = float(os.getenv('LLM_HEDGE_MIN_DELAY', 2))
+# Circuit breaker: after this many consecutive failures, calls fail fast for LLM_BREAKER_RESET seconds (0: off)
+app.config['LLM_BREAKER_FAILURES'] = int(os.getenv('LLM_BREAKER_FAILURES', 5))
+app.config['LLM_BREAKER_RESET'] = float(os.getenv('LLM_BREAKER_RESET', 30))
+# Model (and generation settings) per stage as a JSON object, e.g.
+# {"message": {"model": "gemini-2.0-flash-lite", "max_output_tokens": 512}}; other stages use GEMINI_MODEL.
+# PUT /api/admin/model_routes (with ADMIN_TOKEN) overrides it at runtime for every process on the host.
+app.config['LLM_STAGE_MODELS'] = json.loads(os.getenv('LLM_STAGE_MODELS', '{}'))
+# Models are checked against this list at startup (written by debug_models.py; empty: no check)
+app.config['MODEL_CATALOG'] = os.getenv('MODEL_CATALOG', 'available_models.txt')
+# Bearer token of the /api/admin endpoints; they are disabled while it is empty
+app.config['ADMIN_TOKEN'] = os.getenv('ADMIN_TOKEN', '')
+# Uploaded PDFs with at least INGEST_PARALLEL_PAGES pages are extracted by INGEST_WORKERS processes
+app.config['INGEST_WORKERS'] = int(os.getenv('INGEST_WORKERS', os.cpu_count() or 1))
+app.config['INGEST_PARALLEL_PAGES'] = int(os.getenv('INGEST_PARALLEL_PAGES', 8))
+# Prompts carry the CV condensed to this many (estimated) tokens, and a digest of
+# each LaTeX template (custom commands and a body skeleton) instead of the full file
+app.config['CV_TOKEN_BUDGET'] = int(os.getenv('CV_TOKEN_BUDGET', 2000))
+app.config['PROMPT_TEMPLATE_DIGEST'] = os.getenv('PROMPT_TEMPLATE_DIGEST', '1') == '1'
+# 'multi': one Gemini request per output; 'single': one structured (JSON schema)
+# request for all of them, re-asking only for fields that fail validation
+app.config['GENERATION_MODE'] = os.getenv('GENERATION_MODE', 'multi')
+# 'local': score with ats_scorer only; 'llm': ask Gemini before generating;
+# 'hybrid': local score first, Gemini's analysis refines it alongside generation
+app.config['ATS_MODE'] = os.getenv('ATS_MODE', 'hybrid')
+# Job state: 'sqlite' shares jobs between web workers, 'memory' keeps them in this process
+app.config['JOB_STORE'] = os.getenv('JOB_STORE', 'sqlite')
+app.config['JOB_TTL'] = int(os.getenv('JOB_TTL', 24 * 3600))
+app.config['JOB_CACHE_MB'] = int(os.getenv('JOB_CACHE_MB', 16))
+# A progress stream is closed after this long; the browser resumes it from the last event ID
+app.config['SSE_MAX_SECONDS'] = int(os.getenv('SSE_MAX_SECONDS', 300))
+# Longest pause between two checks of a job whose stream has nothing new to send
+app.config['SSE_IDLE_POLL'] = float(os.getenv('SSE_IDLE_POLL', 2))
+# Jobs go through a durable queue; these threads consume it inside the web process.
+# Set to 0 when jobs are run by separate `python worker.py` processes instead.
+app.config['EMBEDDED_WORKERS'] = int(os.getenv('EMBEDDED_WORKERS', 5))
+# Threads of this process that run jobs (queue consumers plus one direct caller); the generation
+# stage pool is sized for them once at startup. worker.py and run_adaptation.py set it from --concurrency
+app.config['JOB_THREADS'] = int(os.getenv('JOB_THREADS', app.config['EMBEDDED_WORKERS'] + 1))
+# 'threads': one thread per running job; 'async': jobs run as coroutines on one event loop per process,
+# up to ASYNC_MAX_JOBS at once (EMBEDDED_WORKERS and worker.py --concurrency then only switch consuming on),
+# with at most LLM_MAX_CONCURRENCY Gemini requests in flight
+app.config['EXECUTION_ENGINE'] = os.getenv('EXECUTION_ENGINE', 'threads')
+app.config['ASYNC_MAX_JOBS'] = int(os.getenv('ASYNC_MAX_JOBS', 200))
+app.config['LLM_MAX_CONCURRENCY'] = int(os.getenv('LLM_MAX_CONCURRENCY', 64))
+app.config['QUEUE_VISIBILITY_TIMEOUT'] = int(os.getenv('QUEUE_VISIBILITY_TIMEOUT', 300))
+app.config['QUEUE_MAX_ATTEMPTS'] = int(os.getenv('QUEUE_MAX_ATTEMPTS', 3))
+# Admission control: new jobs are refused with 429 beyond these limits
+app.config['MAX_QUEUE_DEPTH'] = int(os.getenv('MAX_QUEUE_DEPTH', 100))
+app.config['MAX_JOBS_PER_USER'] = int(os.getenv('MAX_JOBS_PER_USER', 2))
+app.config['QUEUE_RETRY_AFTER'] = int(os.getenv('QUEUE_RETRY_AFTER', 30))
+app.config['MAX_BATCH_SIZE'] = int(os.getenv('MAX_BATCH_SIZE', 50))
+# Items of one batch running at once, so a large batch cannot take every worker
+app.config['BATCH_CONCURRENCY'] = int(os.getenv('BATCH_CONCURRENCY', 3))
+# Applications a free-plan user can generate per day
+app.config['FREE_DAILY_CREDITS'] = int(os.getenv('FREE_DAILY_CREDITS', 99))
 # Force new DB file to resolve schema issues
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///cv_tailor_v2.db' 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# SQLite profile for every database of the app (see sqlite_tuning.py): WAL lets
+# readers run during writes, synchronous=NORMAL syncs at checkpoints only
+app.config['SQLITE_WAL'] = os.getenv('SQLITE_WAL', '1') == '1'
+app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 10000))
+app.config['SQLITE_MMAP_MB'] = int(os.getenv('SQLITE_MMAP_MB', 64))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+    'max_overflow': int(os.getenv('DB_POOL_OVERFLOW', 10)),
+    'pool_timeout': 30,
+}
+# Writes from job threads are committed together by one writer thread, up to this many at a time
+app.config['DB_WRITE_BATCH'] = int(os.getenv('DB_WRITE_BATCH', 64))
+# When set, /metrics asks for an "Authorization: Bearer <token>" header
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')
+
+sqlite_tuning.configure(wal=app.config['SQLITE_WAL'],
+                        synchronous=app.config['SQLITE_SYNCHRONOUS'],
+                        busy_timeout=app.config['SQLITE_BUSY_TIMEOUT_MS'],
+                        mmap_size=app.config['SQLITE_MMAP_MB'] * 1024 * 1024)
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
@@ -65,6 +195,9 @@ class Application(db.Model):
     message_content = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Serves the history list: a user's rows, newest first, id breaking timestamp ties
+    __table_args__ = (db.Index('ix_application_user_timestamp', 'user_id', 'timestamp', 'id'),)
+
 # Feedback Model
 class Feedback(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -75,7 +208,17 @@ class Feedback(db.Model):
 
 # Create DB
 with app.app_context():
+    sqlite_tuning.tune_engine(db.engine)
     db.create_all()
+    # create_all() skips indexes of tables that already exist
+    for index in Application.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+credit_ledger = CreditLedger(db, User, daily_credits=app.config['FREE_DAILY_CREDITS'])
+
+# Job threads save through this single writer instead of committing sessions of their own
+with app.app_context():
+    db_writer = BatchWriter(sessionmaker(bind=db.engine), max_batch=app.config['DB_WRITE_BATCH'])
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -120,35 +263,93 @@ def logout():
 @app.route('/api/user_status')
 def user_status():
     if current_user.is_authenticated:
-        # Check credit reset
-        if current_user.plan_type == 'free' and (datetime.utcnow() - current_user.last_reset).days >= 1:
-            current_user.credits_used = 0
-            current_user.last_reset = datetime.utcnow()
-            db.session.commit()
-            
+        remaining = credit_ledger.remaining(current_user)
         return jsonify({
             'logged_in': True, 
             'email': current_user.email,
             'has_cv': bool(current_user.cv_text),
-            'credits': 99 - current_user.credits_used,
+            'credits': remaining if remaining is not None else credit_ledger.daily_credits,
+            'daily_credits': credit_ledger.daily_credits,
             'plan': current_user.plan_type
         })
     return jsonify({'logged_in': False})
 
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+def history_cursor(timestamp, app_id):
+    return f"{timestamp.isoformat()}_{app_id}"
+
+def parse_history_cursor(cursor):
+    timestamp, _, app_id = cursor.rpartition('_')
+    return datetime.fromisoformat(timestamp), int(app_id)
+
 @app.route('/api/history')
 @login_required
 def get_history():
-    apps = Application.query.filter_by(user_id=current_user.id).order_by(Application.timestamp.desc()).all()
-    history_data = []
-    for app in apps:
-        history_data.append({
-            'id': app.id,
-            'job': app.job_title or "Job Application",
-            'company': app.company or "Unknown",
-            'score': app.ats_score,
-            'date': app.timestamp.strftime('%Y-%m-%d')
-        })
-    return jsonify(history_data)
+    """One page of the user's applications, newest first.
+
+    Query parameters: limit, cursor (next_cursor of the previous page),
+    company (substring) and min_score/max_score. Only the columns the list
+    shows are read; /api/history/<id> has the rest.
+    """
+    limit = max(1, min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), HISTORY_MAX_PAGE_SIZE))
+    query = db.session.query(Application.id, Application.job_title, Application.company,
+                             Application.ats_score, Application.timestamp) \
+        .filter(Application.user_id == current_user.id)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            timestamp, app_id = parse_history_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        # Keyset pagination: continue right after the last row of the previous page
+        query = query.filter(db.or_(Application.timestamp < timestamp,
+                                    db.and_(Application.timestamp == timestamp, Application.id < app_id)))
+
+    company = request.args.get('company', '').strip()
+    if company:
+        escaped = company.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(Application.company.ilike(f"%{escaped}%", escape='\\'))
+    min_score = request.args.get('min_score', type=int)
+    if min_score is not None:
+        query = query.filter(Application.ats_score >= min_score)
+    max_score = request.args.get('max_score', type=int)
+    if max_score is not None:
+        query = query.filter(Application.ats_score <= max_score)
+
+    rows = query.order_by(Application.timestamp.desc(), Application.id.desc()).limit(limit + 1).all()
+    items = [{
+        'id': row.id,
+        'job': row.job_title or "Job Application",
+        'company': row.company or "Unknown",
+        'score': row.ats_score,
+        'date': row.timestamp.strftime('%Y-%m-%d')
+    } for row in rows[:limit]]
+    next_cursor = history_cursor(rows[limit - 1].timestamp, rows[limit - 1].id) if len(rows) > limit else None
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+@app.route('/api/history/<int:app_id>')
+@login_required
+def get_history_item(app_id):
+    """Everything stored for one application, shaped like a finished job's result."""
+    item = Application.query.filter_by(id=app_id, user_id=current_user.id).first_or_404()
+    return jsonify({
+        'id': item.id,
+        'date': item.timestamp.strftime('%Y-%m-%d'),
+        'result': {
+            'analysis': {
+                'job_title': item.job_title or "Job Application",
+                'company': item.company or "Unknown",
+                'ats_score': item.ats_score,
+                'missing_keywords': json.loads(item.missing_keywords or '[]'),
+            },
+            'cv_pdf': item.cv_path,
+            'cl_pdf': item.cl_path,
+        },
+        'message_text': item.message_content or '',
+    })
 
 @app.route('/api/contact', methods=['POST'])
 def contact():
@@ -164,12 +365,122 @@ def contact():
 
 # Gemini Configuration
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+# Another Gemini-compatible REST server, e.g. http://127.0.0.1:8765 for fake_gemini.py
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')
+
+llm = LLMClient(
+    api_key=GEMINI_API_KEY,
+    cache=ResponseCache(os.path.join(app.instance_path, 'llm_cache.db'),
+                        max_memory_entries=app.config['LLM_CACHE_MEMORY_ENTRIES'],
+                        max_disk_entries=app.config['LLM_CACHE_DISK_ENTRIES'],
+                        ttl=app.config['LLM_CACHE_TTL']) if app.config['LLM_CACHE'] else None,
+    default_model=GEMINI_MODEL,
+    api_endpoint=GEMINI_API_ENDPOINT,
+    deadline=app.config['LLM_DEADLINE'],
+    attempt_timeout=app.config['LLM_ATTEMPT_TIMEOUT'],
+    max_attempts=app.config['LLM_MAX_ATTEMPTS'],
+    hedge=app.config['LLM_HEDGE'],
+    hedge_min_delay=app.config['LLM_HEDGE_MIN_DELAY'],
+    breaker=CircuitBreaker(app.config['LLM_BREAKER_FAILURES'], app.config['LLM_BREAKER_RESET'])
+    if app.config['LLM_BREAKER_FAILURES'] > 0 else None,
+    max_async_calls=app.config['LLM_MAX_CONCURRENCY'])
+model_catalog = load_catalog(app.config['MODEL_CATALOG']) if app.config['MODEL_CATALOG'] else None
+model_registry = ModelRegistry(GEMINI_MODEL, app.config['LLM_STAGE_MODELS'], catalog=model_catalog,
+                               overrides_path=os.path.join(app.instance_path, 'model_routes.json'))
+
+# Global Job Store and Queue
+JOBS = create_job_store(app.config['JOB_STORE'], os.path.join(app.instance_path, 'jobs.db'),
+                        ttl=app.config['JOB_TTL'], cache_bytes=app.config['JOB_CACHE_MB'] * 1024 * 1024)
+# The async engine records job progress through one writer thread instead of on its event loop
+job_writer = JobWriter(JOBS) if app.config['EXECUTION_ENGINE'] == 'async' else None
+work_queue = SQLiteWorkQueue(os.path.join(app.instance_path, 'queue.db'),
+                             visibility_timeout=app.config['QUEUE_VISIBILITY_TIMEOUT'],
+                             max_attempts=app.config['QUEUE_MAX_ATTEMPTS'])
+# Generation stages are fanned out from the threads running jobs into their own pool, with
+# room for every stage of each of JOB_THREADS jobs so a job never waits on a slot held by another.
+# Its threads are only started as stages need them.
+MAX_PARALLEL_STAGES = 4  # analysis, CV, cover letter and message
+llm_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=app.config['JOB_THREADS'] * MAX_PARALLEL_STAGES, thread_name_prefix='llm-stage')
+
+pdf_store = PDFStore(os.path.join(app.config['OUTPUT_FOLDER'], 'pdf'), legacy_dir=app.config['OUTPUT_FOLDER'])
+compile_pool = CompilePool(pdf_store, app.config['COMPILE_SCRATCH_DIR'],
+                           format_dir=os.path.join(app.config['OUTPUT_FOLDER'], 'formats'),
+                           max_workers=app.config['COMPILE_WORKERS'],
+                           timeout=app.config['COMPILE_TIMEOUT'],
+                           use_formats=app.config['LATEX_FORMAT_CACHE'])
+
+# Spawned pool processes (PDF extraction) re-import this module as __mp_main__
+# when the app is run as a script; they must not start background services
+BACKGROUND = __name__ != '__mp_main__'
+
+# Dump the template formats up front instead of on the first job
+for template_path in ('CV.tex', 'CoverLetter.tex'):
+    if os.path.exists(template_path) and BACKGROUND:
+        with open(template_path, 'r', encoding='utf-8') as f:
+            compile_pool.warm(f.read())
+
+ats_scorer = ATSScorer()
+cv_extractor = TextExtractor(os.path.join(app.instance_path, 'cv_text_cache.db'),
+                             max_workers=app.config['INGEST_WORKERS'],
+                             parallel_pages=app.config['INGEST_PARALLEL_PAGES'])
+
+result_cache = ResultCache(os.path.join(app.instance_path, 'result_cache.db'),
+                           pdf_store,
+                           ttl=app.config['RESULT_CACHE_TTL'],
+                           max_bytes=app.config['RESULT_CACHE_MAX_MB'] * 1024 * 1024)
+
+def referenced_outputs():
+    """PDF names still in use: those of saved applications and of result cache entries."""
+    names = result_cache.referenced()
+    with app.app_context():
+        for cv_path, cl_path in db.session.query(Application.cv_path, Application.cl_path).yield_per(1000):
+            names.update((cv_path, cl_path))
+    names.discard(None)
+    return names
+
+janitor = Janitor(pdf_store, referenced_outputs,
+                  retention=app.config['OUTPUT_RETENTION_DAYS'] * 86400,
+                  max_bytes=app.config['OUTPUT_MAX_MB'] * 1024 * 1024,
+                  # Jobs (guest ones included) keep serving their PDFs for JOB_TTL
+                  min_age=app.config['JOB_TTL'],
+                  scratch_dirs=[app.config['COMPILE_SCRATCH_DIR']],
+                  upload_dir=app.config['UPLOAD_FOLDER'],
+                  upload_retention=app.config['UPLOAD_RETENTION_DAYS'] * 86400,
+                  interval=app.config['JANITOR_INTERVAL'])
+if app.config['JANITOR_INTERVAL'] > 0 and BACKGROUND:
+    janitor.start()
 
-# Global Job Store and Executor
-JOBS = {}
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=5)
+# Metrics of this process, served at /metrics in the Prometheus text format
+metrics_registry = Registry(prefix='cvadapter_')
+STAGE_SECONDS = metrics_registry.histogram(
+    'stage_seconds', "Duration of job stages: queue wait, CV upload and extraction, each LLM stage, "
+                     "pdflatex per document, database save.", ['stage'])
+JOB_SECONDS = metrics_registry.histogram('job_seconds', "Processing time of jobs, by outcome.", ['outcome'])
+JOBS_TOTAL = metrics_registry.counter('jobs_total', "Jobs finished, by outcome (completed, failed, cached, "
+                                                    "rejected by the queue, abandoned after retries).", ['outcome'])
+COMPILE_FAILURES = metrics_registry.counter('compile_failures_total', "pdflatex runs without a clean PDF.",
+                                            ['document', 'reason'])
+
+def cache_counts(hits):
+    counts = {('result',): result_cache.hits if hits else result_cache.misses}
+    if llm.cache:
+        counts[('llm',)] = llm.cache.memory_hits + llm.cache.disk_hits if hits else llm.cache.misses
+    return counts
+
+metrics_registry.counter('cache_hits_total', "Lookups answered from a cache.", ['cache'],
+                         fn=lambda: cache_counts(True))
+metrics_registry.counter('cache_misses_total', "Lookups not found in a cache.", ['cache'],
+                         fn=lambda: cache_counts(False))
+metrics_registry.counter('llm_upstream_total', "Gemini requests made, failed, retried and hedged.", ['event'],
+                         fn=lambda: {('call',): llm.calls, ('failure',): llm.failures, ('retry',): llm.retries,
+                                     ('hedge',): llm.hedges})
+metrics_registry.gauge('queue_depth', "Tasks waiting or running in the work queue (all processes).",
+                       fn=lambda: work_queue.depth())
+metrics_registry.gauge('jobs_in_flight', "Jobs being processed by this process.",
+                       fn=lambda: sum(worker.in_flight() for worker in queue_workers))
+metrics_registry.gauge('job_store_jobs', "Jobs and batches held by the job store.", fn=lambda: JOBS.count())
 
 def clean_markdown(text):
     if text.startswith("```latex"): text = text[8:]
@@ -181,276 +492,624 @@ def clean_markdown(text):
 
 def extract_json(text):
     """Extracts JSON object from a string that might contain other text."""
+    if not text:
+        return None
     try:
         # Try parsing directly
         return json.loads(text)
     except json.JSONDecodeError:
-        # Look for { ... } structure
-        match = re.search(r'\{.*\}', text, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group(0))
-            except:
-                pass
+        pass
+    # Otherwise decode from each '{' in turn: unlike a greedy {.*} match this
+    # survives prose or a second object after the JSON, and code fences around it
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r'\{', text):
+        try:
+            obj, _ = decoder.raw_decode(text, match.start())
+        except json.JSONDecodeError:
+            continue
+        if isinstance(obj, dict):
+            return obj
     return None
 
-def process_job(job_id, job_description, cv_text, user_id=None, language='en'):
-    try:
-        JOBS[job_id]['status'] = 'processing'
-        JOBS[job_id]['current_step'] = 0
-        JOBS[job_id]['logs'].append("Analyzing Job Description & CV...")
+def validate_artifacts(data, fields):
+    """Checks the fields of a single-call response.
 
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
-        # 1. ANALYZE & SCORE (JSON Output)
-        analysis_prompt = f"""
-        Act as an expert ATS (Applicant Tracking System) scanner.
-        Compare the following CV against the Job Description.
-        
-        JOB DESCRIPTION:
-        {job_description}
-
-        CV CONTENT:
-        {cv_text}
-
-        Return a ONLY a JSON object with this exact structure:
-        {{
-            "job_title": "extracted job title",
-            "company": "extracted company name",
-            "ats_score": 85,
-            "missing_keywords": ["keyword1", "keyword2", "keyword3"],
-            "cv_improvements": "Short summary of what to change in the CV content to target this job."
-        }}
-        """
-        
-        analysis_response = model.generate_content(analysis_prompt)
-        analysis_data = extract_json(analysis_response.text)
-        
-        if not analysis_data:
-            # Fallback if AI fails to give JSON
-            analysis_data = {
-                "job_title": "Job Application", "company": "Unknown", 
-                "ats_score": 70, "missing_keywords": [], "cv_improvements": ""
-            }
-
-        JOBS[job_id]['logs'].append(f"ATS Score: {analysis_data['ats_score']}%")
-        JOBS[job_id]['current_step'] = 1
-        
-        # 2. GENERATE LATEX CV
-        # Read the Master Template
-        try:
-            with open('CV.tex', 'r', encoding='utf-8') as f:
-                cv_template = f.read()
-            with open('CoverLetter.tex', 'r', encoding='utf-8') as f:
-                cl_template = f.read()
-        except FileNotFoundError:
-            cv_template = "Error: CV.tex not found."
-            cl_template = "Error: CoverLetter.tex not found."
-            JOBS[job_id]['logs'].append("Error: Templates not found.")
-
-        cv_prompt = f"""
-    You are an expert CV tailor.
-    I have a Master CV (Markdown) containing all my experiences, and a Job Description.
-    I also have a LaTeX CV template.
-
-    Your task is to rewrite the BODY of the LaTeX CV to target the Job Description, using the data from the Master CV.
-    
-    GUIDELINES:
-    1. **Strict Structure**: You MUST use the exact LaTeX commands and structure defined in the template (e.g., use the defined \\entry and \\project commands).
-    2. **Content**: Select the most relevant projects/experiences. Rewrite the 'Profile' and 'Title'.
-    3. **No Markdown**: Do NOT use markdown formatting (no **, no # headers). Use LaTeX commands (\\textbf{{...}}).
-    4. **Language**: Write strictly in {language.upper()}.
-    5. **Reference**: Do strictly follow the template's custom commands.
-    6. **ONE PAGE ONLY**: Keep it concise.
-    7. **Output Format**: generate ONLY the LaTeX content for the body. Do NOT include \\documentclass, preamble, \\begin{{document}} or \\end{{document}}.
-
-    Master CV (Source of Truth):
-    {cv_text}
-
-    Job Description:
-    {job_description}
-
-    LaTeX CV Template (Structure to follow):
-    {cv_template}
-    
-    Return ONLY the content that goes INSIDE \\begin{{document}} ... \\end{{document}}.
+    Returns (valid, problems): the usable values, cleaned, and a reason for
+    each requested field that is missing or malformed.
     """
-        cv_response = model.generate_content(cv_prompt)
-        cv_body = clean_markdown(cv_response.text)
-        
-        # Reconstruct the full CV
-        if "\\begin{document}" in cv_template:
-            preamble = cv_template.split("\\begin{document}")[0]
-            cv_latex = f"{preamble}\\begin{{document}}\n{cv_body}\n\\end{{document}}"
+    valid, problems = {}, {}
+    if not isinstance(data, dict):
+        return valid, {field: "response is not a JSON object" for field in fields}
+    for field in fields:
+        value = data.get(field)
+        if field == 'analysis':
+            try:
+                score = int(value['ats_score'])
+                keywords = value.get('missing_keywords') or []
+                if not 0 <= score <= 100 or not isinstance(keywords, list):
+                    raise ValueError
+            except (TypeError, KeyError, ValueError):
+                problems[field] = "analysis needs an ats_score between 0 and 100 and a missing_keywords list"
+                continue
+            valid[field] = {**ANALYSIS_FALLBACK, **value, 'ats_score': score,
+                            'missing_keywords': [str(k) for k in keywords]}
+            continue
+
+        value = clean_markdown(value) if isinstance(value, str) else ''
+        if not value:
+            problems[field] = f"{field} is empty"
+        elif field in ('cv_body', 'cl_body') and ('\\' not in value or '\\documentclass' in value):
+            problems[field] = f"{field} must be LaTeX body content"
         else:
-            cv_latex = cv_body # Fallback
+            valid[field] = value
+    return valid, problems
 
-        JOBS[job_id]['current_step'] = 2
+ANALYSIS_FALLBACK = {
+    "job_title": "Job Application", "company": "Unknown",
+    "ats_score": 70, "missing_keywords": [], "cv_improvements": ""
+}
 
-        # 3. GENERATE COVER LETTER
-        cl_prompt = f"""
-    You are an expert career coach.
-    Write a professional Cover Letter body for the attached Job Description.
-    
-    JOB DESCRIPTION:
-    {job_description}
-    
-    CANDIDATE CV:
-    {cv_text}
-    
-    TEMPLATE CONTEXT:
-    {cl_template}
-    
-    INSTRUCTIONS:
-    1. **Format**: Use the exact commands from the template (e.g., \\opening, \\closing).
-    2. **Content**: Write 3 paragraphs explaining why the candidate is a fit.
-    3. **Style**: Professional and enthusiastic. Write strictly in {language.upper()}.
-    4. **Output**: Return ONLY the body content (from \\opening to \\closing). Do NOT include \\documentclass or \\begin{{document}}.
-    """
-        cl_response = model.generate_content(cl_prompt)
-        cl_body = clean_markdown(cl_response.text)
-        
-        # Inject into CL Template
-        if "% <BODY_CONTENT>" in cl_template:
-            cl_latex = cl_template.replace("% <BODY_CONTENT>", cl_body)
-        elif "\\begin{document}" in cl_template:
-             # Heuristic injection
-             part1 = cl_template.split("\\begin{document}")[0] + "\\begin{document}\n"
-             if "\\makeextraheader" in cl_template:
-                 part1 += "\\makeextraheader\n"
-             cl_latex = f"{part1}\n{cl_body}\n\\end{{document}}"
-        else:
-            cl_latex = cl_body
-        
-        # 4. GENERATE OUTREACH MESSAGE
-        lang_name = "French" if language == 'fr' else "English"
-        msg_prompt = f"""
-        Act as the candidate described in the CV.
-        Write a short, engaging LinkedIn outreach message (<1000 chars) to a recruiter for this Job.
-        
-        CONTEXT:
-        - My CV: {cv_text}
-        - Job Description: {job_description}
-
-        INSTRUCTIONS:
-        1. **Language**: Write strictly in {lang_name}.
-        2. **No Placeholders**: You MUST fill in the names/skills/company.
-           - Candidate Name: Extract from CV (if not found, use "The Candidate").
-           - Recruiter Name: "Hiring Team" (unless specific name found in JD).
-           - Company: Extract from JD.
-           - Skills: select real skills from CV relevant to JD.
-        3. **Tone**: Professional, brief, and not robotic.
-        
-        Return ONLY the message text (Subject + Body).
-        """
-        msg_response = model.generate_content(msg_prompt)
-        msg_content = clean_markdown(msg_response.text)
-
-        # 5. COMPILE LATEX
-        JOBS[job_id]['current_step'] = 3
-        JOBS[job_id]['logs'].append("Compiling PDF Documents...")
-        
-        output_dir = app.config['OUTPUT_FOLDER']
-        cv_filename = f"CV_{job_id}.tex"
-        cl_filename = f"CL_{job_id}.tex"
-        
-        with open(os.path.join(output_dir, cv_filename), 'w', encoding='utf-8') as f: f.write(cv_latex)
-        with open(os.path.join(output_dir, cl_filename), 'w', encoding='utf-8') as f: f.write(cl_latex)
+STAGE_LABELS = {
+    'analysis': "ATS analysis",
+    'cv': "CV content",
+    'cl': "Cover letter",
+    'message': "Outreach message",
+}
+
+def load_templates():
+    """Returns (cv_template, cl_template); raises FileNotFoundError if one is missing."""
+    with open('CV.tex', 'r', encoding='utf-8') as f:
+        cv_template = f.read()
+    with open('CoverLetter.tex', 'r', encoding='utf-8') as f:
+        cl_template = f.read()
+    return cv_template, cl_template
+
+def save_profile_cv(user_id, cv_text):
+    def write(session):
+        user = session.get(User, user_id)
+        if user:
+            user.cv_text = cv_text
+    db_writer.call(write)
+
+def refund_credit(user_id, reserved_at, count=1):
+    """Gives back credits reserved at submission; reserved_at is the ISO time kept in the job payload."""
+    if user_id and reserved_at:
+        db_writer.call(lambda session: credit_ledger.refund(user_id, datetime.fromisoformat(reserved_at), count,
+                                                            session=session))
+
+def save_application(user_id, analysis_data, cv_pdf, cl_pdf, msg_content):
+    db_writer.call(lambda session: session.add(Application(
+        user_id=user_id,
+        job_title=analysis_data.get('job_title', 'Job Application'),
+        company=analysis_data.get('company', 'Unknown'),
+        ats_score=analysis_data.get('ats_score', 0),
+        missing_keywords=json.dumps(analysis_data.get('missing_keywords', [])),
+        cv_path=cv_pdf,
+        cl_path=cl_pdf,
+        message_content=msg_content
+    )))
+
+def record_stage(job_id, name, result, error, results, errors, on_done=None, jobs=JOBS):
+    """Files the outcome of one stage of run_stages(). A failing stage is logged
+    and reported in errors without failing the job."""
+    if error is not None:
+        errors[name] = str(error)
+        jobs.append_log(job_id, f"{STAGE_LABELS[name]} failed: {error}")
+        print(f"Stage {name} failed for job {job_id}: {error}")
+        return
+    results[name] = result
+    if on_done:
+        on_done(name, result)
 
-        # Compilation Command (with fallback)
-        pdflatex_path = r'C:\Users\ayman\AppData\Local\Programs\MiKTeX\miktex\bin\x64\pdflatex.exe'
-        cmd = pdflatex_path if os.path.exists(pdflatex_path) else 'pdflatex'
+def run_stages(job_id, stages, on_done=None):
+    """Runs independent stages concurrently and waits for all of them.
 
+    Returns (results, errors) keyed by stage name. A failing stage does not
+    cancel its siblings. on_done(name, result) runs in the calling thread as
+    soon as each stage succeeds.
+    """
+    futures = {llm_executor.submit(fn): name for name, fn in stages.items()}
+    results, errors = {}, {}
+    for future in concurrent.futures.as_completed(futures):
+        error = future.exception()
+        record_stage(job_id, futures[future], None if error else future.result(), error, results, errors, on_done)
+    return results, errors
+
+async def run_stages_async(job_id, stages, on_done=None, jobs=JOBS):
+    """run_stages() for coroutines: stages maps names to coroutines, run concurrently on the loop."""
+    async def outcome(name, coro):
         try:
+            return name, await coro, None
+        except Exception as e:
+            return name, None, e
+
+    results, errors = {}, {}
+    for next_done in asyncio.as_completed([outcome(name, coro) for name, coro in stages.items()]):
+        name, result, error = await next_done
+        record_stage(job_id, name, result, error, results, errors, on_done, jobs)
+    return results, errors
+
+def stage_call(name, prompts, cv_template, cl_template, language):
+    """(prompt, parse, streamed) of a stage's own Gemini call: parse turns the
+    response into the stage's result, streamed ones are shown as they arrive."""
+    if name == 'analysis':
+        return prompts.analysis(), extract_json, True
+    if name == 'cv':
+        return prompts.cv_body(cv_template, language), clean_markdown, False
+    if name == 'cl':
+        return prompts.cl_body(cl_template, language), clean_markdown, False
+    return prompts.message(language), clean_markdown, True
+
+def generation_stages(ats_mode):
+    """Stages generated once the score is shown."""
+    stages = ['cv', 'cl', 'message']
+    if ats_mode == 'hybrid':
+        # Gemini's analysis runs next to the documents instead of before them
+        stages.append('analysis')
+    return stages
+
+# Single-call response fields -> the stage each one stands in for
+ARTIFACT_STAGES = {'analysis': 'analysis', 'cv_body': 'cv', 'cl_body': 'cl', 'message': 'message'}
+ARTIFACT_FIELDS = {stage: field for field, stage in ARTIFACT_STAGES.items()}
+
+def artifact_requests(job_id, prompts, cv_template, cl_template, language, fields, attempts=3, on_done=None,
+                      jobs=JOBS):
+    """Single-call mode: one structured Gemini request for all fields.
+
+    Fields that fail validation are asked for again, alone, up to `attempts`
+    requests in total. A generator, so that both engines make the same
+    requests: it yields (prompt, generation_config, fresh) for each one and
+    is sent back the response text, or the exception raised. It returns
+    (results, errors) keyed by stage name, like run_stages, and calls
+    on_done(name, result) as soon as a field is valid.
+    """
+    results, problems = {}, {}
+    pending = list(fields)
+    for attempt in range(attempts):
+        if attempt:
+            jobs.append_log(job_id, f"Requesting again: {', '.join(pending)}...")
+        # A retry must not be answered with the cached invalid response
+        answer = yield (prompts.artifacts(cv_template, cl_template, language, pending), artifacts_config(pending),
+                        attempt > 0)
+        if isinstance(answer, Exception):
+            problems = {field: str(answer) for field in pending}
+            print(f"Structured generation failed for job {job_id}: {answer}")
+            continue
+        valid, problems = validate_artifacts(extract_json(answer), pending)
+        results.update(valid)
+        if on_done:
+            for field, value in valid.items():
+                on_done(ARTIFACT_STAGES[field], value)
+        pending = [field for field in pending if field not in valid]
+        if not pending:
+            break
+
+    errors = {}
+    for field in pending:
+        stage = ARTIFACT_STAGES[field]
+        errors[stage] = problems.get(field, "no valid value returned")
+        jobs.append_log(job_id, f"{STAGE_LABELS[stage]} failed: {errors[stage]}")
+    return {ARTIFACT_STAGES[field]: value for field, value in results.items()}, errors
+
+def generate_artifacts(generate, requests):
+    """Answers artifact_requests() with generate(prompt, generation_config=..., fresh=...)."""
+    try:
+        request = next(requests)
+        while True:
+            prompt, config, fresh = request
+            try:
+                answer = generate(prompt, generation_config=config, fresh=fresh)
+            except Exception as e:
+                answer = e
+            request = requests.send(answer)
+    except StopIteration as done:
+        return done.value
+
+async def generate_artifacts_async(agenerate, requests):
+    """generate_artifacts() for coroutines."""
+    try:
+        request = next(requests)
+        while True:
+            prompt, config, fresh = request
+            try:
+                answer = await agenerate(prompt, generation_config=config, fresh=fresh)
+            except Exception as e:
+                answer = e
+            request = requests.send(answer)
+    except StopIteration as done:
+        return done.value
+
+def build_cv_latex(cv_template, cv_body):
+    # Reconstruct the full CV
+    if "\\begin{document}" in cv_template:
+        preamble = cv_template.split("\\begin{document}")[0]
+        return f"{preamble}\\begin{{document}}\n{cv_body}\n\\end{{document}}"
+    return cv_body # Fallback
+
+def build_cl_latex(cl_template, cl_body):
+    # Inject into CL Template
+    if "% <BODY_CONTENT>" in cl_template:
+        return cl_template.replace("% <BODY_CONTENT>", cl_body)
+    elif "\\begin{document}" in cl_template:
+        # Heuristic injection
+        part1 = cl_template.split("\\begin{document}")[0] + "\\begin{document}\n"
+        if "\\makeextraheader" in cl_template:
+            part1 += "\\makeextraheader\n"
+        return f"{part1}\n{cl_body}\n\\end{{document}}"
+    return cl_body
+
+def job_timings(timings, queue_wait):
+    """Seconds per stage of a job, for /job_status?timings=1; stages running in parallel overlap."""
+    timings = dict(timings or {})
+    if queue_wait is not None:
+        STAGE_SECONDS.observe(queue_wait, stage='queue_wait')
+        timings['queue_wait'] = round(queue_wait, 3)
+    return timings
+
+def begin_job(job_id, job_description, cv_text, user_id, language, cache_key, cv_upload, timings, templates,
+              bypass_cache=False, credit_reserved_at=None, batch_id=None):
+    """Marks the job as processing and extracts an uploaded CV. Returns (cv_text, cache_key),
+    or None when the extracted CV replays a cached run and the job is already completed."""
+    JOBS.update(job_id, status='processing', current_step=0, errors={})
+    if cv_upload:
+        JOBS.append_log(job_id, "Reading CV...")
+        with span(STAGE_SECONDS, 'extract', timings):
+            cv_text = cv_extractor.extract(cv_upload, upload_path(app.config['UPLOAD_FOLDER'], cv_upload))
+        if user_id:
+            save_profile_cv(user_id, cv_text)
+        # The text was unknown when the job was queued: look the run up now
+        cache_key = cache_key or result_cache_key(cv_text, job_description, language, templates)
+        cached = result_cache.get(cache_key) if cache_key and not bypass_cache else None
+        if cached:
+            JOBS.append_log(job_id, "Loaded from cache.")
+            JOBS.append_log(job_id, "Done!")
+            JOBS.update(job_id, timings=timings, **cached_job(cached))
+            replayed(cached, user_id, credit_reserved_at)
+            settle_batch(batch_id)
+            return None
+    JOBS.append_log(job_id, "Analyzing Job Description & CV...")
+    return cv_text, cache_key
+
+def job_templates(job_id):
+    # Read the Master Templates
+    try:
+        return load_templates()
+    except FileNotFoundError:
+        JOBS.append_log(job_id, "Error: Templates not found.")
+        return "Error: CV.tex not found.", "Error: CoverLetter.tex not found."
+
+def job_ats_mode():
+    if app.config['GENERATION_MODE'] == 'single' and app.config['ATS_MODE'] == 'llm':
+        # The single request carries the analysis too; show the local score meanwhile
+        return 'hybrid'
+    return app.config['ATS_MODE']
+
+def route_stage(stage, prompt, generation_config, prompt_tokens):
+    """(model, generation config) of a stage's call; records the (estimated) prompt size per stage."""
+    model, config = model_registry.route(stage)
+    config.update(generation_config or {})
+    prompt_tokens[stage] = prompt_tokens.get(stage, 0) + estimate_tokens(prompt)
+    return model, config or None
+
+def stream_to(job_id, stage, jobs=JOBS):
+    """on_chunk of a streamed stage, or None when streaming is off."""
+    if not app.config['LLM_STREAMING']:
+        return None
+    return lambda text: jobs.append_chunk(job_id, stage, text)
+
+def show_ats_score(job_id, analysis_data, ats_mode, jobs=JOBS):
+    if not analysis_data:
+        # Fallback if AI fails to give JSON
+        analysis_data = dict(ANALYSIS_FALLBACK)
+    jobs.append_log(job_id, f"ATS Score: {analysis_data['ats_score']}%"
+                            + (" (quick estimate)" if ats_mode == 'hybrid' else ""))
+    jobs.update(job_id, current_step=1, ats_preview=analysis_data['ats_score'])
+    return analysis_data
+
+def stage_generated(job_id, name, body, cv_template, cl_template, submit_compile, jobs=JOBS):
+    """on_done of the generation stages: logs the stage and hands a document's
+    LaTeX to submit_compile(prefix, latex) while the other stages still run."""
+    jobs.append_log(job_id, f"{STAGE_LABELS[name]} generated.")
+    if name == 'cv':
+        jobs.update(job_id, current_step=2)
+        submit_compile('CV', build_cv_latex(cv_template, body))
+    elif name == 'cl':
+        submit_compile('CL', build_cl_latex(cl_template, body))
+
+def merge_generated(job_id, analysis_data, generated, errors, prompt_tokens, jobs=JOBS):
+    """Records the generation outcome; returns (analysis_data, message). Raises when neither document was written."""
+    jobs.update(job_id, errors=errors, prompt_tokens=prompt_tokens)
+    if generated.get('analysis'):
+        analysis_data = {**analysis_data, **generated['analysis']}
+        jobs.append_log(job_id, f"ATS Score refined: {analysis_data.get('ats_score')}%")
+
+    if 'cv' not in generated and 'cl' not in generated:
+        raise Exception("CV and cover letter generation both failed.")
+
+    # 5. COMPILE LATEX (already under way; wait for both documents)
+    jobs.update(job_id, current_step=3)
+    jobs.append_log(job_id, "Compiling PDF Documents...")
+    return analysis_data, generated.get('message', '')
+
+def finish_job(job_id, user_id, compiled, analysis_data, msg_content, errors, cache_key, timings, start,
+               batch_id=None):
+    """Files the compile results (CompileResult by 'CV'/'CL'), saves the application and completes the job."""
+    pdfs = {}
+    pdf_paths = {}
+    all_compiled = True
+    for prefix in ('CV', 'CL'):
+        if prefix not in compiled:
+            continue
+        result = compiled[prefix]
+        stage = f"pdflatex_{prefix.lower()}"
+        STAGE_SECONDS.observe(result.elapsed, stage=stage)
+        timings[stage] = round(result.elapsed, 3)
+        if result.error:
+            JOBS.append_log(job_id, f"PDF Execution Error: {result.error}")
+            print(f"{prefix} Compilation Exec Failed: {result.error}")
+            COMPILE_FAILURES.inc(document=prefix, reason='timeout' if 'timed out' in result.error else 'error')
+        elif result.returncode != 0:
             # Capture output for debugging
-            result_cv = subprocess.run([cmd, '-interaction=nonstopmode', '-output-directory', output_dir, os.path.join(output_dir, cv_filename)], 
-                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=False)
-            
-            if result_cv.returncode != 0:
-                print(f"CV Compilation Failed:\nSTDOUT: {result_cv.stdout}\nSTDERR: {result_cv.stderr}")
-                JOBS[job_id]['logs'].append(f"CV Compilation Error (Code {result_cv.returncode})")
+            print(f"{prefix} Compilation Failed:\nSTDOUT: {result.stdout}\nSTDERR: {result.stderr}")
+            JOBS.append_log(job_id, f"{prefix} Compilation Error (Code {result.returncode})")
+            COMPILE_FAILURES.inc(document=prefix, reason='exit_code')
 
-            result_cl = subprocess.run([cmd, '-interaction=nonstopmode', '-output-directory', output_dir, os.path.join(output_dir, cl_filename)], 
-                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=False)
-                                     
-            if result_cl.returncode != 0:
-                 print(f"CL Compilation Failed:\nSTDOUT: {result_cl.stdout}\nSTDERR: {result_cl.stderr}")
-                 JOBS[job_id]['logs'].append(f"CL Compilation Error (Code {result_cl.returncode})")
+        # Check if files actually exist
+        if not result.pdf_path:
+            JOBS.append_log(job_id, f"CRITICAL: {prefix} PDF was not created.")
+        pdfs[prefix] = result.pdf_name
+        pdf_paths[prefix] = result.pdf_path
+        all_compiled = all_compiled and result.ok
+
+    # Keep the build directory (sources and .log files) around only when something went wrong
+    if all_compiled:
+        compile_pool.cleanup(job_id)
+
+    cv_pdf = pdfs.get('CV')
+    cl_pdf = pdfs.get('CL')
+
+    # 6. SAVE TO DB (If Registered)
+    if user_id:
+        with span(STAGE_SECONDS, 'save', timings):
+            save_application(user_id, analysis_data, cv_pdf, cl_pdf, msg_content)
 
+    # Only complete, error-free runs are worth replaying
+    if cache_key and all_compiled and not errors and len(pdf_paths) == 2:
+        try:
+            result_cache.put(cache_key, pdf_paths['CV'], pdf_paths['CL'], analysis_data, msg_content)
         except Exception as e:
-            JOBS[job_id]['logs'].append(f"PDF Execution Error: {e}")
-            print(f"Compilation Exec Failed: {e}")
+            print(f"Result cache store failed for job {job_id}: {e}")
 
-        cv_pdf = f"CV_{job_id}.pdf"
-        cl_pdf = f"CL_{job_id}.pdf"
-        
-        # Check if files actually exist
-        if not os.path.exists(os.path.join(output_dir, cv_pdf)):
-             JOBS[job_id]['logs'].append("CRITICAL: CV PDF was not created.")
-        
-        if not os.path.exists(os.path.join(output_dir, cl_pdf)):
-             JOBS[job_id]['logs'].append("CRITICAL: CL PDF was not created.")
+    timings['total'] = round(time.perf_counter() - start, 3)
+    JOBS.append_log(job_id, "Done!")
+    JOBS.update(job_id, current_step=4, status='completed', result={
+        'cv_pdf': cv_pdf,
+        'cl_pdf': cl_pdf,
+        'analysis': analysis_data
+    }, message_text=msg_content, timings=timings) # Keys match frontend
+    JOB_SECONDS.observe(timings['total'], outcome='completed')
+    JOBS_TOTAL.inc(outcome='completed')
+    settle_batch(batch_id)
 
-        # 6. SAVE TO DB (If Registered)
-        if user_id:
-            with app.app_context():
-                user = User.query.get(user_id)
-                if user and user.plan_type == 'free':
-                    user.credits_used += 1
-                
-                new_app = Application(
-                    user_id=user_id,
-                    job_title=analysis_data.get('job_title', 'Job Application'),
-                    company=analysis_data.get('company', 'Unknown'),
-                    ats_score=analysis_data.get('ats_score', 0),
-                    missing_keywords=json.dumps(analysis_data.get('missing_keywords', [])),
-                    cv_path=cv_pdf,
-                    cl_path=cl_pdf,
-                    message_content=msg_content
-                )
-                db.session.add(new_app)
-                db.session.commit()
+def fail_job(job_id, error, user_id, credit_reserved_at, timings, start, batch_id=None):
+    timings['total'] = round(time.perf_counter() - start, 3)
+    JOBS.append_log(job_id, f"Error: {str(error)}")
+    JOBS.update(job_id, status='failed', timings=timings)
+    refund_credit(user_id, credit_reserved_at)
+    JOB_SECONDS.observe(timings['total'], outcome='failed')
+    JOBS_TOTAL.inc(outcome='failed')
+    print(f"Job failed: {error}")
+    settle_batch(batch_id)
+
+def process_job(job_id, job_description, cv_text, user_id=None, language='en', cache_key=None, bypass_cache=False,
+                cv_upload=None, credit_reserved_at=None, timings=None, queue_wait=None, batch_id=None):
+    timings = job_timings(timings, queue_wait)
+    start = time.perf_counter()
+    try:
+        cv_template, cl_template = job_templates(job_id)
+        started = begin_job(job_id, job_description, cv_text, user_id, language, cache_key, cv_upload, timings,
+                            (cv_template, cl_template), bypass_cache, credit_reserved_at, batch_id)
+        if started is None:
+            return
+        cv_text, cache_key = started
+        prompts = PromptBuilder(job_description, cv_text,
+                                cv_token_budget=app.config['CV_TOKEN_BUDGET'],
+                                digest_templates=app.config['PROMPT_TEMPLATE_DIGEST'])
+        prompt_tokens = {}
+
+        def generate_for(stage):
+            # Same call for every stage, on the stage's model
+            def generate(prompt, fresh=False, generation_config=None, **kwargs):
+                model, config = route_stage(stage, prompt, generation_config, prompt_tokens)
+                with span(STAGE_SECONDS, stage, timings):
+                    return llm.generate(prompt, model=model, generation_config=config,
+                                        bypass_cache=bypass_cache or fresh,
+                                        deadline=app.config['LLM_STAGE_DEADLINES'].get(stage), **kwargs)
+            return generate
 
-        JOBS[job_id]['current_step'] = 4
-        JOBS[job_id]['status'] = 'completed'
-        JOBS[job_id]['result'] = {
-            'cv_pdf': cv_pdf,
-            'cl_pdf': cl_pdf,
-            'analysis': analysis_data
-        }
-        JOBS[job_id]['message_text'] = msg_content # Keys match frontend
-        JOBS[job_id]['logs'].append("Done!")
+        def run_stage(name):
+            prompt, parse, streamed = stage_call(name, prompts, cv_template, cl_template, language)
+            return parse(generate_for(name)(prompt, on_chunk=stream_to(job_id, name) if streamed else None))
+
+        # 1. ANALYZE & SCORE (JSON Output)
+        ats_mode = job_ats_mode()
+        errors = {}
+        if ats_mode == 'llm':
+            results, errors = run_stages(job_id, {'analysis': lambda: run_stage('analysis')})
+            analysis_data = results.get('analysis')
+        else:
+            analysis_data = ats_scorer.score(cv_text, job_description)
+        analysis_data = show_ats_score(job_id, analysis_data, ats_mode)
+
+        # 2-4. GENERATE CV, COVER LETTER & OUTREACH MESSAGE (independent, run in parallel)
+        # Each document goes to the compile pool as soon as its body is ready,
+        # while the other generations are still running.
+        compiles = {}
+
+        def submit_compile(prefix, latex):
+            compiles[prefix] = compile_pool.submit(job_id, prefix, latex)
+
+        def on_stage_done(name, body):
+            stage_generated(job_id, name, body, cv_template, cl_template, submit_compile)
+
+        stages = generation_stages(ats_mode)
+        if app.config['GENERATION_MODE'] == 'single':
+            requests = artifact_requests(job_id, prompts, cv_template, cl_template, language,
+                                         [ARTIFACT_FIELDS[stage] for stage in stages], on_done=on_stage_done)
+            generated, gen_errors = generate_artifacts(generate_for('artifacts'), requests)
+        else:
+            generated, gen_errors = run_stages(job_id, {name: functools.partial(run_stage, name) for name in stages},
+                                               on_done=on_stage_done)
+        errors.update(gen_errors)
+        analysis_data, msg_content = merge_generated(job_id, analysis_data, generated, errors, prompt_tokens)
+
+        compiled = {prefix: future.result() for prefix, future in compiles.items()}
+        finish_job(job_id, user_id, compiled, analysis_data, msg_content, errors, cache_key, timings, start,
+                   batch_id)
 
     except Exception as e:
-        JOBS[job_id]['status'] = 'failed'
-        JOBS[job_id]['logs'].append(f"Error: {str(e)}")
-        print(f"Job failed: {e}")
+        fail_job(job_id, e, user_id, credit_reserved_at, timings, start, batch_id)
 
-@app.route('/start_job', methods=['POST'])
-def start_job():
-    # Guest Limit Check
-    if not current_user.is_authenticated:
-        if session.get('guest_usage', 0) >= 1:
-            return jsonify({'error': 'Guest verification limit reached. Please register for free.'}), 403
-        session['guest_usage'] = session.get('guest_usage', 0) + 1
+async def process_job_async(job_id, job_description, cv_text, user_id=None, language='en', cache_key=None,
+                            bypass_cache=False, cv_upload=None, credit_reserved_at=None, timings=None,
+                            queue_wait=None, batch_id=None):
+    """process_job() as a coroutine, for EXECUTION_ENGINE=async.
+
+    Gemini calls and pdflatex runs are awaited on the event loop. Progress
+    goes to the job store through job_writer, so no write waits on its lock
+    on the loop; CV extraction, the database save and the result cache run
+    in the loop's blocking pool once those writes are made, as do the
+    response cache lookups and the LaTeX files of each compile.
+    """
+    timings = job_timings(timings, queue_wait)
+    start = time.perf_counter()
+    jobs = job_writer
+    try:
+        cv_template, cl_template = await asyncio.to_thread(job_templates, job_id)
+        started = await asyncio.to_thread(begin_job, job_id, job_description, cv_text, user_id, language, cache_key,
+                                          cv_upload, timings, (cv_template, cl_template), bypass_cache,
+                                          credit_reserved_at, batch_id)
+        if started is None:
+            return
+        cv_text, cache_key = started
+        prompts = PromptBuilder(job_description, cv_text,
+                                cv_token_budget=app.config['CV_TOKEN_BUDGET'],
+                                digest_templates=app.config['PROMPT_TEMPLATE_DIGEST'])
+        prompt_tokens = {}
+
+        def agenerate_for(stage):
+            async def agenerate(prompt, fresh=False, generation_config=None, **kwargs):
+                model, config = route_stage(stage, prompt, generation_config, prompt_tokens)
+                with span(STAGE_SECONDS, stage, timings):
+                    return await llm.agenerate(prompt, model=model, generation_config=config,
+                                               bypass_cache=bypass_cache or fresh,
+                                               deadline=app.config['LLM_STAGE_DEADLINES'].get(stage), **kwargs)
+            return agenerate
+
+        async def run_stage(name):
+            prompt, parse, streamed = stage_call(name, prompts, cv_template, cl_template, language)
+            on_chunk = stream_to(job_id, name, jobs) if streamed else None
+            return parse(await agenerate_for(name)(prompt, on_chunk=on_chunk))
+
+        ats_mode = job_ats_mode()
+        errors = {}
+        if ats_mode == 'llm':
+            results, errors = await run_stages_async(job_id, {'analysis': run_stage('analysis')}, jobs=jobs)
+            analysis_data = results.get('analysis')
+        else:
+            analysis_data = ats_scorer.score(cv_text, job_description)
+        analysis_data = show_ats_score(job_id, analysis_data, ats_mode, jobs)
+
+        compiles = {}
+
+        def submit_compile(prefix, latex):
+            compiles[prefix] = asyncio.create_task(compile_pool.compile_async(job_id, prefix, latex))
+
+        def on_stage_done(name, body):
+            stage_generated(job_id, name, body, cv_template, cl_template, submit_compile, jobs)
+
+        stages = generation_stages(ats_mode)
+        if app.config['GENERATION_MODE'] == 'single':
+            requests = artifact_requests(job_id, prompts, cv_template, cl_template, language,
+                                         [ARTIFACT_FIELDS[stage] for stage in stages], on_done=on_stage_done, jobs=jobs)
+            generated, gen_errors = await generate_artifacts_async(agenerate_for('artifacts'), requests)
+        else:
+            generated, gen_errors = await run_stages_async(job_id, {name: run_stage(name) for name in stages},
+                                                           on_done=on_stage_done, jobs=jobs)
+        errors.update(gen_errors)
+        analysis_data, msg_content = merge_generated(job_id, analysis_data, generated, errors, prompt_tokens, jobs)
+
+        compiled = {prefix: await task for prefix, task in compiles.items()}
+        await asyncio.wrap_future(jobs.flush())
+        await asyncio.to_thread(finish_job, job_id, user_id, compiled, analysis_data, msg_content, errors,
+                                cache_key, timings, start, batch_id)
+
+    except Exception as e:
+        await asyncio.wrap_future(jobs.flush())
+        await asyncio.to_thread(fail_job, job_id, e, user_id, credit_reserved_at, timings, start, batch_id)
+
+def run_task(task):
+    """Queue handler: runs one job from its enqueued arguments."""
+    if task.attempts > 1:
+        JOBS.append_log(task.job_id, f"Restarting after a worker failure (attempt {task.attempts})...")
+    queue_wait = time.time() - task.created_at if task.created_at and task.attempts == 1 else None
+    process_job(task.job_id, queue_wait=queue_wait, **task.payload)
+
+async def run_task_async(task):
+    """run_task() for the async engine."""
+    if task.attempts > 1:
+        await asyncio.to_thread(JOBS.append_log, task.job_id,
+                                f"Restarting after a worker failure (attempt {task.attempts})...")
+    queue_wait = time.time() - task.created_at if task.created_at and task.attempts == 1 else None
+    await process_job_async(task.job_id, queue_wait=queue_wait, **task.payload)
+
+def bury_task(task):
+    JOBS.append_log(task.job_id, f"Error: the job was abandoned after {task.attempts} attempts.")
+    JOBS.update(task.job_id, status='failed')
+    refund_credit(task.payload.get('user_id'), task.payload.get('credit_reserved_at'))
+    JOBS_TOTAL.inc(outcome='abandoned')
+    settle_batch(task.payload.get('batch_id'))
+
+# Consumers started in this process (embedded, or those of worker.py)
+queue_workers = []
+
+def start_queue_worker(concurrency):
+    if app.config['EXECUTION_ENGINE'] == 'async':
+        worker = AsyncQueueWorker(work_queue, run_task_async, concurrency=app.config['ASYNC_MAX_JOBS'],
+                                  on_dead=bury_task)
     else:
-        # User Limit Check
-        if current_user.plan_type == 'free' and current_user.credits_used >= 99:
-             return jsonify({'error': 'Daily limit reached (99/99). Upgrade to Pro for unlimited.'}), 403
+        if concurrency > app.config['JOB_THREADS']:
+            print(f"Warning: {concurrency} job threads share a stage pool sized for JOB_THREADS="
+                  f"{app.config['JOB_THREADS']}; their stages will queue.")
+        worker = QueueWorker(work_queue, run_task, concurrency=concurrency, on_dead=bury_task)
+    worker.start()
+    queue_workers.append(worker)
+    return worker
 
-    job_description = request.form.get('job_description')
+# Lower runs first: paying users are served ahead of free and guest jobs
+PLAN_PRIORITY = {'pro': 0, 'free': 1}
+GUEST_PRIORITY = 2
+
+queue_worker = (start_queue_worker(app.config['EMBEDDED_WORKERS'])
+                if app.config['EMBEDDED_WORKERS'] > 0 and BACKGROUND else None)
+
+def read_cv_input(timings=None):
+    """Returns (cv_text, cv_upload) for a submission: the CV text from pasted
+    text, the saved profile or an already extracted upload, or else the hash
+    of an uploaded PDF whose text the worker has yet to extract. (None, None)
+    when no CV was provided. Storing an upload is timed into `timings`.
+    """
     cv_text = ""
     
     # Handle CV Input (File or Database or Text)
     if 'cv_file' in request.files:
         file = request.files['cv_file']
         if file.filename != '':
-            filename = secure_filename(file.filename)
-            path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(path)
-            reader = PdfReader(path)
-            for page in reader.pages:
-                cv_text += page.extract_text()
+            with span(STAGE_SECONDS, 'upload', timings):
+                digest, _ = store_upload(file.stream, app.config['UPLOAD_FOLDER'])
+                cv_text = cv_extractor.cached(digest)
+            if cv_text is None:
+                return None, digest
             
             # Save to profile if logged in
             if current_user.is_authenticated:
@@ -467,33 +1126,428 @@ def start_job():
         cv_text = current_user.cv_text
     
     else:
+        return None, None
+    return cv_text, None
+
+def result_cache_key(cv_text, job_description, language, templates=None):
+    if not app.config['RESULT_CACHE']:
+        return None
+    try:
+        return ResultCache.make_key(cv_text, job_description, language, *(templates or load_templates()),
+                                    f"{model_registry.signature()}/ats-{app.config['ATS_MODE']}"
+                                    f"/prompts-{PROMPT_VERSION}"
+                                    f"-{app.config['CV_TOKEN_BUDGET']}-{int(app.config['PROMPT_TEMPLATE_DIGEST'])}"
+                                    f"/{app.config['GENERATION_MODE']}")
+    except FileNotFoundError:
+        return None
+
+def cached_job(cached):
+    """Fields of a job completed from a result cache entry."""
+    return {
+        'status': 'completed',
+        'current_step': 4,
+        'errors': {},
+        'result': {'cv_pdf': cached['cv_pdf'], 'cl_pdf': cached['cl_pdf'], 'analysis': cached['analysis']},
+        'message_text': cached['message'],
+        'cached': True,
+    }
+
+def replayed(cached, user_id, credit_reserved_at):
+    """Books a run answered from the result cache: saved like a fresh one, without using a credit."""
+    JOBS_TOTAL.inc(outcome='cached')
+    if user_id:
+        save_application(user_id, cached['analysis'], cached['cv_pdf'], cached['cl_pdf'], cached['message'])
+        refund_credit(user_id, credit_reserved_at)
+
+def prepare_job(job_id, job_description, cv_text, user_id, language, bypass_cache, templates=None,
+                cv_upload=None, credit_reserved_at=None, timings=None, **fields):
+    """Creates the job record and returns the payload to enqueue, or None when
+    the run was answered from the result cache and the job is already completed
+    (a replayed run does not use a credit: the one reserved is given back).
+
+    With cv_upload (and no cv_text yet) the result cache is consulted by
+    begin_job() once the worker has extracted the text.
+    """
+    cache_key = result_cache_key(cv_text, job_description, language, templates) if cv_text is not None else None
+    cached = result_cache.get(cache_key) if cache_key and not bypass_cache else None
+    if cached:
+        # Same inputs as an earlier run: hand back a completed job without calling Gemini or pdflatex
+        JOBS.create(job_id, logs=["Loaded from cache.", "Done!"], timings=timings or {}, **cached_job(cached),
+                    **fields)
+        replayed(cached, user_id, credit_reserved_at)
+        return None
+
+    JOBS.create(job_id, **fields)
+    return {
+        'job_description': job_description,
+        'cv_text': cv_text,
+        'user_id': user_id,
+        'language': language,
+        'cache_key': cache_key,
+        'bypass_cache': bypass_cache,
+        'cv_upload': cv_upload,
+        'credit_reserved_at': credit_reserved_at,
+        'timings': timings,
+        'batch_id': fields.get('batch_id'),
+    }
+
+def queue_identity():
+    """(owner, priority) of the current submitter for the work queue."""
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}", PLAN_PRIORITY.get(current_user.plan_type, PLAN_PRIORITY['free'])
+    # Keyed on the session, like the guest usage limit: behind a proxy every guest has the proxy's address
+    if 'guest_id' not in session:
+        session['guest_id'] = uuid.uuid4().hex
+    return f"guest:{session['guest_id']}", GUEST_PRIORITY
+
+@app.route('/start_job', methods=['POST'])
+def start_job():
+    # Guest Limit Check
+    if not current_user.is_authenticated:
+        if session.get('guest_usage', 0) >= 1:
+            return jsonify({'error': 'Guest verification limit reached. Please register for free.'}), 403
+        session['guest_usage'] = session.get('guest_usage', 0) + 1
+
+    job_description = request.form.get('job_description')
+    timings = {}
+    cv_text, cv_upload = read_cv_input(timings)
+    if cv_text is None and cv_upload is None:
         return jsonify({'error': 'No CV provided'}), 400
 
     job_id = str(uuid.uuid4())
-    JOBS[job_id] = {'status': 'queued', 'logs': [], 'result': None, 'current_step': 0}
-    
     user_id = current_user.id if current_user.is_authenticated else None
+    credit_reserved_at = None
+    if user_id:
+        # User Limit Check: the credit is taken now and given back if the job fails
+        reserved = credit_ledger.reserve(current_user)
+        if reserved is None:
+            limit = credit_ledger.daily_credits
+            return jsonify({'error': f'Daily limit reached ({limit}/{limit}). Upgrade to Pro for unlimited.'}), 403
+        if isinstance(reserved, datetime):
+            credit_reserved_at = reserved.isoformat()
     
     language = request.form.get('language', 'en')
-    
-    executor.submit(process_job, job_id, job_description, cv_text, user_id, language)
+    # no_cache=1 asks for a fresh generation instead of a replayed one
+    bypass_cache = request.form.get('no_cache') == '1'
+
+    payload = prepare_job(job_id, job_description, cv_text, user_id, language, bypass_cache, cv_upload=cv_upload,
+                          credit_reserved_at=credit_reserved_at, timings=timings)
+    if payload is None:
+        return jsonify({'job_id': job_id})
+
+    owner, priority = queue_identity()
+    try:
+        work_queue.enqueue(job_id, payload, priority=priority, owner=owner,
+                           max_depth=app.config['MAX_QUEUE_DEPTH'],
+                           max_per_owner=app.config['MAX_JOBS_PER_USER'],
+                           retry_after=app.config['QUEUE_RETRY_AFTER'])
+    except QueueFull as e:
+        JOBS.update(job_id, status='failed')
+        refund_credit(user_id, credit_reserved_at)
+        JOBS_TOTAL.inc(outcome='rejected')
+        if not current_user.is_authenticated:
+            # The refused attempt does not count against the guest's free run
+            session['guest_usage'] = max(session.get('guest_usage', 1) - 1, 0)
+        return jsonify({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
     
     return jsonify({'job_id': job_id})
 
+def create_batch(cv_text, job_descriptions, user_id=None, language='en', bypass_cache=False, cv_upload=None,
+                 credit_reserved_at=None):
+    """Creates a batch record with one job per job description.
+
+    The CV is read and the templates loaded once for the whole batch. Returns
+    (batch_id, pending) where pending lists the (job_id, payload) items still
+    to be run; items found in the result cache are already completed.
+    """
+    batch_id = str(uuid.uuid4())
+    try:
+        templates = load_templates()
+    except FileNotFoundError:
+        templates = None
+    job_ids = [str(uuid.uuid4()) for _ in job_descriptions]
+    JOBS.create(batch_id, kind='batch', status='processing', items=job_ids, language=language)
+    pending = []
+    for job_id, job_description in zip(job_ids, job_descriptions):
+        payload = prepare_job(job_id, job_description, cv_text, user_id, language, bypass_cache,
+                              templates=templates, cv_upload=cv_upload, credit_reserved_at=credit_reserved_at,
+                              batch_id=batch_id)
+        if payload is not None:
+            pending.append((job_id, payload))
+    if not pending:
+        # Every item was replayed from the cache
+        settle_batch(batch_id)
+    return batch_id, pending
+
+def settle_batch(batch_id):
+    """Marks a batch completed once none of its items is queued or running.
+
+    Called as each item finishes, after its own status is written, so the
+    last item to finish always sees the others done and status reads of a
+    batch never write.
+    """
+    if not batch_id:
+        return
+    batch = JOBS.get(batch_id)
+    if not batch or batch['status'] != 'processing':
+        return
+    if all(JOBS.status(job_id) not in ('queued', 'processing') for job_id in batch['items']):
+        JOBS.update(batch_id, status='completed')
+
+def batch_item(index, job_id, job):
+    item = {'index': index, 'job_id': job_id, 'status': job['status'] if job else 'unknown'}
+    if job and job.get('result'):
+        analysis = job['result'].get('analysis') or {}
+        item.update(job_title=analysis.get('job_title'), company=analysis.get('company'),
+                    ats_score=analysis.get('ats_score'),
+                    cv_pdf=job['result'].get('cv_pdf'), cl_pdf=job['result'].get('cl_pdf'),
+                    cached=job.get('cached', False))
+    return item
+
+def batch_report(batch_id):
+    """Aggregates a batch's items into one report, best ATS score first. None if unknown.
+    Only reads: the batch record is completed by settle_batch() as items finish."""
+    batch = JOBS.get(batch_id)
+    if not batch or batch.get('kind') != 'batch':
+        return None
+    items = [batch_item(index, job_id, JOBS.get(job_id)) for index, job_id in enumerate(batch['items'])]
+    finished = [item for item in items if item['status'] not in ('queued', 'processing')]
+    completed = [item for item in items if item['status'] == 'completed']
+    scores = [item['ats_score'] for item in completed if isinstance(item.get('ats_score'), (int, float))]
+    status = 'completed' if len(finished) == len(items) else 'processing'
+    return {
+        'batch_id': batch_id,
+        'status': status,
+        'total': len(items),
+        'completed': len(completed),
+        'failed': len(finished) - len(completed),
+        'average_ats_score': round(sum(scores) / len(scores), 1) if scores else None,
+        'items': sorted(items, key=lambda item: (item.get('ats_score') is None, -(item.get('ats_score') or 0))),
+    }
+
+@app.route('/start_batch', methods=['POST'])
+@login_required
+def start_batch():
+    """Adapts one CV to several postings: repeat the `job_descriptions` form field."""
+    job_descriptions = [jd for jd in request.form.getlist('job_descriptions') if jd.strip()]
+    if not job_descriptions:
+        return jsonify({'error': 'No job descriptions provided'}), 400
+    if len(job_descriptions) > app.config['MAX_BATCH_SIZE']:
+        return jsonify({'error': f"A batch holds at most {app.config['MAX_BATCH_SIZE']} job descriptions."}), 400
+
+    cv_text, cv_upload = read_cv_input()
+    if cv_text is None and cv_upload is None:
+        return jsonify({'error': 'No CV provided'}), 400
+
+    # One credit per posting, each given back if its job fails or is replayed from the cache
+    reserved = credit_ledger.reserve(current_user, len(job_descriptions))
+    if reserved is None:
+        return jsonify({'error': f'Not enough credits left today for {len(job_descriptions)} applications. '
+                                 'Upgrade to Pro for unlimited.'}), 403
+    credit_reserved_at = reserved.isoformat() if isinstance(reserved, datetime) else None
+
+    batch_id, pending = create_batch(cv_text, job_descriptions, current_user.id,
+                                     request.form.get('language', 'en'), request.form.get('no_cache') == '1',
+                                     cv_upload=cv_upload, credit_reserved_at=credit_reserved_at)
+    owner, priority = queue_identity()
+    try:
+        work_queue.enqueue_many(pending, priority=priority, owner=owner,
+                                batch_id=batch_id, batch_limit=app.config['BATCH_CONCURRENCY'],
+                                max_depth=app.config['MAX_QUEUE_DEPTH'],
+                                max_per_owner=app.config['MAX_JOBS_PER_USER'],
+                                retry_after=app.config['QUEUE_RETRY_AFTER'])
+    except QueueFull as e:
+        for job_id, _ in pending:
+            JOBS.update(job_id, status='failed')
+        JOBS.update(batch_id, status='failed')
+        refund_credit(current_user.id, credit_reserved_at, len(pending))
+        JOBS_TOTAL.inc(len(pending), outcome='rejected')
+        return jsonify({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+
+    return jsonify({'batch_id': batch_id, 'job_ids': JOBS.get(batch_id)['items']})
+
+@app.route('/batch_status/<batch_id>')
+def batch_status(batch_id):
+    report = batch_report(batch_id)
+    if report is None:
+        return jsonify({'status': 'unknown'}), 404
+    return jsonify(report)
+
+@app.route('/batch_events/<batch_id>')
+def batch_events(batch_id):
+    """Server-Sent Events stream of a batch: an 'item' event as each job finishes,
+    then one 'report' event with the aggregated report.
+
+    Events carry no IDs: a reconnecting client receives the finished items
+    again and should key them on job_id.
+    """
+    if batch_report(batch_id) is None:
+        return jsonify({'status': 'unknown'}), 404
+
+    def stream():
+        yield "retry: 2000\n\n"
+        sent = set()
+        deadline = time.monotonic() + app.config['SSE_MAX_SECONDS']
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            report = batch_report(batch_id)
+            for item in report['items']:
+                if item['status'] not in ('queued', 'processing') and item['job_id'] not in sent:
+                    sent.add(item['job_id'])
+                    last_sent = time.monotonic()
+                    yield f"event: item\ndata: {json.dumps(item)}\n\n"
+            if report['status'] == 'completed':
+                yield f"event: report\ndata: {json.dumps(report)}\n\n"
+                return
+            if time.monotonic() - last_sent > 15:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(0.5)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/job_status/<job_id>')
 def job_status(job_id):
+    """A job's record; ?timings=1 adds its seconds per stage."""
     job = JOBS.get(job_id)
     if not job:
         return jsonify({'status': 'unknown'}), 404
+    if job['status'] == 'queued':
+        job['queue_position'] = work_queue.position(job_id)
+    if request.args.get('timings') != '1':
+        job.pop('timings', None)
     return jsonify(job)
 
+@app.route('/job_events/<job_id>')
+def job_events(job_id):
+    """Server-Sent Events stream of a job's deltas: 'log' lines and 'update' field changes.
+
+    While the job waits in the queue, unnumbered 'queue' events report its queue_position.
+
+    Resumes after the Last-Event-ID header (or ?last_event_id=) and ends once
+    the job has reached a final status and every event has been sent. While
+    nothing happens the stream checks the job less and less often, down to
+    every SSE_IDLE_POLL seconds.
+    """
+    if JOBS.status(job_id) is None:
+        return jsonify({'status': 'unknown'}), 404
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = 0
+
+    def stream(last_event_id):
+        yield "retry: 2000\n\n"
+        deadline = time.monotonic() + app.config['SSE_MAX_SECONDS']
+        last_sent = time.monotonic()
+        last_position = None
+        pause = 0.25
+        while time.monotonic() < deadline:
+            events = JOBS.events_since(job_id, last_event_id)
+            for event_id, kind, payload in events:
+                last_event_id = event_id
+                yield f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(payload)}\n\n"
+            if events:
+                last_sent = time.monotonic()
+                pause = 0.25
+            else:
+                status = JOBS.status(job_id)
+                if status == 'queued':
+                    position = work_queue.position(job_id)
+                    if position != last_position:
+                        last_position = position
+                        yield f"event: queue\ndata: {json.dumps({'queue_position': position})}\n\n"
+                        last_sent = time.monotonic()
+                if status is None or status in TERMINAL_STATUSES:
+                    # Flush anything written between the two reads before closing
+                    for event_id, kind, payload in JOBS.events_since(job_id, last_event_id):
+                        yield f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(payload)}\n\n"
+                    return
+                if time.monotonic() - last_sent > 15:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    last_sent = time.monotonic()
+                pause = min(pause * 2, app.config['SSE_IDLE_POLL'])
+            time.sleep(pause)
+
+    return Response(stream(last_event_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/admin/model_routes', methods=['GET', 'PUT', 'DELETE'])
+def model_routes():
+    """Model routing per stage. PUT a JSON object of routes to override LLM_STAGE_MODELS, DELETE to go back to it."""
+    if not app.config['ADMIN_TOKEN'] or request.headers.get('Authorization') != f"Bearer {app.config['ADMIN_TOKEN']}":
+        abort(403)
+    if request.method != 'GET':
+        try:
+            model_registry.set_overrides(request.get_json(silent=True) or {} if request.method == 'PUT' else {})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'default_model': model_registry.default_model,
+        'routes': model_registry.effective(),
+        'overrides': model_registry.overrides,
+        'catalog': sorted(model_registry.catalog) if model_registry.catalog is not None else None,
+    })
+
+@app.route('/metrics')
+def metrics():
+    if app.config['METRICS_TOKEN'] and request.headers.get('Authorization') != f"Bearer {app.config['METRICS_TOKEN']}":
+        abort(401)
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/cache_stats')
+def cache_stats():
+    return jsonify({'results': result_cache.stats(), 'llm': llm.stats(), 'janitor': janitor.last_sweep})
+
+# A content-addressed PDF never changes under its name
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+LEGACY_PDF_MAX_AGE = 3600
+
+def send_pdf(filename, as_attachment):
+    """Serves a stored PDF with caching headers.
+
+    Store names are the SHA-256 of the content: the digest is a strong ETag,
+    If-None-Match is answered with 304 before touching the disk, and the
+    response is cacheable forever. send_file handles Range requests, unless
+    the transfer is handed to the proxy (PDF_SENDFILE), which then does.
+    """
+    digest = filename[:-4] if DIGEST_NAME_RE.match(filename) else None
+    if digest and request.if_none_match.contains(digest):
+        response = Response(status=304)
+        response.set_etag(digest)
+    else:
+        path = pdf_store.path(filename)
+        if not os.path.isfile(path):
+            abort(404)
+        if app.config['PDF_SENDFILE'] == 'x-accel-redirect':
+            response = Response(mimetype='application/pdf')
+            response.headers['X-Accel-Redirect'] = app.config['PDF_ACCEL_PREFIX'] + \
+                os.path.relpath(path, app.config['OUTPUT_FOLDER']).replace(os.sep, '/')
+            response.headers['Content-Disposition'] = f"{'attachment' if as_attachment else 'inline'}; filename={filename}"
+            if digest:
+                response.set_etag(digest)
+        else:
+            response = send_file(path, mimetype='application/pdf', as_attachment=as_attachment,
+                                 etag=digest or True, conditional=True)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    if digest:
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = LEGACY_PDF_MAX_AGE
+    return response
+
 @app.route('/view/<filename>')
 def view_file(filename):
-    return send_file(os.path.join(app.config['OUTPUT_FOLDER'], filename), as_attachment=False)
+    return send_pdf(filename, as_attachment=False)
 
 @app.route('/download/<filename>')
 def download_file(filename):
-    return send_file(os.path.join(app.config['OUTPUT_FOLDER'], filename), as_attachment=True)
+    return send_pdf(filename, as_attachment=True)
 
 if __name__ == '__main__':
     app.run(debug=True)
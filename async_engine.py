@@ -0,0 +1,135 @@
+import asyncio
+import concurrent.futures
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+
+class EventLoopThread:
+    """An asyncio event loop running in a daemon thread.
+
+    submit() hands it a coroutine from any other thread (a Flask route, a
+    queue worker) and returns a concurrent.futures.Future. Blocking calls
+    made with run_in_executor(None, ...) or asyncio.to_thread() use a pool
+    of `blocking_threads`.
+    """
+
+    def __init__(self, name='event-loop', blocking_threads=32):
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+            max_workers=blocking_threads, thread_name_prefix=f"{name}-blocking"))
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, coro, timeout=None):
+        """Runs a coroutine on the loop and waits for its result."""
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+class AsyncQueueWorker:
+    """Consumes a work queue with coroutines on one event loop.
+
+    Same contract as work_queue.QueueWorker, but handler(task) is a coroutine
+    function and up to `concurrency` tasks run at once on the loop of
+    `loop_thread` instead of one thread each: a job waiting on Gemini or
+    pdflatex only holds its own state. Queue operations, which may wait on
+    the SQLite lock, run in the loop's blocking pool.
+    """
+
+    def __init__(self, queue, handler, concurrency=200, poll_interval=0.5, on_dead=None, loop_thread=None):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.on_dead = on_dead
+        self.loop_thread = loop_thread or EventLoopThread('queue-loop')
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._stopping = None
+        self._done = None
+
+    def start(self):
+        self._done = self.loop_thread.submit(self._consume())
+        return self
+
+    def stop(self, wait=True):
+        """Stops claiming tasks; with `wait`, returns once the running ones are finished."""
+        if self._stopping is not None:
+            self.loop_thread.loop.call_soon_threadsafe(self._stopping.set)
+        if wait and self._done is not None:
+            self._done.result()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        slots = asyncio.Semaphore(self.concurrency)
+        running = set()
+        maintenance = asyncio.create_task(self._maintain())
+        while not self._stopping.is_set():
+            await slots.acquire()
+            try:
+                task = await loop.run_in_executor(None, self.queue.claim, self.worker_id)
+            except sqlite3.Error as e:
+                print(f"Queue claim failed: {e}")
+                task = None
+            if task is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            running_task = asyncio.create_task(self._run(task, slots))
+            running.add(running_task)
+            running_task.add_done_callback(running.discard)
+        if running:
+            await asyncio.wait(running)
+        maintenance.cancel()
+
+    async def _run(self, task, slots):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._in_flight.add(task.id)
+        try:
+            await self.handler(task)
+            await loop.run_in_executor(None, self.queue.complete, task.id, self.worker_id)
+        except Exception as e:
+            print(f"Task {task.id} (job {task.job_id}) failed: {e}")
+            try:
+                await loop.run_in_executor(None, self.queue.fail, task.id, self.worker_id, e)
+            except Exception as fail_error:
+                # No longer heartbeated, the task is handed out again once its claim expires
+                print(f"Could not record the failure of task {task.id}: {fail_error}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(task.id)
+            slots.release()
+
+    async def _maintain(self):
+        interval = max(self.queue.visibility_timeout / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                with self._lock:
+                    task_ids = list(self._in_flight)
+                await asyncio.to_thread(self.queue.heartbeat, task_ids, self.worker_id)
+                for task in await asyncio.to_thread(self.queue.reap_dead):
+                    if self.on_dead:
+                        await asyncio.to_thread(self.on_dead, task)
+            except Exception as e:
+                print(f"Queue maintenance failed: {e}")
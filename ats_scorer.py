@@ -0,0 +1,271 @@
+import re
+import itertools
+from collections import Counter
+import numpy as np
+
+# Canonical skill -> other spellings found in postings and CVs (English and French)
+SKILL_SYNONYMS = {
+    'python': [],
+    'javascript': ['js', 'ecmascript'],
+    'typescript': [],
+    'java': [],
+    'c++': ['cpp'],
+    'c#': ['csharp', 'c sharp'],
+    'golang': [],
+    'rust': [],
+    'sql': [],
+    'postgresql': ['postgres', 'psql'],
+    'mysql': [],
+    'mongodb': ['mongo'],
+    'redis': [],
+    'react': ['reactjs', 'react.js'],
+    'angular': ['angularjs'],
+    'vue': ['vuejs', 'vue.js'],
+    'node.js': ['node', 'nodejs'],
+    'django': [],
+    'flask': [],
+    'fastapi': [],
+    'spring': ['spring boot', 'springboot'],
+    'docker': ['containers', 'conteneurs', 'containerization'],
+    'kubernetes': ['k8s'],
+    'terraform': [],
+    'ansible': [],
+    'aws': ['amazon web services'],
+    'azure': ['microsoft azure'],
+    'gcp': ['google cloud', 'google cloud platform'],
+    'cloud computing': ['cloud'],
+    'ci/cd': ['cicd', 'ci-cd', 'continuous integration', 'intégration continue', 'continuous delivery'],
+    'jenkins': [],
+    'gitlab ci': ['gitlab-ci'],
+    'github actions': [],
+    'git': ['github', 'gitlab'],
+    'linux': ['unix'],
+    'devops': [],
+    'finops': [],
+    'green it': ['numérique responsable', 'sustainable it'],
+    'prometheus': [],
+    'grafana': [],
+    'monitoring': ['observability', 'observabilité', 'supervision'],
+    'machine learning': ['ml', 'apprentissage automatique'],
+    'deep learning': ['dl', 'apprentissage profond'],
+    'nlp': ['natural language processing', 'traitement du langage naturel'],
+    'llm': ['large language models', 'llms'],
+    'data analysis': ['data analytics', 'analyse de données', 'analyse des données'],
+    'data engineering': ['data pipelines', 'etl'],
+    'pandas': [],
+    'numpy': [],
+    'scikit-learn': ['sklearn', 'scikit learn'],
+    'pytorch': ['torch'],
+    'tensorflow': ['tf', 'keras'],
+    'spark': ['pyspark', 'apache spark'],
+    'jupyter': ['jupyter notebook'],
+    'power bi': ['powerbi'],
+    'tableau': [],
+    'excel': [],
+    'dashboard': ['dashboards', 'tableau de bord', 'tableaux de bord'],
+    'rest api': ['restful', 'api rest', 'rest apis'],
+    'graphql': [],
+    'microservices': ['micro-services', 'microservice'],
+    'agile': ['scrum', 'kanban', 'méthodes agiles'],
+    'unit testing': ['tests unitaires', 'pytest', 'junit', 'tdd'],
+    'security': ['sécurité', 'cybersecurity', 'cybersécurité'],
+    'project management': ['gestion de projet'],
+    'communication': [],
+    'leadership': [],
+    'english': ['anglais'],
+    'french': ['français'],
+}
+
+STOPWORDS = set("""
+a about above after all also an and any are as at be been being both but by can could did do does doing
+for from had has have having he her here his how i if in into is it its just may me more most must my no
+nor not of on once only or other our out over own same she should so some such than that the their them
+then there these they this those through to too under until up very was we were what when where which
+while who whom why will with within would you your years year experience experiences work working team
+strong good excellent knowledge skills skill ability including etc role job position candidate ideal
+looking join us new well based using use plus need needs required requirement requirements
+responsibilities apply offer offers
+
+au aux avec ce ces cet cette dans de des du elle en et être eux il ils je la le les leur leurs lui ma mais
+me même mes moi mon ne nos notre nous on ou où par pas pour qu que qui sa se ses son sur ta te tes toi ton
+tu un une vos votre vous afin ainsi car chez comme dont est été sont sera ont avoir fait faire plus très
+tout tous toute toutes vos votre notamment selon entre sans sous vers depuis travers poste mission
+missions profil équipe connaissances compétences expérience stage vous êtes
+""".split())
+
+DIGITS_RE = re.compile(r"[\d.,/-]+")
+TOKEN_RE = re.compile(r"[a-zà-ÿ0-9][\w+#./-]*[\w+#]|[a-z0-9]", re.IGNORECASE)
+# A text as alternating words and separators; a skill spelling starts and ends on word boundaries
+WORD_SPLIT_RE = re.compile(r"([^\w+#]+)")
+
+SKILL_BY_SPELLING = {spelling: canonical for canonical, variants in SKILL_SYNONYMS.items()
+                     for spelling in [canonical] + variants}
+# Words of the longest spelling; first words of all spellings, and of those made of several
+SKILL_MAX_WORDS = max(len(WORD_SPLIT_RE.split(spelling)) // 2 + 1 for spelling in SKILL_BY_SPELLING)
+SKILL_START_WORDS = {WORD_SPLIT_RE.split(spelling)[0] for spelling in SKILL_BY_SPELLING}
+SKILL_FIRST_WORDS = {WORD_SPLIT_RE.split(spelling)[0] for spelling in SKILL_BY_SPELLING
+                     if WORD_SPLIT_RE.search(spelling)}
+SKILLS = list(SKILL_SYNONYMS)
+SKILL_INDEX = {skill: i for i, skill in enumerate(SKILLS)}
+# Canonical tokens standing for a skill in the n-grams
+SKILL_TOKENS = {skill.replace(' ', '_') for skill in SKILLS}
+
+def find_skills(text):
+    """Returns (skills found, text with each skill spelling replaced by its
+    canonical token), the longest spelling winning where several start."""
+    pieces = WORD_SPLIT_RE.split(text.lower())
+    # Words are the even pieces; only those that can start a spelling are looked at
+    starts = [i for i in range(0, len(pieces), 2) if pieces[i] in SKILL_START_WORDS]
+    skills = []
+    out = []
+    done = 0
+    for i in starts:
+        if i < done:
+            continue
+        longest = SKILL_MAX_WORDS if pieces[i] in SKILL_FIRST_WORDS else 1
+        for words in range(min(longest, (len(pieces) - i + 1) // 2), 0, -1):
+            end = i + 2 * words - 1
+            canonical = SKILL_BY_SPELLING.get(''.join(pieces[i:end]))
+            if canonical:
+                skills.append(canonical)
+                out.append(''.join(pieces[done:i]))
+                out.append(' ' + canonical.replace(' ', '_') + ' ')
+                done = end
+                break
+    out.append(''.join(pieces[done:]))
+    return skills, ''.join(out)
+
+class Document:
+    """A text reduced to the features the scorer compares: canonical skills and n-gram counts."""
+
+    def __init__(self, text):
+        self.text = text or ''
+        skills, normalized = find_skills(self.text)
+        self.skills = set(skills)
+        # Tokens start with a letter or digit and end with a word character: only digits can make a number
+        tokens = [t for t in TOKEN_RE.findall(normalized)
+                  if len(t) > 1 and t not in STOPWORDS and not (t[0].isdigit() and DIGITS_RE.fullmatch(t))]
+        self.terms = Counter(tokens)
+        self.terms.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+
+    def skill_vector(self):
+        vector = np.zeros(len(SKILLS), dtype=np.float32)
+        vector[[SKILL_INDEX[s] for s in self.skills]] = 1.0
+        return vector
+
+def extract_title(job_description):
+    for line in (job_description or '').splitlines():
+        line = line.strip(' \t#*-:')
+        if line:
+            return line if len(line) <= 80 else "Job Application"
+    return "Job Application"
+
+COMPANY_RE = re.compile(r"^\s*(?:company|entreprise|société|employer|organisation|organization)\s*:\s*(.+)$",
+                        re.IGNORECASE | re.MULTILINE)
+COMPANY_AT_RE = re.compile(r"\b(?:at|chez|join)\s+([A-Z][\w&.-]*(?:[ -][A-Z][\w&.-]*){0,3})")
+
+def extract_company(job_description):
+    match = COMPANY_RE.search(job_description or '') or COMPANY_AT_RE.search(job_description or '')
+    return match.group(1).strip()[:80] if match else "Unknown"
+
+class ATSScorer:
+    """Scores a CV against job descriptions without an LLM.
+
+    The score blends the share of the posting's skills found in the CV
+    (synonyms folded onto one canonical name) with the TF-IDF cosine
+    similarity of their unigram and bigram counts. score_many() scores one
+    CV against many postings with NumPy, computing the CV side once.
+    """
+
+    SKILL_WEIGHT = 0.65
+    # Cosine similarities between a CV and a posting rarely exceed this; it maps to full marks
+    SIMILARITY_CEILING = 0.35
+
+    def __init__(self, max_missing=6):
+        self.max_missing = max_missing
+
+    def score(self, cv_text, job_description):
+        return self.score_many(cv_text, [job_description])[0]
+
+    def score_many(self, cv_text, job_descriptions):
+        """Returns one analysis dict per job description, shaped like the LLM analysis.
+
+        The batch is one sparse term matrix, as (row, term id, count) arrays
+        over a vocabulary shared with the CV, so weights, norms and the dot
+        products with the CV are each a single NumPy operation.
+        """
+        cv = cv_text if isinstance(cv_text, Document) else Document(cv_text)
+        jobs = [Document(jd) for jd in job_descriptions]
+        if not jobs:
+            return []
+
+        terms = list(dict.fromkeys(itertools.chain(cv.terms, *(doc.terms for doc in jobs))))
+        vocab = dict(zip(terms, range(len(terms))))
+        cols = np.fromiter(map(vocab.__getitem__, itertools.chain.from_iterable(doc.terms for doc in jobs)),
+                           dtype=np.int64)
+        counts = np.fromiter(itertools.chain.from_iterable(doc.terms.values() for doc in jobs), dtype=np.float64,
+                             count=len(cols))
+        rows = np.repeat(np.arange(len(jobs)), [len(doc.terms) for doc in jobs])
+        cv_cols = np.arange(len(cv.terms))
+        cv_counts = np.fromiter(cv.terms.values(), dtype=np.float64, count=len(cv.terms))
+
+        # IDF over the postings and the CV: the larger the batch, the better it separates boilerplate from distinctive terms
+        df = np.bincount(cols, minlength=len(vocab)) + np.bincount(cv_cols, minlength=len(vocab))
+        n_docs = len(jobs) + 1
+        idf = np.log((1 + n_docs) / (1 + df)) + 1
+        weights = (1 + np.log(counts)) * idf[cols]
+        cv_weights = np.zeros(len(vocab))
+        cv_weights[cv_cols] = (1 + np.log(cv_counts)) * idf[cv_cols]
+        cv_norm = float(np.linalg.norm(cv_weights)) or 1.0
+        job_norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(jobs)))
+        job_norms[job_norms == 0] = 1.0
+
+        similarity = np.bincount(rows, weights=weights * cv_weights[cols], minlength=len(jobs)) / (job_norms * cv_norm)
+        job_skills = np.zeros((len(jobs), len(SKILLS)), dtype=np.float32)
+        skill_rows = [row for row, doc in enumerate(jobs) for _ in doc.skills]
+        job_skills[skill_rows, [SKILL_INDEX[skill] for doc in jobs for skill in doc.skills]] = 1.0
+        required = job_skills.sum(axis=1)
+        matched = job_skills @ cv.skill_vector()
+        coverage = np.divide(matched, required, out=np.zeros_like(matched), where=required > 0)
+        text_score = np.minimum(similarity / self.SIMILARITY_CEILING, 1.0)
+        # Postings naming no known skill are judged on text similarity alone
+        blended = np.where(required > 0,
+                           self.SKILL_WEIGHT * coverage + (1 - self.SKILL_WEIGHT) * text_score,
+                           text_score)
+        scores = np.clip(np.rint(blended * 100), 0, 100).astype(int)
+
+        suggestions = self._suggestions(jobs, cv, terms, rows, cols, weights, cv_weights)
+        return [self._analysis(doc, cv, int(score), suggestion)
+                for doc, score, suggestion in zip(jobs, scores, suggestions)]
+
+    def _suggestions(self, jobs, cv, terms, rows, cols, weights, cv_weights):
+        """Per posting, its heaviest single-word terms that the CV never mentions
+        and that are not skills, heaviest first, at most max_missing."""
+        candidate = np.fromiter((' ' not in term and term not in SKILL_TOKENS for term in terms), dtype=bool,
+                                count=len(terms))
+        keep = candidate[cols] & (cv_weights[cols] == 0)
+        rows, cols, weights = rows[keep], cols[keep], weights[keep]
+        # Ties go to the term that sorts last, like heapq.nlargest on (weight, term)
+        term_rank = np.empty(len(terms), dtype=np.int64)
+        term_rank[np.argsort(np.array(terms, dtype=object))] = np.arange(len(terms))
+        order = np.lexsort((-term_rank[cols], -weights, rows))
+        rows, cols = rows[order], cols[order]
+        starts = np.searchsorted(rows, np.arange(len(jobs) + 1))
+        return [[terms[col] for col in cols[start:min(end, start + self.max_missing)]]
+                for start, end in zip(starts, starts[1:])]
+
+    def _analysis(self, job, cv, score, suggestions):
+        missing = sorted(job.skills - cv.skills)
+        # Filled up with the posting's heaviest terms the CV never mentions
+        missing = (missing + suggestions)[:self.max_missing]
+        if missing:
+            improvements = f"Highlight experience with {', '.join(missing[:3])} if you have it."
+        else:
+            improvements = "The CV already covers the main requirements of this posting."
+        return {
+            "job_title": extract_title(job.text),
+            "company": extract_company(job.text),
+            "ats_score": score,
+            "missing_keywords": missing,
+            "cv_improvements": improvements,
+        }
@@ -0,0 +1,73 @@
+"""Benchmark: local ATS scoring of one CV against a batch of postings.
+
+    python bench_ats.py --postings 2000 --words 100 --repeat 5
+
+Postings are generated from a fixed seed: about `--words` words each, a
+title and a company line, and a share of skill spellings (synonyms
+included). The CV is turned into a Document once, outside the timing, so
+the figures cover what ATSScorer.score_many() does per posting: feature
+extraction, the batch term matrix and the analysis dicts. Prints postings
+per second (best and median of the runs), or JSON with --json.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from ats_scorer import ATSScorer, Document, SKILL_BY_SPELLING
+
+FILLER = """design build maintain scalable services platform customers data product engineers analytics pipelines
+reliable deploy production systems ownership mentor collaborate stakeholders roadmap quality performance backend
+frontend infrastructure security the and with for our you will we are in of to""".split()
+
+CV = """Jane Doe - Software Engineer
+Python developer with Docker, Kubernetes, AWS and PostgreSQL experience.
+Built data pipelines and REST APIs with Flask and FastAPI; CI/CD with GitLab CI.
+Monitoring with Prometheus and Grafana, unit testing with pytest, agile teams."""
+
+def postings(n, words, skill_share, seed):
+    rng = random.Random(seed)
+    spellings = list(SKILL_BY_SPELLING)
+    result = []
+    for i in range(n):
+        body = [rng.choice(spellings) if rng.random() < skill_share else rng.choice(FILLER) for _ in range(words)]
+        result.append(f"Backend Engineer {i}\nCompany: Acme {i}\n" + ' '.join(body) + '.')
+    return result
+
+def run(n, words, skill_share, repeat, seed):
+    jobs = postings(n, words, skill_share, seed)
+    cv = Document(CV)
+    scorer = ATSScorer()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scorer.score_many(cv, jobs)
+        durations.append(time.perf_counter() - start)
+    return {
+        'postings': n,
+        'words': words,
+        'skill_share': skill_share,
+        'runs': repeat,
+        'best_per_second': round(n / min(durations)),
+        'median_per_second': round(n / statistics.median(durations)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local ATS scoring of postings against one CV.")
+    parser.add_argument('--postings', type=int, default=2000, help="postings scored per run")
+    parser.add_argument('--words', type=int, default=100, help="words per posting")
+    parser.add_argument('--skill-share', type=float, default=0.1, help="share of words that are skill spellings")
+    parser.add_argument('--repeat', type=int, default=5, help="runs; the best and median are reported")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    result = run(args.postings, args.words, args.skill_share, args.repeat, args.seed)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['postings']} postings of {result['words']} words, {result['runs']} runs: "
+          f"{result['best_per_second']} postings/s best, {result['median_per_second']} median")
+
+if __name__ == '__main__':
+    main()
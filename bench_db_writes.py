@@ -0,0 +1,170 @@
+"""Benchmark: concurrent job completions against the app's SQLite database.
+
+    python bench_db_writes.py --threads 8 --jobs 200 --readers 2
+
+Each simulated completion does what a finished job writes: one application
+row and one credit update on the user row, while reader threads page
+through the history like /api/history. Three setups run on fresh temporary
+databases:
+
+    baseline  default SQLite settings, one session and commit per completion
+    tuned     sqlite_tuning pragmas (WAL, synchronous=NORMAL...), one commit per completion
+    batched   tuned pragmas, completions committed together by db_writer.BatchWriter
+
+Prints completions per second and read latencies, or JSON with --json.
+"""
+import os
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Index, select, update
+from sqlalchemy.orm import declarative_base, sessionmaker
+from db_writer import BatchWriter
+import sqlite_tuning
+
+Base = declarative_base()
+
+# Same columns as the app's models
+class User(Base):
+    __tablename__ = 'user'
+    id = Column(Integer, primary_key=True)
+    credits_used = Column(Integer, default=0)
+
+class Application(Base):
+    __tablename__ = 'application'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
+    job_title = Column(String(150))
+    company = Column(String(150))
+    ats_score = Column(Integer, default=0)
+    missing_keywords = Column(Text)
+    cv_path = Column(String(200))
+    cl_path = Column(String(200))
+    message_content = Column(Text)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index('ix_application_user_timestamp', 'user_id', 'timestamp', 'id'),)
+
+USERS = 20
+
+def completion(n):
+    """The writes of one finished job, as a function of a session."""
+    def write(session):
+        user_id = n % USERS + 1
+        session.add(Application(user_id=user_id, job_title=f"Job {n}", company="ACME", ats_score=n % 100,
+                                missing_keywords=json.dumps(["docker", "kubernetes"]),
+                                cv_path=f"CV_{n}.pdf", cl_path=f"CL_{n}.pdf", message_content="x" * 1500))
+        session.execute(update(User).where(User.id == user_id).values(credits_used=User.credits_used + 1))
+    return write
+
+def run(setup, threads, jobs, readers):
+    directory = tempfile.mkdtemp(prefix='bench_db_')
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}", pool_size=threads + readers,
+                           max_overflow=0)
+    if setup != 'baseline':
+        sqlite_tuning.tune_engine(engine)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        session.add_all(User(id=i + 1, credits_used=0) for i in range(USERS))
+        session.commit()
+
+    writer = BatchWriter(Session) if setup == 'batched' else None
+    counter = iter(range(jobs))
+    counter_lock = threading.Lock()
+    errors = []
+    read_times = []
+    done = threading.Event()
+
+    def write_loop():
+        session = Session()
+        while True:
+            with counter_lock:
+                n = next(counter, None)
+            if n is None:
+                break
+            try:
+                if writer:
+                    writer.call(completion(n))
+                else:
+                    completion(n)(session)
+                    session.commit()
+            except Exception as e:
+                session.rollback()
+                errors.append(str(e))
+        session.close()
+
+    def read_loop():
+        session = Session()
+        n = 0
+        while not done.is_set():
+            start = time.perf_counter()
+            session.execute(select(Application.id, Application.job_title, Application.company,
+                                   Application.ats_score, Application.timestamp)
+                            .where(Application.user_id == n % USERS + 1)
+                            .order_by(Application.timestamp.desc(), Application.id.desc()).limit(20)).all()
+            session.rollback()
+            read_times.append(time.perf_counter() - start)
+            n += 1
+        session.close()
+
+    reader_threads = [threading.Thread(target=read_loop) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=write_loop) for _ in range(threads)]
+    for thread in reader_threads:
+        thread.start()
+    start = time.perf_counter()
+    for thread in writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in reader_threads:
+        thread.join()
+    if writer:
+        writer.close()
+
+    with Session() as session:
+        stored = session.query(Application).count()
+        credits = sum(credits for credits, in session.execute(select(User.credits_used)))
+    engine.dispose()
+    shutil.rmtree(directory, ignore_errors=True)
+
+    read_times.sort()
+    return {
+        'setup': setup,
+        'completions': jobs,
+        'stored': stored,
+        'credits_counted': credits,
+        'errors': len(errors),
+        'seconds': round(elapsed, 3),
+        'completions_per_second': round(jobs / elapsed, 1),
+        'reads': len(read_times),
+        'read_p50_ms': round(statistics.median(read_times) * 1000, 2) if read_times else None,
+        'read_p95_ms': round(read_times[int(len(read_times) * 0.95)] * 1000, 2) if read_times else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent job completions on SQLite.")
+    parser.add_argument('--threads', type=int, default=8, help="threads completing jobs")
+    parser.add_argument('--jobs', type=int, default=200, help="completions per setup")
+    parser.add_argument('--readers', type=int, default=2, help="threads reading the history meanwhile")
+    parser.add_argument('--setups', default='baseline,tuned,batched')
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = [run(setup, args.threads, args.jobs, args.readers) for setup in args.setups.split(',')]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'setup':<10}{'jobs/s':>10}{'errors':>8}{'reads':>8}{'read p50':>11}{'read p95':>11}")
+    for r in results:
+        print(f"{r['setup']:<10}{r['completions_per_second']:>10}{r['errors']:>8}{r['reads']:>8}"
+              f"{r['read_p50_ms']:>9}ms{r['read_p95_ms']:>9}ms")
+
+if __name__ == '__main__':
+    main()
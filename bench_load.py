@@ -0,0 +1,357 @@
+"""Benchmark: whole jobs through /start_job and /job_status at a set concurrency.
+
+    python bench_load.py --clients 16 --jobs 200 --llm-latency 0.5 --output results/before.json
+    python bench_load.py --clients 16 --jobs 200 --llm-latency 0.5 --compare results/before.json
+
+The app runs in this process against fake_gemini.py (answers after
+`--llm-latency` seconds plus up to `--llm-jitter`, a `--slow-rate` share
+after `--slow-seconds`, a `--error-rate` share failing with 503) and, with
+`--compiler stub`, a stand-in for pdflatex that writes a small PDF after
+`--compile-latency` seconds. `--compiler real` uses pdflatex; `auto` (the
+default) uses it when it is installed. Random draws are seeded by --seed.
+
+Each client registers a user and runs one job at a time: it submits a
+distinct posting with no_cache=1 (or lets the caches answer with --cached),
+then polls /job_status?timings=1 until the job ends. Requests go through the
+Flask test client, or real HTTP to a local server with --transport http.
+
+The app's databases, uploads and outputs go to a scratch directory created
+for the run and deleted after it, so every run starts from empty stores.
+
+Prints throughput, end-to-end and per-stage p50/p95/p99 and the growth of
+the job store and of the process memory, and saves them as JSON (--output)
+for comparison across commits (--compare).
+"""
+import os
+import argparse
+import contextlib
+import http.cookiejar
+import json
+import random
+import shutil
+import sqlite3
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+STUB_PDFLATEX = """#!{python}
+import os, random, sys, time
+args = sys.argv[1:]
+outdir = args[args.index('-output-directory') + 1] if '-output-directory' in args else '.'
+jobname = next((a.split('=', 1)[1] for a in args if a.startswith('-jobname=')), None)
+tex = [a for a in args if a.endswith('.tex')][-1]
+time.sleep({latency} + random.uniform(0, {jitter}))
+name = jobname or os.path.basename(tex)[:-4]
+with open(os.path.join(outdir, name + '.pdf'), 'wb') as f:
+    # Content differs per job, as real documents do in the PDF store
+    f.write(b'%PDF-1.4\\n%' + name.encode() + b'\\n%%EOF\\n')
+"""
+
+def percentiles(values):
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+    values = sorted(values)
+    pick = lambda q: round(values[min(int(len(values) * q), len(values) - 1)], 3)
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(values[-1], 3)}
+
+def rss_mb():
+    """Resident memory of this process, in MB."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_stub_compiler(directory, latency, jitter):
+    path = os.path.join(directory, 'pdflatex')
+    with open(path, 'w') as f:
+        f.write(STUB_PDFLATEX.format(python=sys.executable, latency=latency, jitter=jitter))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+def job_store_size(jobs_db):
+    """(entries, bytes) held by the app's job store."""
+    from app import JOBS
+    if hasattr(JOBS, '_jobs'):
+        # Memory store: what its records would weigh as JSON
+        with JOBS._lock:
+            size = sum(len(json.dumps(job)) + len(json.dumps(JOBS._events.get(job_id, [])))
+                       for job_id, job in JOBS._jobs.items())
+        return JOBS.count(), size
+    # Fold the WAL back in first: a fresh database's WAL grows by whole pages, not by what a job stores
+    with contextlib.closing(sqlite3.connect(jobs_db)) as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return JOBS.count(), sum(os.path.getsize(path) for path in (jobs_db, jobs_db + '-wal') if os.path.exists(path))
+
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, path, data=None, json_body=None):
+        response = self.client.post(path, data=data, json=json_body)
+        return response.status_code, response.get_json(silent=True)
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get_json(silent=True)
+
+class HTTPSession:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def _send(self, request):
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            return e.code, json.loads(body) if body.startswith(b'{') else None
+
+    def post(self, path, data=None, json_body=None):
+        if json_body is not None:
+            body, content_type = json.dumps(json_body).encode(), 'application/json'
+        else:
+            body, content_type = urllib.parse.urlencode(data).encode(), 'application/x-www-form-urlencoded'
+        return self._send(urllib.request.Request(self.base_url + path, data=body,
+                                                 headers={'Content-Type': content_type}))
+
+    def get(self, path):
+        return self._send(urllib.request.Request(self.base_url + path))
+
+def posting(n, run_id):
+    rng = random.Random(n)
+    skills = rng.sample(['Python', 'Docker', 'Kubernetes', 'AWS', 'Terraform', 'PostgreSQL', 'React', 'Go',
+                         'Kafka', 'Airflow', 'GCP', 'Linux'], 5)
+    return (f"Backend Engineer #{n} ({run_id}) at ACME {n % 7}\n"
+            f"We are looking for an engineer with {', '.join(skills)}. You will build and run APIs, "
+            f"own CI/CD pipelines and mentor junior developers.")
+
+CV_TEXT = ("Jane Doe - Software Engineer\nExperience: 5 years building Python APIs with Flask and PostgreSQL, "
+           "Docker deployments on AWS, CI with GitHub Actions.\nSkills: Python, SQL, Docker, AWS, Linux, React.")
+
+def run(args):
+    import app as webapp
+
+    run_id = f"{int(time.time())}-{os.getpid()}"
+    jobs_db = os.path.join(webapp.app.instance_path, 'jobs.db')
+    if args.transport == 'http':
+        from werkzeug.serving import make_server, WSGIRequestHandler
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        server = make_server('127.0.0.1', args.port, webapp.app, threaded=True, request_handler=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        make_session = lambda: HTTPSession(f"http://127.0.0.1:{args.port}")
+    else:
+        server = None
+        make_session = lambda: TestClientSession(webapp.app)
+
+    sessions = []
+    for i in range(args.clients):
+        session = make_session()
+        status, body = session.post('/api/register', json_body={'email': f"bench-{run_id}-{i}@example.com",
+                                                                 'password': 'bench'})
+        if status != 200:
+            raise SystemExit(f"Could not register a benchmark user: {status} {body}")
+        sessions.append(session)
+
+    entries_before, store_bytes_before = job_store_size(jobs_db)
+    rss_before = rss_mb()
+    counter = iter(range(args.jobs))
+    counter_lock = threading.Lock()
+    records = []
+    records_lock = threading.Lock()
+
+    def client_loop(session):
+        while True:
+            with counter_lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            form = {'job_description': posting(n, run_id), 'cv_text': CV_TEXT, 'language': 'en'}
+            if not args.cached:
+                form['no_cache'] = '1'
+            start = time.perf_counter()
+            status, body = session.post('/start_job', data=form)
+            record = {'submit_seconds': time.perf_counter() - start}
+            if status != 200:
+                record.update(status='rejected' if status == 429 else f"http_{status}")
+            else:
+                job_id = body['job_id']
+                while True:
+                    _, job = session.get(f'/job_status/{job_id}?timings=1')
+                    if job and job.get('status') in ('completed', 'failed', 'unknown'):
+                        break
+                    time.sleep(args.poll_interval)
+                record.update(status=job['status'], timings=job.get('timings') or {}, cached=job.get('cached', False))
+            record['seconds'] = time.perf_counter() - start
+            with records_lock:
+                records.append(record)
+
+    threads = [threading.Thread(target=client_loop, args=(session,)) for session in sessions]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    entries_after, store_bytes_after = job_store_size(jobs_db)
+    rss_after = rss_mb()
+    if server:
+        server.shutdown()
+
+    statuses = {}
+    for record in records:
+        statuses[record['status']] = statuses.get(record['status'], 0) + 1
+    finished = [r for r in records if r['status'] == 'completed']
+    stages = sorted({stage for r in records for stage in r.get('timings', {})})
+    return {
+        'jobs': args.jobs,
+        'statuses': statuses,
+        'seconds': round(elapsed, 3),
+        'jobs_per_second': round(len(finished) / elapsed, 2),
+        'submit': percentiles([r['submit_seconds'] for r in records]),
+        'end_to_end': percentiles([r['seconds'] for r in finished]),
+        'stages': {stage: percentiles([r['timings'][stage] for r in records if stage in r.get('timings', {})])
+                   for stage in stages},
+        'job_store': {
+            'type': webapp.app.config['JOB_STORE'],
+            'entries_before': entries_before,
+            'entries_after': entries_after,
+            'bytes_before': store_bytes_before,
+            'bytes_after': store_bytes_after,
+            'bytes_per_job': round((store_bytes_after - store_bytes_before) / max(len(records), 1)),
+        },
+        'rss_mb_before': rss_before,
+        'rss_mb_after': rss_after,
+        'llm': {key: value for key, value in webapp.llm.stats().items() if not isinstance(value, str)},
+    }
+
+def print_results(results, previous=None):
+    def change(path):
+        if previous is None:
+            return ''
+        old = previous['results']
+        new = results
+        for key in path:
+            old = (old or {}).get(key)
+            new = (new or {}).get(key)
+        if not old or new is None:
+            return ''
+        return f"  ({old} -> {new}, {(new - old) / old * 100:+.1f}%)"
+
+    print(f"{results['jobs']} jobs in {results['seconds']}s: {results['jobs_per_second']} jobs/s"
+          f"{change(['jobs_per_second'])}   {results['statuses']}")
+    print(f"{'':<16}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    rows = [('submit', ['submit']), ('end to end', ['end_to_end'])]
+    rows += [(stage, ['stages', stage]) for stage in results['stages']]
+    for label, path in rows:
+        figures = results
+        for key in path:
+            figures = figures[key]
+        print(f"{label:<16}" + ''.join(f"{figures[q] if figures[q] is not None else '-':>9}"
+                                       for q in ('p50', 'p95', 'p99', 'max')) + change(path + ['p95']))
+    store = results['job_store']
+    print(f"job store ({store['type']}): {store['entries_before']} -> {store['entries_after']} entries, "
+          f"{store['bytes_before']} -> {store['bytes_after']} bytes ({store['bytes_per_job']} per job)")
+    print(f"process memory: {results['rss_mb_before']} -> {results['rss_mb_after']} MB"
+          f"{change(['rss_mb_after'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark of whole jobs against fake Gemini and pdflatex.")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent clients, one job at a time each")
+    parser.add_argument('--jobs', type=int, default=50, help="jobs in total")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('EMBEDDED_WORKERS', 5)),
+                        help="queue consumer threads of the app (EMBEDDED_WORKERS)")
+    parser.add_argument('--transport', choices=['test-client', 'http'], default='test-client')
+    parser.add_argument('--port', type=int, default=5099, help="port of the local server with --transport http")
+    parser.add_argument('--cached', action='store_true', help="let the result and LLM caches answer")
+    parser.add_argument('--poll-interval', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--llm-port', type=int, default=8765)
+    parser.add_argument('--llm-latency', type=float, default=0.3, help="seconds per fake Gemini answer")
+    parser.add_argument('--llm-jitter', type=float, default=0.2, help="random extra seconds, up to this")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="share of LLM answers taking --slow-seconds")
+    parser.add_argument('--slow-seconds', type=float, default=10.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of LLM answers failing with 503")
+    parser.add_argument('--compiler', choices=['auto', 'stub', 'real'], default='auto')
+    parser.add_argument('--compile-latency', type=float, default=0.3, help="seconds per stub pdflatex run")
+    parser.add_argument('--compile-jitter', type=float, default=0.1)
+    parser.add_argument('--output', help="save the results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    import fake_gemini
+    fake_server, _ = fake_gemini.serve(args.llm_port, latency=args.llm_latency, jitter=args.llm_jitter,
+                                       slow_rate=args.slow_rate, slow_seconds=args.slow_seconds,
+                                       error_rate=args.error_rate, error_codes=[503])
+
+    compiler = args.compiler
+    if compiler == 'auto':
+        from latex_compiler import find_pdflatex
+        compiler = 'real' if shutil.which(find_pdflatex()) else 'stub'
+    scratch = tempfile.mkdtemp(prefix='bench_load_')
+
+    # The app reads its settings at import
+    os.environ['INSTANCE_PATH'] = os.path.join(scratch, 'instance')
+    os.environ['UPLOAD_FOLDER'] = os.path.join(scratch, 'uploads')
+    os.environ['OUTPUT_FOLDER'] = os.path.join(scratch, 'outputs')
+    os.environ['GEMINI_API_ENDPOINT'] = f"http://127.0.0.1:{args.llm_port}"
+    os.environ.setdefault('GEMINI_API_KEY', 'bench')
+    os.environ['EMBEDDED_WORKERS'] = str(args.workers)
+    os.environ.setdefault('FREE_DAILY_CREDITS', str(10 ** 9))
+    if compiler == 'stub':
+        # The stub does not dump formats
+        os.environ['LATEX_FORMAT_CACHE'] = '0'
+    try:
+        import app as webapp
+        if compiler == 'stub':
+            webapp.compile_pool.cmd = write_stub_compiler(scratch, args.compile_latency, args.compile_jitter)
+        results = run(args)
+    finally:
+        fake_server.shutdown()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    config.update(compiler=compiler, generation_mode=webapp.app.config['GENERATION_MODE'],
+                  ats_mode=webapp.app.config['ATS_MODE'])
+    report = {'commit': git_commit(), 'date': datetime.utcnow().isoformat(timespec='seconds'),
+              'config': config, 'results': results}
+
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        print(f"Compared with {args.compare} (commit {previous.get('commit')}); changes of p95 in brackets.")
+    print_results(results, previous)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+if __name__ == '__main__':
+    main()
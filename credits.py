@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from flask import g
+from sqlalchemy import update, case, or_
+
+class CreditLedger:
+    """Daily credits of free-plan users, kept in the user table.
+
+    The daily window is evaluated lazily: a window older than `window` counts
+    as zero credits used without being written back, so reading a balance
+    never writes. reserve() takes credits with one conditional UPDATE (the
+    reset of an expired window included), so concurrent submissions can
+    neither overdraw nor lose an increment; refund() gives them back when a
+    job fails.
+    """
+
+    def __init__(self, db, user_model, daily_credits=99, window=timedelta(days=1)):
+        self.db = db
+        self.User = user_model
+        self.daily_credits = daily_credits
+        self.window = window
+
+    def _expired(self, now):
+        User = self.User
+        return or_(User.last_reset.is_(None), User.last_reset <= now - self.window)
+
+    def used(self, user):
+        if user.last_reset is None or datetime.utcnow() - user.last_reset >= self.window:
+            return 0
+        return user.credits_used or 0
+
+    def remaining(self, user):
+        """Credits left today, or None for plans without a daily limit. Cached for the request."""
+        if user.plan_type != 'free':
+            return None
+        cache = g.setdefault('credits_remaining', {})
+        if user.id not in cache:
+            cache[user.id] = self.daily_credits - self.used(user)
+        return cache[user.id]
+
+    def reserve(self, user, count=1):
+        """Takes `count` credits. Returns the reservation time to pass to
+        refund(), True for unlimited plans, or None when not enough are left."""
+        if user.plan_type != 'free':
+            return True
+        User = self.User
+        now = datetime.utcnow()
+        expired = self._expired(now)
+        used = case((expired, 0), else_=User.credits_used)
+        result = self.db.session.execute(
+            update(User)
+            .where(User.id == user.id, User.plan_type == 'free', used + count <= self.daily_credits)
+            .values(credits_used=used + count, last_reset=case((expired, now), else_=User.last_reset))
+            .execution_options(synchronize_session=False))
+        self.db.session.commit()
+        g.pop('credits_remaining', None)
+        return now if result.rowcount else None
+
+    def refund(self, user_id, reserved_at, count=1, session=None):
+        """Gives back credits taken by reserve(), unless the daily window has
+        been reset since (the credits then belong to a window that is over).
+
+        With `session`, the update joins that session's transaction and the
+        caller commits it.
+        """
+        if not isinstance(reserved_at, datetime) or count <= 0:
+            return
+        User = self.User
+        statement = (update(User)
+                     .where(User.id == user_id, User.plan_type == 'free', User.last_reset <= reserved_at)
+                     .values(credits_used=case((User.credits_used > count, User.credits_used - count), else_=0))
+                     .execution_options(synchronize_session=False))
+        if session is not None:
+            session.execute(statement)
+            return
+        self.db.session.execute(statement)
+        self.db.session.commit()
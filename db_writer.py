@@ -0,0 +1,76 @@
+import concurrent.futures
+import queue
+import threading
+import time
+
+class BatchWriter:
+    """Single writer thread for a SQLAlchemy database.
+
+    Threads submit write functions, called as fn(session), instead of
+    committing sessions of their own. The writer runs whatever is pending, up
+    to `max_batch` functions, in one transaction: concurrent job completions
+    then share one commit instead of queueing on the database lock one by
+    one. A function that raises is retried alone, so it only fails itself.
+    """
+
+    def __init__(self, make_session, max_batch=64, max_wait=0.005):
+        self.make_session = make_session
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn):
+        future = concurrent.futures.Future()
+        self._queue.put((fn, future))
+        return future
+
+    def call(self, fn, timeout=None):
+        """Runs fn(session) in the writer and returns its result once committed."""
+        return self.submit(fn).result(timeout)
+
+    def _run(self):
+        session = self.make_session()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Wait a moment for other writers so they can share the commit
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(session, batch)
+        session.close()
+
+    def _write(self, session, batch):
+        try:
+            # Objects added by the batch are inserted together at commit instead of one flush per function
+            with session.no_autoflush:
+                results = [fn(session) for fn, _ in batch]
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            if len(batch) > 1:
+                for item in batch:
+                    self._write(session, [item])
+            else:
+                print(f"Database write failed: {e}")
+                batch[0][1].set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close(self, wait=True):
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
@@ -1,15 +1,16 @@
-import google.generativeai as genai
 import os
 from dotenv import load_dotenv
+from llm_client import LLMClient
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-genai.configure(api_key=GEMINI_API_KEY)
+llm = LLMClient(api_key=GEMINI_API_KEY)
 
 try:
     with open('available_models.txt', 'w') as f:
-        for m in genai.list_models():
-            f.write(f"{m.name}\n")
+        for m in llm.list_models():
+            # Generation methods let the app's model catalog keep only the models that generate text
+            f.write(f"{m.name}\t{','.join(m.supported_generation_methods)}\n")
             print(m.name)
 except Exception as e:
     print(f"Error: {e}")
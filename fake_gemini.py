@@ -0,0 +1,193 @@
+"""Local stand-in for the Gemini REST API, with injectable latency and errors.
+
+    python fake_gemini.py --port 8765 --latency 0.5 --slow-rate 0.05 --slow-seconds 30 --error-rate 0.1
+
+Point the app at it with GEMINI_API_ENDPOINT=http://127.0.0.1:8765 (any
+GEMINI_API_KEY). It answers generateContent and streamGenerateContent with
+canned but well-formed outputs for each prompt of the app (ATS analysis
+JSON, LaTeX bodies, outreach message, or the structured single-call
+object), so whole jobs run without the real service.
+
+Every request waits `latency` seconds (plus up to `jitter`); a `slow_rate`
+share waits `slow_seconds` instead, and an `error_rate` share fails with one
+of `error_codes`. GET /_fake/config shows these settings and the request
+counters, POST /_fake/config with a JSON object changes them while running.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATUS_NAMES = {400: 'INVALID_ARGUMENT', 429: 'RESOURCE_EXHAUSTED', 500: 'INTERNAL', 503: 'UNAVAILABLE',
+                504: 'DEADLINE_EXCEEDED'}
+PATH_RE = re.compile(r"^/v1beta/(?:models|tunedModels)/([^/:]+):(generateContent|streamGenerateContent)")
+
+ANALYSIS = {
+    "job_title": "Software Engineer",
+    "company": "ACME",
+    "ats_score": 78,
+    "missing_keywords": ["kubernetes", "terraform"],
+    "cv_improvements": "Put the cloud and infrastructure projects first.",
+}
+CV_BODY = "\\section{Profile}\nEngineer with a record of shipping Python services.\n\\section{Experience}\nBuilt APIs."
+CL_BODY = "\\opening{Dear Hiring Team,}\nI am applying for this position.\n\\closing{Sincerely,}"
+MESSAGE = "Subject: Application\n\nHello Hiring Team, I would be glad to discuss this role with you."
+
+class FakeGemini:
+    def __init__(self, latency=0.2, jitter=0.1, slow_rate=0.0, slow_seconds=30.0, error_rate=0.0,
+                 error_codes=(503, 429)):
+        self.config = {
+            'latency': latency,
+            'jitter': jitter,
+            'slow_rate': slow_rate,
+            'slow_seconds': slow_seconds,
+            'error_rate': error_rate,
+            'error_codes': list(error_codes),
+        }
+        self.counts = {'requests': 0, 'errors': 0, 'slow': 0}
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def answer(self, prompt, generation_config):
+        """Text of the response to a prompt."""
+        schema = (generation_config or {}).get('responseSchema') or (generation_config or {}).get('response_schema')
+        if schema:
+            fields = {'analysis': ANALYSIS, 'cv_body': CV_BODY, 'cl_body': CL_BODY, 'message': MESSAGE}
+            return json.dumps({name: fields.get(name, '') for name in schema.get('properties', {})})
+        if 'ATS' in prompt and 'JSON' in prompt:
+            return json.dumps(ANALYSIS)
+        if 'LinkedIn' in prompt:
+            return MESSAGE
+        if 'Cover Letter' in prompt:
+            return CL_BODY
+        return CV_BODY
+
+    def delay(self):
+        """Sleeps as configured; returns an error code to answer with, or None."""
+        config = self.config
+        if random.random() < config['slow_rate']:
+            self.count('slow')
+            time.sleep(config['slow_seconds'])
+        else:
+            time.sleep(config['latency'] + random.uniform(0, config['jitter']))
+        if config['error_codes'] and random.random() < config['error_rate']:
+            self.count('errors')
+            return random.choice(config['error_codes'])
+        return None
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def handle_one_request(self):
+            try:
+                super().handle_one_request()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up (timeout or hedged request already answered)
+                self.close_connection = True
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def do_GET(self):
+            if self.path.startswith('/_fake/config'):
+                return self.send_json(200, {'config': fake.config, 'counts': fake.counts})
+            if self.path.startswith('/v1beta/models'):
+                return self.send_json(200, {'models': [{'name': 'models/gemini-2.0-flash',
+                                                        'supportedGenerationMethods': ['generateContent']}]})
+            self.send_json(404, {'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}})
+
+        def do_POST(self):
+            if self.path.startswith('/_fake/config'):
+                fake.config.update(self.read_json())
+                return self.send_json(200, {'config': fake.config})
+            match = PATH_RE.match(self.path)
+            if not match:
+                return self.send_json(404, {'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}})
+
+            request = self.read_json()
+            fake.count('requests')
+            error = fake.delay()
+            if error:
+                return self.send_json(error, {'error': {'code': error, 'message': 'Injected failure',
+                                                        'status': STATUS_NAMES.get(error, 'UNKNOWN')}})
+
+            prompt = ''.join(part.get('text', '') for content in request.get('contents', [])
+                             for part in content.get('parts', []))
+            text = fake.answer(prompt, request.get('generationConfig'))
+            if match.group(2) == 'generateContent':
+                return self.send_json(200, response(text))
+            # Streaming: a JSON array of partial responses, as the REST transport expects
+            pieces = [text[i:i + 40] for i in range(0, len(text), 40)] or ['']
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for i, piece in enumerate(pieces):
+                self.write_chunk(('[' if i == 0 else ',') + json.dumps(response(piece)))
+                time.sleep(0.01)
+            self.write_chunk(']')
+            self.write_chunk('')
+
+        def write_chunk(self, data):
+            data = data.encode('utf-8')
+            self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+def response(text):
+    return {
+        'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}, 'finishReason': 'STOP', 'index': 0}],
+        'usageMetadata': {'promptTokenCount': 0, 'candidatesTokenCount': len(text) // 4},
+    }
+
+def serve(port=8765, host='127.0.0.1', **config):
+    """Starts the fake server in a background thread and returns (server, fake)."""
+    fake = FakeGemini(**config)
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, fake
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Gemini REST server with injectable latency and errors.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds before each answer")
+    parser.add_argument('--jitter', type=float, default=0.1, help="random extra seconds, up to this")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="share of requests that take --slow-seconds")
+    parser.add_argument('--slow-seconds', type=float, default=30.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests answered with an error")
+    parser.add_argument('--error-codes', default='503,429', help="HTTP codes to fail with, comma separated")
+    args = parser.parse_args()
+
+    server, _ = serve(args.port, args.host, latency=args.latency, jitter=args.jitter, slow_rate=args.slow_rate,
+                      slow_seconds=args.slow_seconds, error_rate=args.error_rate,
+                      error_codes=[int(code) for code in args.error_codes.split(',') if code])
+    print(f"Fake Gemini listening on http://{args.host}:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
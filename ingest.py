@@ -0,0 +1,141 @@
+import os
+import contextlib
+import concurrent.futures
+import hashlib
+import multiprocessing
+import tempfile
+import threading
+import time
+from pypdf import PdfReader
+import sqlite_tuning
+
+CHUNK_SIZE = 64 * 1024
+
+def upload_path(upload_dir, digest, suffix='.pdf'):
+    return os.path.join(upload_dir, digest[:2], digest + suffix)
+
+def store_upload(stream, upload_dir, suffix='.pdf'):
+    """Copies a file into upload_dir under its SHA-256, hashing it in the same pass as the copy.
+
+    Returns (digest, path). Identical uploads share one file, and different
+    files can never overwrite each other whatever their original names.
+    For a Flask upload, Werkzeug has already buffered the whole body (in
+    memory or a spooled temporary file) before the route runs, so this is
+    one extra read of that buffer, not a hash of the request as it arrives.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, suffix='.part')
+    sha = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+                out.write(chunk)
+        digest = sha.hexdigest()
+        path = upload_path(upload_dir, digest, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    return digest, path
+
+def _extract_pages(path, start, stop):
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or '' for i in range(start, stop)]
+
+class TextExtractor:
+    """Extracts the text of uploaded PDFs, cached by file hash in SQLite.
+
+    PDFs with at least `parallel_pages` pages are split into page ranges
+    extracted by a process pool of `max_workers`; smaller ones are read in
+    the calling thread. Concurrent requests for the same file in one process
+    wait for a single extraction.
+    """
+
+    def __init__(self, db_path, max_workers=None, parallel_pages=8, max_entries=10000):
+        self.db_path = db_path
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.parallel_pages = parallel_pages
+        self.max_entries = max_entries
+        self._pool = None
+        self._lock = threading.Lock()
+        self._digest_locks = {}
+        self._puts = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            sqlite_tuning.enable_wal(conn)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS texts (
+                    digest TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    pages INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_texts_last_access ON texts (last_access)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite_tuning.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def cached(self, digest):
+        """Returns the stored text of a file, or None if it was never extracted."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT text FROM texts WHERE digest = ?", (digest,)).fetchone()
+            if row:
+                conn.execute("UPDATE texts SET last_access = ? WHERE digest = ?", (time.time(), digest))
+        return row[0] if row else None
+
+    def extract(self, digest, path):
+        text = self.cached(digest)
+        if text is not None:
+            return text
+        with self._lock:
+            lock = self._digest_locks.setdefault(digest, threading.Lock())
+        with lock:
+            text = self.cached(digest)
+            if text is None:
+                text, pages = self._extract(path)
+                self._store(digest, text, pages)
+        with self._lock:
+            self._digest_locks.pop(digest, None)
+        return text
+
+    def _extract(self, path):
+        pages = len(PdfReader(path).pages)
+        if pages < self.parallel_pages or self.max_workers < 2:
+            return ''.join(_extract_pages(path, 0, pages)), pages
+
+        step = -(-pages // self.max_workers)
+        futures = [self._get_pool().submit(_extract_pages, path, start, min(start + step, pages))
+                   for start in range(0, pages, step)]
+        return ''.join(''.join(future.result()) for future in futures), pages
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # Spawned, not forked: the app forks from a process already running
+                # worker, writer and janitor threads, whose locks a fork would copy held
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _store(self, digest, text, pages):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO texts (digest, text, pages, last_access) VALUES (?, ?, ?, ?)",
+                         (digest, text, pages, time.time()))
+            self._puts += 1
+            if self._puts % 100 == 0:
+                conn.execute("""
+                    DELETE FROM texts WHERE digest IN (
+                        SELECT digest FROM texts ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    )""", (self.max_entries,))
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown()
@@ -0,0 +1,107 @@
+import os
+import contextlib
+import shutil
+import threading
+import time
+
+class Janitor:
+    """Background retention for the files jobs leave behind.
+
+    Every `interval` seconds:
+    - PDFs of the store that `referenced()` does not name (saved
+      applications, result cache entries) are deleted once older than
+      `retention`, then the oldest ones while the store exceeds `max_bytes`.
+      Files younger than `min_age` are always kept, as unsaved jobs (guests)
+      still serve them.
+    - Entries of each scratch directory (failed compile builds) older than
+      `min_age` are deleted.
+    - Uploads older than `upload_retention` are deleted; their extracted text
+      stays cached by hash.
+
+    Several processes may run one: deleting is idempotent.
+    """
+
+    def __init__(self, store, referenced, retention=30 * 86400, max_bytes=2048 * 1024 * 1024, min_age=86400,
+                 scratch_dirs=(), upload_dir=None, upload_retention=7 * 86400, interval=3600):
+        self.store = store
+        self.referenced = referenced
+        self.retention = retention
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.scratch_dirs = list(scratch_dirs)
+        self.upload_dir = upload_dir
+        self.upload_retention = upload_retention
+        self.interval = interval
+        self.last_sweep = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='janitor', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Janitor sweep failed: {e}")
+
+    def sweep(self):
+        """Runs one pass and returns its figures (also kept in last_sweep)."""
+        start = time.time()
+        referenced = self.referenced()
+        removed = freed = 0
+
+        candidates = []
+        total = 0
+        for name, _, size, mtime in self.store.files():
+            total += size
+            if name not in referenced:
+                candidates.append((mtime, name, size))
+        candidates.sort()
+        for mtime, name, size in candidates:
+            if start - mtime < self.retention and total <= self.max_bytes:
+                break
+            released = self.store.remove(name, min_age=self.min_age)
+            if released:
+                removed += 1
+                freed += released
+                total -= released
+
+        for scratch_dir in self.scratch_dirs:
+            removed += self._prune(scratch_dir, self.min_age, start)
+        if self.upload_dir:
+            removed += self._prune(self.upload_dir, self.upload_retention, start, recurse=True)
+
+        self.last_sweep = {
+            'at': start,
+            'seconds': round(time.time() - start, 3),
+            'removed': removed,
+            'freed_bytes': freed,
+            'stored_bytes': total,
+            'referenced': len(referenced),
+        }
+        return self.last_sweep
+
+    def _prune(self, directory, max_age, now, recurse=False):
+        """Deletes the entries of a directory older than max_age: files, and whole
+        subdirectories unless `recurse`, which prunes inside them instead."""
+        removed = 0
+        with contextlib.suppress(FileNotFoundError):
+            for entry in os.scandir(directory):
+                with contextlib.suppress(OSError):
+                    if entry.is_dir(follow_symlinks=False):
+                        if recurse:
+                            removed += self._prune(entry.path, max_age, now, recurse=True)
+                        elif now - entry.stat().st_mtime > max_age:
+                            shutil.rmtree(entry.path, ignore_errors=True)
+                            removed += 1
+                    elif now - entry.stat(follow_symlinks=False).st_mtime > max_age:
+                        os.remove(entry.path)
+                        removed += 1
+        return removed
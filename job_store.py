@@ -0,0 +1,387 @@
+import os
+import concurrent.futures
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+import sqlite_tuning
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+def new_job(**fields):
+    job = {'status': 'queued', 'logs': [], 'result': None, 'current_step': 0}
+    job.update(fields)
+    return job
+
+class MemoryJobStore:
+    """Process-local store, for single-process runs and scripts."""
+
+    def __init__(self, ttl=24 * 3600):
+        self.ttl = ttl
+        self._jobs = {}
+        self._events = {}
+        self._partials = {}
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._creates = 0
+        self._last_event_id = 0
+
+    def _emit(self, job_id, kind, payload):
+        # Caller holds self._lock
+        self._last_event_id += 1
+        self._events[job_id].append((self._last_event_id, kind, payload))
+
+    def create(self, job_id, **fields):
+        with self._lock:
+            job = new_job(**fields)
+            self._jobs[job_id] = job
+            self._events[job_id] = []
+            self._partials[job_id] = {}
+            for line in job['logs']:
+                self._emit(job_id, 'log', line)
+            self._emit(job_id, 'update', {k: v for k, v in job.items() if k != 'logs'})
+            self._touched[job_id] = time.time()
+            self._creates += 1
+            expire = self._creates % 500 == 0
+        if expire:
+            self.expire()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or time.time() - self._touched[job_id] > self.ttl:
+                return None
+            job = json.loads(json.dumps(job))
+            if job['status'] not in TERMINAL_STATUSES and self._partials[job_id]:
+                job['partial'] = {stage: ''.join(chunks) for stage, chunks in self._partials[job_id].items()}
+            return job
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or time.time() - self._touched[job_id] > self.ttl:
+                return None
+            return job['status']
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+                if fields.get('status') in TERMINAL_STATUSES:
+                    self._events[job_id] = [e for e in self._events[job_id] if e[1] != 'chunk']
+                    self._partials[job_id] = {}
+                self._emit(job_id, 'update', json.loads(json.dumps(fields)))
+                self._touched[job_id] = time.time()
+
+    def append_log(self, job_id, line):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id]['logs'].append(line)
+                self._emit(job_id, 'log', line)
+                self._touched[job_id] = time.time()
+
+    def append_chunk(self, job_id, stage, text):
+        with self._lock:
+            if job_id in self._jobs:
+                self._partials[job_id].setdefault(stage, []).append(text)
+                self._emit(job_id, 'chunk', {'stage': stage, 'text': text})
+
+    def events_since(self, job_id, last_event_id=0):
+        with self._lock:
+            return [e for e in self._events.get(job_id, ()) if e[0] > last_event_id]
+
+    def expire(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for job_id in [j for j, t in self._touched.items() if t < cutoff]:
+                del self._jobs[job_id], self._events[job_id], self._partials[job_id], self._touched[job_id]
+
+    def count(self):
+        with self._lock:
+            return len(self._jobs)
+
+class SQLiteJobStore:
+    """Job state shared by every process on the host, in a WAL-mode SQLite file.
+
+    Scalar fields live in a JSON document per job and are written with
+    json_set, so concurrent updates of different fields never overwrite each
+    other. Every log line and field update is also appended to job_events,
+    which lets clients follow a job as a stream of deltas (see
+    events_since). Streamed output is buffered and written at most every
+    `chunk_interval` seconds per job, and dropped once the job is finished
+    as its result holds the final text. Jobs expire `ttl` seconds after
+    their last write. Finished jobs no longer change, so they are also kept
+    in a hot cache capped at `cache_bytes`.
+    """
+
+    def __init__(self, db_path, ttl=24 * 3600, cache_bytes=16 * 1024 * 1024, chunk_interval=0.25):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.cache_bytes = cache_bytes
+        self.chunk_interval = chunk_interval
+        # job_id -> (monotonic time of the oldest piece, {stage: [pieces]}) not written yet
+        self._chunks = {}
+        self._chunk_lock = threading.Lock()
+        self._local = threading.local()
+        self._cache = OrderedDict()
+        self._cache_size = 0
+        self._cache_lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._conn()
+        sqlite_tuning.enable_wal(conn)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )""")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_updated_at ON jobs (updated_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_job_events_job ON job_events (job_id, id)")
+
+    def _conn(self):
+        # One autocommit connection per thread; each statement is its own transaction
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite_tuning.connect(self.db_path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def create(self, job_id, **fields):
+        job = new_job(**fields)
+        logs = job.pop('logs')
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT INTO jobs (job_id, data, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                         (job_id, json.dumps(job), now, now))
+            conn.executemany("INSERT INTO job_events (job_id, kind, payload) VALUES (?, 'log', ?)",
+                             [(job_id, json.dumps(line)) for line in logs])
+            conn.execute("INSERT INTO job_events (job_id, kind, payload) VALUES (?, 'update', ?)",
+                         (job_id, json.dumps(job)))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if job['status'] in TERMINAL_STATUSES:
+            job['logs'] = logs
+            self._cache_put(job_id, job)
+        self._after_write()
+
+    def get(self, job_id):
+        with self._cache_lock:
+            if job_id in self._cache:
+                self._cache.move_to_end(job_id)
+                return json.loads(self._cache[job_id])
+
+        conn = self._conn()
+        row = conn.execute("SELECT data FROM jobs WHERE job_id = ? AND updated_at >= ?",
+                           (job_id, time.time() - self.ttl)).fetchone()
+        if not row:
+            return None
+        job = json.loads(row[0])
+        finished = job.get('status') in TERMINAL_STATUSES
+        # Streamed text is only interesting while the job runs; the result holds the final version
+        kinds = ('log',) if finished else ('log', 'chunk')
+        job['logs'] = []
+        partial = {}
+        for kind, payload in conn.execute(
+                f"SELECT kind, payload FROM job_events WHERE job_id = ? AND kind IN ({', '.join('?' * len(kinds))}) "
+                "ORDER BY id", (job_id, *kinds)):
+            if kind == 'log':
+                job['logs'].append(json.loads(payload))
+            else:
+                chunk = json.loads(payload)
+                partial.setdefault(chunk['stage'], []).append(chunk['text'])
+        if partial:
+            job['partial'] = {stage: ''.join(chunks) for stage, chunks in partial.items()}
+        if finished:
+            self._cache_put(job_id, job)
+        return job
+
+    def status(self, job_id):
+        """A job's status alone, without rebuilding its logs, or None if it is unknown."""
+        with self._cache_lock:
+            if job_id in self._cache:
+                return json.loads(self._cache[job_id])['status']
+        row = self._conn().execute(
+            "SELECT json_extract(data, '$.status') FROM jobs WHERE job_id = ? AND updated_at >= ?",
+            (job_id, time.time() - self.ttl)).fetchone()
+        return row[0] if row else None
+
+    def update(self, job_id, **fields):
+        """Atomically sets the given top-level fields."""
+        if not fields:
+            return
+        paths = ", ".join("?, json(?)" for _ in fields)
+        args = []
+        for key, value in fields.items():
+            args += [f"$.{key}", json.dumps(value)]
+        finished = fields.get('status') in TERMINAL_STATUSES
+        if finished:
+            self._take_chunks(job_id)
+        else:
+            self.flush_chunks(job_id)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(f"UPDATE jobs SET data = json_set(data, {paths}), updated_at = ? WHERE job_id = ?",
+                                  args + [time.time(), job_id])
+            if cursor.rowcount:
+                conn.execute("INSERT INTO job_events (job_id, kind, payload) VALUES (?, 'update', ?)",
+                             (job_id, json.dumps(fields)))
+                if finished:
+                    conn.execute("DELETE FROM job_events WHERE job_id = ? AND kind = 'chunk'", (job_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._cache_drop(job_id)
+        self._after_write()
+
+    def append_log(self, job_id, line):
+        self.flush_chunks(job_id)
+        conn = self._conn()
+        conn.execute("INSERT INTO job_events (job_id, kind, payload) VALUES (?, 'log', ?)",
+                     (job_id, json.dumps(line)))
+        conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+        self._cache_drop(job_id)
+
+    def append_chunk(self, job_id, stage, text):
+        """Records a piece of streamed output for a stage, e.g. the outreach message.
+
+        Pieces are buffered, then written as one event per stage once the
+        oldest is `chunk_interval` seconds old, or before the next log line or
+        update of the job.
+        """
+        now = time.monotonic()
+        with self._chunk_lock:
+            started_at, stages = self._chunks.setdefault(job_id, (now, {}))
+            stages.setdefault(stage, []).append(text)
+            if now - started_at < self.chunk_interval:
+                return
+            del self._chunks[job_id]
+        self._write_chunks(job_id, stages)
+
+    def flush_chunks(self, job_id):
+        """Writes the buffered pieces of a job now."""
+        stages = self._take_chunks(job_id)
+        if stages:
+            self._write_chunks(job_id, stages)
+
+    def _take_chunks(self, job_id):
+        with self._chunk_lock:
+            pending = self._chunks.pop(job_id, None)
+        return pending[1] if pending else None
+
+    def _write_chunks(self, job_id, stages):
+        self._conn().executemany("INSERT INTO job_events (job_id, kind, payload) VALUES (?, 'chunk', ?)",
+                                 [(job_id, json.dumps({'stage': stage, 'text': ''.join(pieces)}))
+                                  for stage, pieces in stages.items()])
+
+    def events_since(self, job_id, last_event_id=0):
+        """Returns [(event_id, kind, payload)] recorded after last_event_id, oldest first.
+
+        kind is 'log' (payload: the line), 'update' (payload: the fields set)
+        or 'chunk' (payload: {'stage', 'text'} of streamed output).
+        """
+        rows = self._conn().execute(
+            "SELECT id, kind, payload FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+            (job_id, last_event_id)).fetchall()
+        return [(event_id, kind, json.loads(payload)) for event_id, kind, payload in rows]
+
+    def expire(self):
+        cutoff = time.time() - self.ttl
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM job_events WHERE job_id IN (SELECT job_id FROM jobs WHERE updated_at < ?)",
+                         (cutoff,))
+            conn.execute("DELETE FROM jobs WHERE updated_at < ?", (cutoff,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_size = 0
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def _after_write(self):
+        self._writes += 1
+        if self._writes % 500 == 0:
+            self.expire()
+
+    def _cache_drop(self, job_id):
+        with self._cache_lock:
+            if job_id in self._cache:
+                self._cache_size -= len(self._cache.pop(job_id))
+
+    def _cache_put(self, job_id, job):
+        blob = json.dumps(job)
+        with self._cache_lock:
+            if job_id in self._cache:
+                self._cache_size -= len(self._cache.pop(job_id))
+            self._cache[job_id] = blob
+            self._cache_size += len(blob)
+            while self._cache_size > self.cache_bytes and self._cache:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_size -= len(evicted)
+
+class JobWriter:
+    """Single writer thread in front of a job store.
+
+    update, append_log and append_chunk return at once and are made by the
+    writer in the order they were called, so an event loop recording the
+    progress of its jobs never waits on the store's lock. flush() returns a
+    concurrent.futures.Future done once every earlier write is made. A
+    failing write is printed and skipped.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='job-writer', daemon=True)
+        self._thread.start()
+
+    def update(self, job_id, **fields):
+        # Copied now: the caller may change the dicts it passed before they are written
+        self._queue.put((self.store.update, (job_id,), json.loads(json.dumps(fields))))
+
+    def append_log(self, job_id, line):
+        self._queue.put((self.store.append_log, (job_id, line), {}))
+
+    def append_chunk(self, job_id, stage, text):
+        self._queue.put((self.store.append_chunk, (job_id, stage, text), {}))
+
+    def flush(self):
+        future = concurrent.futures.Future()
+        self._queue.put((future.set_result, (None,), {}))
+        return future
+
+    def _run(self):
+        while True:
+            fn, args, kwargs = self._queue.get()
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                print(f"Job store write failed: {e}")
+
+def create_job_store(kind, db_path, ttl, cache_bytes):
+    if kind == 'memory':
+        return MemoryJobStore(ttl=ttl)
+    if kind == 'sqlite':
+        return SQLiteJobStore(db_path, ttl=ttl, cache_bytes=cache_bytes)
+    raise ValueError(f"Unknown job store: {kind}")
@@ -0,0 +1,266 @@
+import os
+import asyncio
+import shutil
+import subprocess
+import concurrent.futures
+import hashlib
+import tempfile
+import threading
+import time
+
+# Local MiKTeX install used during development; falls back to pdflatex on PATH.
+MIKTEX_PDFLATEX = r'C:\Users\ayman\AppData\Local\Programs\MiKTeX\miktex\bin\x64\pdflatex.exe'
+
+def find_pdflatex():
+    return MIKTEX_PDFLATEX if os.path.exists(MIKTEX_PDFLATEX) else 'pdflatex'
+
+BEGIN_DOCUMENT = "\\begin{document}"
+
+def split_preamble(latex):
+    """Splits a LaTeX source into (preamble, body), body starting at \\begin{document}."""
+    if BEGIN_DOCUMENT not in latex:
+        return None, latex
+    preamble, body = latex.split(BEGIN_DOCUMENT, 1)
+    return preamble, BEGIN_DOCUMENT + body
+
+class CompileResult:
+    def __init__(self, name, pdf_path=None, returncode=None, stdout='', stderr='', error=None, elapsed=0.0):
+        self.name = name
+        self.pdf_path = pdf_path
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.error = error
+        self.elapsed = elapsed
+        self.used_format = False
+        # Name of the PDF in the store
+        self.pdf_name = None
+
+    @property
+    def ok(self):
+        return self.pdf_path is not None and self.returncode == 0
+
+class CompilePool:
+    """Runs pdflatex with its own concurrency limit, apart from the LLM executor.
+
+    Each job compiles in its own scratch directory under `build_dir` (which
+    can be on tmpfs); only the final PDF leaves it, filed into `store` (a
+    pdf_store.PDFStore) under the hash of its content.
+
+    With `use_formats`, every distinct preamble is dumped once into a
+    precompiled format (`<format_dir>/fmt_<hash>.fmt`) and jobs only typeset
+    their body against it. Any failure on that path falls back to a normal
+    full compile.
+    """
+
+    def __init__(self, store, build_dir, max_workers=None, timeout=60, cmd=None,
+                 use_formats=True, format_dir=None):
+        self.store = store
+        self.build_dir = os.path.abspath(build_dir)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.cmd = cmd or find_pdflatex()
+        self.use_formats = use_formats
+        self.format_dir = os.path.abspath(format_dir or os.path.join(os.path.dirname(self.build_dir), 'formats'))
+        self._format_locks = {}
+        self._format_locks_guard = threading.Lock()
+        self._broken_formats = set()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix='pdflatex')
+        # Limit of compile_async(), created on the event loop that uses it
+        self._async_slots = None
+        os.makedirs(self.build_dir, exist_ok=True)
+        if use_formats:
+            os.makedirs(self.format_dir, exist_ok=True)
+
+    def job_dir(self, job_id):
+        return os.path.join(self.build_dir, job_id)
+
+    def submit(self, job_id, name, latex):
+        """Queues a compile and returns a Future resolving to a CompileResult."""
+        return self._executor.submit(self.compile, job_id, name, latex)
+
+    def warm(self, latex):
+        """Builds the format for a template's preamble in the background."""
+        preamble, _ = split_preamble(latex)
+        if self.use_formats and preamble is not None:
+            self._executor.submit(self.ensure_format, preamble)
+
+    def compile(self, job_id, name, latex):
+        work_dir, jobname, preamble, body = self._prepare(job_id, name, latex)
+        fmt = self.ensure_format(preamble) if self.use_formats and preamble is not None else None
+        spent = 0.0
+        if fmt:
+            result = self._run(name, work_dir, jobname, *self._format_args(work_dir, jobname, fmt, body))
+            result.used_format = True
+            if result.ok:
+                return result
+            spent = self._format_failed(result, jobname, fmt)
+
+        result = self._run(name, work_dir, jobname, [f"{jobname}.tex"])
+        # elapsed covers the failed attempt against the format too
+        result.elapsed += spent
+        return result
+
+    async def compile_async(self, job_id, name, latex):
+        """compile() for an event loop: pdflatex runs as an asyncio subprocess,
+        at most max_workers at once across the loop's jobs."""
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_workers)
+        # File writes and hashing go to threads, so the loop only waits on pdflatex
+        work_dir, jobname, preamble, body = await asyncio.to_thread(self._prepare, job_id, name, latex)
+        fmt = None
+        if self.use_formats and preamble is not None:
+            # Only blocks on the first use of a preamble, while it is dumped
+            fmt = await asyncio.to_thread(self.ensure_format, preamble)
+        spent = 0.0
+        async with self._async_slots:
+            if fmt:
+                args = await asyncio.to_thread(self._format_args, work_dir, jobname, fmt, body)
+                result = await self._run_async(name, work_dir, jobname, *args)
+                result.used_format = True
+                if result.ok:
+                    return result
+                spent = self._format_failed(result, jobname, fmt)
+
+            result = await self._run_async(name, work_dir, jobname, [f"{jobname}.tex"])
+        result.elapsed += spent
+        return result
+
+    def _prepare(self, job_id, name, latex):
+        work_dir = self.job_dir(job_id)
+        os.makedirs(work_dir, exist_ok=True)
+        jobname = f"{name}_{job_id}"
+        # The full source is always written, for the fallback and for debugging
+        with open(os.path.join(work_dir, f"{jobname}.tex"), 'w', encoding='utf-8') as f:
+            f.write(latex)
+        preamble, body = split_preamble(latex)
+        return work_dir, jobname, preamble, body
+
+    def _format_args(self, work_dir, jobname, fmt, body):
+        """(args, env) typesetting the body against a dumped format."""
+        body_filename = f"{jobname}.body.tex"
+        with open(os.path.join(work_dir, body_filename), 'w', encoding='utf-8') as f:
+            f.write(body)
+        env = dict(os.environ, TEXFORMATS=self.format_dir + os.pathsep)
+        return [f'-fmt={fmt}', f'-jobname={jobname}', body_filename], env
+
+    def _format_failed(self, result, jobname, fmt):
+        """Handles a failed compile against a format; returns the time it took."""
+        if 'format file' in result.stdout:
+            # Dumped by another pdflatex build (or truncated): rebuild it on next use
+            self._discard_format(fmt)
+        print(f"{jobname}: compile against format {fmt} failed, falling back to a full compile.")
+        return result.elapsed
+
+    def _command(self, work_dir, args):
+        return [self.cmd, '-interaction=nonstopmode', '-output-directory', work_dir] + args
+
+    def _run(self, name, work_dir, jobname, args, env=None):
+        start = time.monotonic()
+        try:
+            proc = subprocess.run(self._command(work_dir, args),
+                                  cwd=work_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  text=True, errors='replace', timeout=self.timeout, check=False)
+        except subprocess.TimeoutExpired:
+            return CompileResult(name, error=f"timed out after {self.timeout}s",
+                                 elapsed=time.monotonic() - start)
+        except Exception as e:
+            return CompileResult(name, error=str(e), elapsed=time.monotonic() - start)
+        return self._finish(name, work_dir, jobname, proc.returncode, proc.stdout, proc.stderr,
+                            time.monotonic() - start)
+
+    async def _run_async(self, name, work_dir, jobname, args, env=None):
+        start = time.monotonic()
+        try:
+            proc = await asyncio.create_subprocess_exec(*self._command(work_dir, args), cwd=work_dir, env=env,
+                                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), self.timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                return CompileResult(name, error=f"timed out after {self.timeout}s",
+                                     elapsed=time.monotonic() - start)
+        except Exception as e:
+            return CompileResult(name, error=str(e), elapsed=time.monotonic() - start)
+        elapsed = time.monotonic() - start
+        return await asyncio.to_thread(self._finish, name, work_dir, jobname, proc.returncode,
+                                       stdout.decode('utf-8', 'replace'), stderr.decode('utf-8', 'replace'), elapsed)
+
+    def _finish(self, name, work_dir, jobname, returncode, stdout, stderr, elapsed):
+        """CompileResult of a pdflatex run; the PDF it built is moved into the store."""
+        result = CompileResult(name, returncode=returncode, stdout=stdout, stderr=stderr, elapsed=elapsed)
+        built_pdf = os.path.join(work_dir, f"{jobname}.pdf")
+        if os.path.exists(built_pdf):
+            try:
+                result.pdf_name = self.store.put(built_pdf, move=True)
+                result.pdf_path = self.store.path(result.pdf_name)
+            except OSError as e:
+                result.error = f"could not store the PDF: {e}"
+        return result
+
+    def format_name(self, preamble):
+        # The binary is part of the key: a format only loads in the pdflatex that dumped it
+        digest = hashlib.sha256(f"{self.cmd}\0{preamble}".encode('utf-8')).hexdigest()
+        return f"fmt_{digest[:16]}"
+
+    def ensure_format(self, preamble):
+        """Returns the format name for this preamble, dumping it first if needed.
+
+        Returns None when the preamble cannot be dumped; callers then compile normally.
+        """
+        fmt = self.format_name(preamble)
+        fmt_path = os.path.join(self.format_dir, f"{fmt}.fmt")
+        if os.path.exists(fmt_path):
+            return fmt
+        if fmt in self._broken_formats:
+            return None
+
+        with self._format_locks_guard:
+            lock = self._format_locks.setdefault(fmt, threading.Lock())
+        with lock:
+            if os.path.exists(fmt_path):
+                return fmt
+            if fmt in self._broken_formats:
+                return None
+            if self._dump_format(fmt, preamble):
+                return fmt
+            self._broken_formats.add(fmt)
+            return None
+
+    def _dump_format(self, fmt, preamble):
+        work_dir = tempfile.mkdtemp(prefix=f"{fmt}_", dir=self.format_dir)
+        try:
+            with open(os.path.join(work_dir, f"{fmt}.tex"), 'w', encoding='utf-8') as f:
+                f.write(preamble + "\n\\dump\n")
+            try:
+                proc = subprocess.run([self.cmd, '-ini', '-interaction=nonstopmode', f'-jobname={fmt}',
+                                       '&pdflatex', f"{fmt}.tex"],
+                                      cwd=work_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                      text=True, errors='replace', timeout=self.timeout, check=False)
+            except Exception as e:
+                print(f"Format dump {fmt} failed: {e}")
+                return False
+
+            built_fmt = os.path.join(work_dir, f"{fmt}.fmt")
+            if proc.returncode != 0 or not os.path.exists(built_fmt):
+                print(f"Format dump {fmt} failed (Code {proc.returncode}):\nSTDOUT: {proc.stdout}")
+                return False
+            # Atomic publish: concurrent processes never see a half-written format
+            os.replace(built_fmt, os.path.join(self.format_dir, f"{fmt}.fmt"))
+            return True
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _discard_format(self, fmt):
+        try:
+            os.remove(os.path.join(self.format_dir, f"{fmt}.fmt"))
+        except OSError:
+            pass
+
+    def cleanup(self, job_id):
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
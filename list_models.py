@@ -1,15 +1,15 @@
-import google.generativeai as genai
 import os
 from dotenv import load_dotenv
+from llm_client import LLMClient
 
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+    llm = LLMClient(api_key=GEMINI_API_KEY)
     
     print("Listing available models:")
-    for m in genai.list_models():
+    for m in llm.list_models():
         if 'generateContent' in m.supported_generation_methods:
             print(m.name)
 else:
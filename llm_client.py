@@ -0,0 +1,542 @@
+import os
+import asyncio
+import contextlib
+import concurrent.futures
+import json
+import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+import sqlite_tuning
+
+DEFAULT_MODEL = 'gemini-2.0-flash'
+
+# Upstream trouble worth another attempt; anything else (bad request, safety block...) is final.
+# Network errors and timeouts of the REST transport are OSErrors.
+RETRYABLE_ERRORS = (api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted,
+                    api_exceptions.ServiceUnavailable, api_exceptions.InternalServerError,
+                    api_exceptions.GatewayTimeout, api_exceptions.DeadlineExceeded,
+                    concurrent.futures.TimeoutError, OSError)
+
+class LLMUnavailable(Exception):
+    """Raised without calling Gemini while the circuit breaker is open."""
+
+class LLMDeadlineExceeded(Exception):
+    """The call did not succeed within its deadline."""
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls are refused at once for `reset_timeout` seconds. Then a single
+    trial call is let through: its success closes the circuit, its failure
+    opens it again. A trial that ends without a verdict (a refused request,
+    a cancelled call) is handed back with release() for the next caller.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half-open' if self._probing else 'open'
+
+    def retry_in(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(self._opened_at + self.reset_timeout - time.monotonic(), 0)
+
+    def allow(self):
+        """Whether a call may be made now: True, False, or 'probe' for the trial
+        call of a half-open circuit, which the caller must end with
+        record_success(), record_failure() or release()."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._probing and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._probing = True
+                return 'probe'
+            return False
+
+    def release(self):
+        """Lets the next caller make the trial call instead."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or (self._opened_at is None and self.failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+class LatencyTracker:
+    """Durations of the last `window` successful calls."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+class ResponseCache:
+    """Two-tier memo of LLM responses: an in-memory LRU in front of SQLite.
+
+    The memory tier holds at most `max_memory_entries` responses. The disk
+    tier keeps up to `max_disk_entries` rows, each valid for `ttl` seconds,
+    and is shared by every process using the same `db_path`.
+    """
+
+    def __init__(self, db_path, max_memory_entries=256, max_disk_entries=10000, ttl=7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            sqlite_tuning.enable_wal(conn)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_access ON responses (last_access)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite_tuning.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(model, prompt, generation_config=None):
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        config = json.dumps(generation_config or {}, sort_keys=True)
+        return hashlib.sha256(f"{model}\0{prompt_hash}\0{config}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[1] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+
+        with self._connect() as conn:
+            row = conn.execute("SELECT text, created_at FROM responses WHERE key = ? AND created_at >= ?",
+                               (key, now - self.ttl)).fetchone()
+            if row:
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+
+        with self._lock:
+            if row:
+                self.disk_hits += 1
+                self._remember(key, row[0], row[1])
+                return row[0]
+            self.misses += 1
+        return None
+
+    def put(self, key, model, text):
+        now = time.time()
+        with self._lock:
+            self._remember(key, text, now)
+            self._puts_since_evict += 1
+            evict = self._puts_since_evict >= 100
+            if evict:
+                self._puts_since_evict = 0
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses (key, model, text, created_at, last_access) "
+                         "VALUES (?, ?, ?, ?, ?)", (key, model, text, now, now))
+        if evict:
+            self.evict()
+
+    def _remember(self, key, text, created_at):
+        # Caller holds self._lock
+        self._memory[key] = (text, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def evict(self):
+        """Drops expired rows, then the least recently used ones beyond max_disk_entries."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+            conn.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )""", (self.max_disk_entries,))
+
+    def stats(self):
+        with self._connect() as conn:
+            disk_entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_entries': disk_entries,
+            }
+
+class LLMClient:
+    """Single entry point for Gemini calls, memoized through a ResponseCache.
+
+    Responses are keyed on (model, prompt hash, generation config), so any
+    prompt repeated across jobs, such as the analysis of the same CV against
+    the same posting in another language, is answered from the cache.
+
+    Upstream calls are bounded: each attempt times out after
+    `attempt_timeout` seconds and the whole call after its deadline.
+    Throttling, server errors and timeouts are retried up to `max_attempts`
+    times with jittered exponential backoff. With `hedge`, a call still
+    running after the recent p95 latency (at least `hedge_min_delay`) gets
+    a second, identical request, and the first answer wins. An optional
+    CircuitBreaker refuses calls at once while Gemini keeps failing.
+    `api_endpoint` points the client at another server, such as
+    fake_gemini.py, over REST.
+
+    One client is meant to serve the whole process: model handles are
+    created once per model name and share the SDK's connection pool across
+    threads.
+
+    agenerate() is the same call for coroutines, at most `max_async_calls`
+    at a time. It is natively asynchronous over gRPC; the SDK has no
+    asynchronous REST transport, so with `api_endpoint` its requests are
+    made by a pool of that many threads instead.
+    """
+
+    HEDGE_MIN_SAMPLES = 20
+
+    def __init__(self, api_key=None, cache=None, default_model=DEFAULT_MODEL, api_endpoint=None,
+                 deadline=120.0, attempt_timeout=60.0, max_attempts=4, backoff_base=0.5, backoff_cap=8.0,
+                 hedge=False, hedge_min_delay=2.0, breaker=None, max_async_calls=64):
+        if api_endpoint:
+            genai.configure(api_key=api_key or 'unused', transport='rest',
+                            client_options={'api_endpoint': api_endpoint})
+        elif api_key:
+            genai.configure(api_key=api_key)
+        self.cache = cache
+        self.default_model = default_model
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker
+        self.native_async = not api_endpoint
+        self.max_async_calls = max_async_calls
+        self._async_slots = None
+        self._async_pool = None
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._models = {}
+        self._hedge_pool = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix='llm-hedge') \
+            if hedge else None
+
+    def model(self, name):
+        """The shared genai.GenerativeModel for a model name."""
+        gemini = self._models.get(name)
+        if gemini is None:
+            with self._lock:
+                gemini = self._models.setdefault(name, genai.GenerativeModel(name))
+        return gemini
+
+    def _count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def generate(self, prompt, model=None, generation_config=None, bypass_cache=False, on_chunk=None,
+                 deadline=None):
+        """Returns the response text for a prompt.
+
+        With bypass_cache the cached answer is ignored, but the fresh one
+        still replaces it. With on_chunk the response is streamed and each
+        piece of text is passed to on_chunk as it arrives (a cached answer
+        arrives as a single chunk); a stream that fails midway is not
+        retried, as its start was already passed on. `deadline` (seconds)
+        overrides the client's default.
+
+        Raises LLMUnavailable while the circuit is open and
+        LLMDeadlineExceeded once the deadline is spent.
+        """
+        model = model or self.default_model
+        key = ResponseCache.make_key(model, prompt, generation_config) if self.cache else None
+        if key and not bypass_cache:
+            text = self.cache.get(key)
+            if text is not None:
+                if on_chunk:
+                    on_chunk(text)
+                return text
+
+        gemini = self.model(model)
+        deadline = deadline or self.deadline
+        deadline_at = time.monotonic() + deadline
+        streamed = []
+        attempt = 0
+        while True:
+            timeout, probe = self._attempt_timeout(deadline_at, deadline)
+            try:
+                if on_chunk:
+                    text = self._stream(gemini, prompt, generation_config, timeout, on_chunk, streamed)
+                elif self.hedge:
+                    text = self._hedged(gemini, prompt, generation_config, timeout)
+                else:
+                    text = self._call(gemini, prompt, generation_config, timeout)
+                if self.breaker:
+                    self.breaker.record_success()
+                probe = False
+                break
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                probe = False
+                pause = self._retry_pause(e, attempt, deadline_at, deadline, streamed)
+                if pause is None:
+                    raise
+                time.sleep(pause)
+            finally:
+                if probe:
+                    # A refused request or an interrupted call says nothing about an outage
+                    self.breaker.release()
+        return self._answered(key, model, text)
+
+    async def agenerate(self, prompt, model=None, generation_config=None, bypass_cache=False, on_chunk=None,
+                        deadline=None):
+        """generate() as a coroutine, with the same cache, retries, deadline and
+        circuit breaker (hedging is left to the threaded path)."""
+        model = model or self.default_model
+        key = ResponseCache.make_key(model, prompt, generation_config) if self.cache else None
+        if key and not bypass_cache:
+            # The cache is SQLite: read and write it off the event loop
+            text = await asyncio.to_thread(self.cache.get, key)
+            if text is not None:
+                if on_chunk:
+                    on_chunk(text)
+                return text
+
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_async_calls)
+        gemini = self.model(model)
+        deadline = deadline or self.deadline
+        deadline_at = time.monotonic() + deadline
+        streamed = []
+        attempt = 0
+        while True:
+            timeout, probe = self._attempt_timeout(deadline_at, deadline)
+            try:
+                async with self._async_slots:
+                    if not self.native_async:
+                        call = (self._stream, gemini, prompt, generation_config, timeout, on_chunk, streamed) \
+                            if on_chunk else (self._call, gemini, prompt, generation_config, timeout)
+                        text = await asyncio.get_running_loop().run_in_executor(self._blocking_pool(), *call)
+                    elif on_chunk:
+                        text = await asyncio.wait_for(
+                            self._astream(gemini, prompt, generation_config, timeout, on_chunk, streamed), timeout)
+                    else:
+                        text = await asyncio.wait_for(self._acall(gemini, prompt, generation_config, timeout),
+                                                      timeout)
+                if self.breaker:
+                    self.breaker.record_success()
+                probe = False
+                break
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                probe = False
+                pause = self._retry_pause(e, attempt, deadline_at, deadline, streamed)
+                if pause is None:
+                    raise
+                await asyncio.sleep(pause)
+            finally:
+                # Also reached on cancellation, which no except clause sees
+                if probe:
+                    self.breaker.release()
+        return await asyncio.to_thread(self._answered, key, model, text) if key else text
+
+    def _attempt_timeout(self, deadline_at, deadline):
+        """(seconds the next attempt may take, whether it is the breaker's trial
+        call); raises if no attempt may be made."""
+        timeout = min(self.attempt_timeout, deadline_at - time.monotonic())
+        if timeout <= 0:
+            raise LLMDeadlineExceeded(f"No answer from Gemini within {deadline:.0f}s.")
+        allowed = self.breaker.allow() if self.breaker else True
+        if not allowed:
+            raise LLMUnavailable(f"Gemini is failing, calls are paused for {self.breaker.retry_in():.0f}s.")
+        return timeout, allowed == 'probe'
+
+    def _retry_pause(self, error, attempt, deadline_at, deadline, streamed):
+        """Records a retryable failure and returns the pause before the next
+        attempt, or None when the error is final."""
+        self._count('failures')
+        if self.breaker:
+            self.breaker.record_failure()
+        pause = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if attempt >= self.max_attempts or streamed:
+            return None
+        if time.monotonic() + pause >= deadline_at:
+            raise LLMDeadlineExceeded(f"No answer from Gemini within {deadline:.0f}s "
+                                      f"({type(error).__name__}: {error}).") from error
+        print(f"Gemini call failed ({type(error).__name__}: {error}), retrying in {pause:.1f}s")
+        self._count('retries')
+        return pause
+
+    def _answered(self, key, model, text):
+        if key and text:
+            self.cache.put(key, model, text)
+        return text
+
+    def _call(self, gemini, prompt, generation_config, timeout):
+        start = time.monotonic()
+        self._count('calls')
+        text = gemini.generate_content(prompt, generation_config=generation_config,
+                                       request_options={'timeout': timeout, 'retry': None}).text
+        self.latency.add(time.monotonic() - start)
+        return text
+
+    def _stream(self, gemini, prompt, generation_config, timeout, on_chunk, parts):
+        self._count('calls')
+        for chunk in gemini.generate_content(prompt, generation_config=generation_config, stream=True,
+                                             request_options={'timeout': timeout, 'retry': None}):
+            try:
+                piece = chunk.text
+            except ValueError:
+                # Chunks carrying only safety ratings or a finish reason have no text
+                continue
+            if piece:
+                parts.append(piece)
+                on_chunk(piece)
+        return ''.join(parts)
+
+    async def _acall(self, gemini, prompt, generation_config, timeout):
+        start = time.monotonic()
+        self._count('calls')
+        response = await gemini.generate_content_async(prompt, generation_config=generation_config,
+                                                       request_options={'timeout': timeout, 'retry': None})
+        self.latency.add(time.monotonic() - start)
+        return response.text
+
+    async def _astream(self, gemini, prompt, generation_config, timeout, on_chunk, parts):
+        self._count('calls')
+        response = await gemini.generate_content_async(prompt, generation_config=generation_config, stream=True,
+                                                       request_options={'timeout': timeout, 'retry': None})
+        async for chunk in response:
+            try:
+                piece = chunk.text
+            except ValueError:
+                continue
+            if piece:
+                parts.append(piece)
+                on_chunk(piece)
+        return ''.join(parts)
+
+    def _blocking_pool(self):
+        if self._async_pool is None:
+            with self._lock:
+                if self._async_pool is None:
+                    self._async_pool = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.max_async_calls, thread_name_prefix='llm-rest')
+        return self._async_pool
+
+    def hedge_delay(self):
+        """Seconds before a call gets a hedged twin: the recent p95, once enough calls were seen."""
+        if len(self.latency) < self.HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.latency.quantile(0.95), self.hedge_min_delay)
+
+    def _hedged(self, gemini, prompt, generation_config, timeout):
+        first = self._hedge_pool.submit(self._call, gemini, prompt, generation_config, timeout)
+        delay = self.hedge_delay()
+        if delay is None or delay >= timeout:
+            return first.result()
+        done, _ = concurrent.futures.wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        self._count('hedges')
+        second = self._hedge_pool.submit(self._call, gemini, prompt, generation_config, timeout - delay)
+        error = None
+        # The slower request is left to finish on its own; its answer is dropped
+        for future in concurrent.futures.as_completed([first, second]):
+            try:
+                text = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            if future is second:
+                self._count('hedge_wins')
+            return text
+        raise error
+
+    def list_models(self):
+        return list(genai.list_models())
+
+    def stats(self):
+        p50, p95 = self.latency.quantile(0.5), self.latency.quantile(0.95)
+        stats = {
+            'upstream_calls': self.calls,
+            'upstream_failures': self.failures,
+            'retries': self.retries,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'latency_p50': round(p50, 3) if p50 is not None else None,
+            'latency_p95': round(p95, 3) if p95 is not None else None,
+        }
+        if self.breaker:
+            stats.update(breaker=self.breaker.state, breaker_opened=self.breaker.opened)
+        if self.cache:
+            stats.update(self.cache.stats())
+        return stats
@@ -0,0 +1,159 @@
+"""In-process metrics, rendered in the Prometheus text exposition format.
+
+Each process keeps its own figures: the web app serves them at /metrics and
+a standalone worker on the port given to `worker.py --metrics-port`.
+
+    STAGE_SECONDS = registry.histogram('stage_seconds', "Time spent per stage.", ['stage'])
+    with span(STAGE_SECONDS, 'cv', timings):
+        ...
+"""
+import contextlib
+import math
+import threading
+import time
+
+# Seconds; from a cached lookup to a slow LLM call with retries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), fn=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # fn() returns the value, or {label values tuple: value} when there are labels
+        self.fn = fn
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """(suffix, label values, extra labels, value) of every series."""
+        if self.fn is None:
+            with self._lock:
+                values = dict(self._values)
+        else:
+            values = self.fn()
+            if not isinstance(values, dict):
+                values = {(): values}
+        return [('', key, (), value) for key, value in sorted(values.items()) if value is not None]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(self.labelnames, key, extra)} {format_value(value)}")
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Count per bucket (not cumulative yet), then sum and count
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: ([*counts], total, count) for key, (counts, total, count) in self._values.items()}
+        samples = []
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                samples.append(('_bucket', key, (('le', format_value(bound)),), cumulative))
+            samples.append(('_sum', key, (), total))
+            samples.append(('_count', key, (), count))
+        return samples
+
+class Registry:
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=(), fn=None):
+        return self._add(Counter(self.prefix + name, documentation, labelnames, fn=fn))
+
+    def gauge(self, name, documentation, labelnames=(), fn=None):
+        return self._add(Gauge(self.prefix + name, documentation, labelnames, fn=fn))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self.prefix + name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Every metric in the text exposition format (version 0.0.4)."""
+        blocks = []
+        for metric in self._metrics:
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                # One failing callback (e.g. a locked database) must not hide the others
+                print(f"Metric {metric.name} failed: {e}")
+        return '\n'.join(blocks) + '\n'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+@contextlib.contextmanager
+def span(histogram, stage, timings=None, **labels):
+    """Times the block into `histogram` (labelled stage=...) and, when given,
+    adds the seconds to timings[stage], the breakdown of one job. The time is
+    recorded even when the block raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, stage=stage, **labels)
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0) + elapsed, 3)
@@ -0,0 +1,152 @@
+import os
+import contextlib
+import hashlib
+import json
+import tempfile
+import threading
+import time
+
+# Stages of a job that call Gemini ('artifacts' is the single structured call)
+STAGES = ('analysis', 'cv', 'cl', 'message', 'artifacts')
+# Generation settings a route may set
+GENERATION_KEYS = ('temperature', 'top_p', 'top_k', 'max_output_tokens', 'stop_sequences')
+# Families listed by the API that cannot answer text prompts
+NON_TEXT_PREFIXES = ('embedding', 'text-embedding', 'gemini-embedding', 'aqa', 'imagen', 'veo')
+
+def model_id(name):
+    return name[len('models/'):] if name.startswith('models/') else name
+
+def load_catalog(path):
+    """Names of the models that can generate text, from a list written by
+    debug_models.py: one `models/<name>` per line, optionally followed by a
+    tab and its comma-separated generation methods. None if there is no list."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    catalog = set()
+    for line in lines:
+        name, _, methods = line.strip().partition('\t')
+        if not name:
+            continue
+        name = model_id(name)
+        if methods:
+            if 'generateContent' in methods.split(','):
+                catalog.add(name)
+        elif not name.startswith(NON_TEXT_PREFIXES):
+            catalog.add(name)
+    return catalog
+
+class ModelRegistry:
+    """Which model, with which generation settings, answers each stage.
+
+    A route is a model name, or an object such as
+    {"model": "gemini-2.0-flash-lite", "max_output_tokens": 512}. Stages
+    without a route use `default_model`. `routes` (LLM_STAGE_MODELS) are
+    the configured ones; overrides set at runtime are kept in
+    `overrides_path`, which every process on the host re-reads within
+    `check_interval` seconds of a change. Models must be in `catalog` when
+    one is given.
+    """
+
+    def __init__(self, default_model, routes=None, catalog=None, overrides_path=None, check_interval=2.0):
+        self.catalog = catalog
+        self.default_model = self.check_model(model_id(default_model))
+        self.routes = self.normalize(routes or {})
+        self.overrides_path = overrides_path
+        self.check_interval = check_interval
+        self.overrides = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._reload()
+
+    def check_model(self, name):
+        if self.catalog is not None and name not in self.catalog:
+            raise ValueError(f"Unknown model '{name}': not in the model catalog (available_models.txt).")
+        return name
+
+    def normalize(self, routes):
+        """Validates routes and returns them as {stage: {'model': ..., 'generation_config': {...}}}."""
+        if not isinstance(routes, dict):
+            raise ValueError("Routes must be an object mapping stages to models.")
+        normalized = {}
+        for stage, route in routes.items():
+            if stage not in STAGES:
+                raise ValueError(f"Unknown stage '{stage}' (expected one of {', '.join(STAGES)}).")
+            if isinstance(route, str):
+                route = {'model': route}
+            if not isinstance(route, dict):
+                raise ValueError(f"The route of '{stage}' must be a model name or an object.")
+            unknown = set(route) - {'model', *GENERATION_KEYS}
+            if unknown:
+                raise ValueError(f"Unknown settings for '{stage}': {', '.join(sorted(unknown))}.")
+            model = self.check_model(model_id(route.get('model') or self.default_model))
+            normalized[stage] = {'model': model,
+                                 'generation_config': {key: route[key] for key in GENERATION_KEYS if key in route}}
+        return normalized
+
+    def _reload(self):
+        """Re-reads the overrides file if it changed."""
+        if not self.overrides_path:
+            return
+        try:
+            mtime = os.stat(self.overrides_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        if mtime is None:
+            self.overrides = {}
+            return
+        try:
+            with open(self.overrides_path, 'r', encoding='utf-8') as f:
+                self.overrides = self.normalize(json.load(f))
+        except (OSError, ValueError) as e:
+            # Keep routing with the previous overrides
+            print(f"Ignoring model routes in {self.overrides_path}: {e}")
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                self._checked_at = now
+                self._reload()
+
+    def effective(self):
+        """Routes of every stage, overrides applied."""
+        self._refresh()
+        default = {'model': self.default_model, 'generation_config': {}}
+        return {stage: self.overrides.get(stage) or self.routes.get(stage) or default for stage in STAGES}
+
+    def route(self, stage):
+        """(model, generation settings) for a stage."""
+        route = self.effective()[stage]
+        return route['model'], dict(route['generation_config'])
+
+    def set_overrides(self, routes):
+        """Replaces the runtime overrides (an empty dict clears them) for every process."""
+        overrides = self.normalize(routes)
+        if self.overrides_path:
+            directory = os.path.dirname(self.overrides_path) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({stage: {'model': route['model'], **route['generation_config']}
+                               for stage, route in overrides.items()}, f, indent=2)
+                os.replace(tmp_path, self.overrides_path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+                raise
+        with self._lock:
+            self.overrides = overrides
+            self._mtime = os.stat(self.overrides_path).st_mtime_ns if self.overrides_path else None
+        return self.effective()
+
+    def signature(self):
+        """Short digest of the effective routes, for keys of results that depend on them."""
+        encoded = json.dumps(self.effective(), sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()[:12]
@@ -0,0 +1,102 @@
+import os
+import contextlib
+import hashlib
+import re
+import shutil
+import tempfile
+import time
+
+CHUNK_SIZE = 64 * 1024
+DIGEST_NAME_RE = re.compile(r"^[0-9a-f]{64}\.pdf$")
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class PDFStore:
+    """Content-addressed store of the generated PDFs.
+
+    A PDF is filed under the SHA-256 of its bytes as `root/ab/cd/<sha>.pdf`,
+    so no directory grows past a few hundred entries and identical documents
+    are kept once. The name `<sha>.pdf` is what jobs, Application.cv_path
+    and /view/<name> refer to. Names from before the store (`CV_<job_id>.pdf`)
+    are looked up flat in `legacy_dir`.
+    """
+
+    def __init__(self, root, legacy_dir=None):
+        self.root = root
+        self.legacy_dir = legacy_dir
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name):
+        if DIGEST_NAME_RE.match(name):
+            return os.path.join(self.root, name[:2], name[2:4], name)
+        return os.path.join(self.legacy_dir or self.root, os.path.basename(name))
+
+    def exists(self, name):
+        return bool(name) and os.path.exists(self.path(name))
+
+    def put(self, src, move=False):
+        """Files a PDF into the store and returns its name.
+
+        With `move` the source is consumed (renamed when it is on the same
+        file system, copied otherwise). Storing content that is already
+        there only refreshes its modification time, which the janitor reads
+        as last use.
+        """
+        name = file_sha256(src) + '.pdf'
+        dest = self.path(name)
+        if os.path.exists(dest):
+            os.utime(dest)
+            if move:
+                os.remove(src)
+            return name
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if move:
+            with contextlib.suppress(OSError):
+                os.replace(src, dest)
+                return name
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest), suffix='.part')
+        os.close(fd)
+        try:
+            shutil.copyfile(src, tmp_path)
+            os.replace(tmp_path, dest)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+        if move:
+            os.remove(src)
+        return name
+
+    def files(self):
+        """Yields (name, path, size, mtime) of every stored PDF, legacy ones included."""
+        roots = [self.root] + ([self.legacy_dir] if self.legacy_dir and self.legacy_dir != self.root else [])
+        for top in roots:
+            sharded = top == self.root
+            for dirpath, dirnames, filenames in os.walk(top):
+                if not sharded:
+                    dirnames[:] = []
+                for filename in filenames:
+                    if not filename.endswith('.pdf'):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    with contextlib.suppress(OSError):
+                        st = os.stat(path)
+                        yield filename, path, st.st_size, st.st_mtime
+
+    def remove(self, name, min_age=0):
+        """Deletes a stored PDF unless it was stored or reused in the last `min_age` seconds.
+        Returns the bytes freed."""
+        path = self.path(name)
+        try:
+            st = os.stat(path)
+            if time.time() - st.st_mtime < min_age:
+                return 0
+            os.remove(path)
+            return st.st_size
+        except OSError:
+            return 0
@@ -0,0 +1,302 @@
+import re
+import functools
+from latex_compiler import split_preamble
+from ats_scorer import Document
+
+# Part of the result cache key: bump when prompts change what a run produces
+PROMPT_VERSION = 3
+
+def estimate_tokens(text):
+    """Rough Gemini token count (about 4 characters per token), without an API call."""
+    return (len(text or '') + 3) // 4
+
+COMMAND_RE = re.compile(r"\\(?:re)?newcommand\s*\{?\\(\w+)\}?\s*(?:\[(\d)\])?")
+COMMENT_RE = re.compile(r"(?<!\\)%.*$", re.MULTILINE)
+
+def strip_comments(latex):
+    lines = [line.rstrip() for line in COMMENT_RE.sub('', latex).splitlines()]
+    return '\n'.join(line for line in lines if line.strip())
+
+@functools.lru_cache(maxsize=16)
+def template_digest(template):
+    """Compact stand-in for a LaTeX template in prompts.
+
+    Lists the custom commands the preamble defines, with their arity, and a
+    skeleton of the body: comments dropped and the example prose cut short,
+    so the structure and commands to reuse stay visible without the
+    preamble's packages, colours and TikZ code.
+    """
+    preamble, body = split_preamble(template)
+    if preamble is None:
+        return strip_comments(template)
+
+    commands = []
+    for name, arity in COMMAND_RE.findall(preamble):
+        args = ''.join(f"{{#{i}}}" for i in range(1, int(arity or 0) + 1))
+        commands.append(f"\\{name}{args}")
+
+    skeleton = []
+    for line in strip_comments(body).splitlines():
+        line = line.strip()
+        if line.startswith(('\\begin{document}', '\\end{document}')):
+            continue
+        if not line.startswith(('\\', '{', '}')) and len(line) > 60:
+            line = line[:60].rsplit(' ', 1)[0] + ' ...'
+        skeleton.append(line)
+
+    return ("Custom commands (defined in the preamble, use them as is):\n"
+            + '\n'.join(commands)
+            + "\n\nBody skeleton (example content shortened):\n"
+            + '\n'.join(skeleton))
+
+# Longer lines are cut at spaces before ranking, e.g. a PDF whose text was extracted as a single line
+MAX_LINE_CHARS = 300
+
+def split_line(line, max_chars=MAX_LINE_CHARS):
+    pieces = []
+    while len(line) > max_chars:
+        cut = line.rfind(' ', 0, max_chars + 1)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(line[:cut].rstrip())
+        line = line[cut:].lstrip()
+    if line:
+        pieces.append(line)
+    return pieces
+
+def truncate_to_budget(text, token_budget):
+    """The start of text within token_budget tokens, cut at a space when there is one nearby."""
+    max_chars = max(token_budget, 0) * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(' ', max_chars // 2, max_chars + 1)
+    return text[:cut if cut > 0 else max_chars].rstrip()
+
+def condense_cv(cv_text, token_budget, job_description=''):
+    """Fits a CV into token_budget tokens.
+
+    Whitespace is collapsed first; if that is not enough, lines longer than
+    MAX_LINE_CHARS are cut into pieces, the opening lines (name and contact
+    details) are kept as far as they fit and the remaining lines most
+    related to the job description are kept in their original order. When
+    not even the first line fits, the text is cut to the budget.
+    """
+    text = re.sub(r"[ \t]+", ' ', cv_text or '')
+    text = re.sub(r"\n\s*\n+", '\n\n', text).strip()
+    if estimate_tokens(text) <= token_budget:
+        return text
+
+    lines = [piece for line in text.splitlines() if line.strip() for piece in split_line(line.strip())]
+    head = []
+    remaining = token_budget
+    for line in lines[:5]:
+        cost = estimate_tokens(line) + 1
+        if cost > remaining:
+            break
+        head.append(line)
+        remaining -= cost
+    rest = lines[len(head):]
+    job_terms = Document(job_description).terms
+    ranked = sorted(range(len(rest)),
+                    key=lambda i: -sum(count for term, count in Document(rest[i]).terms.items()
+                                       if term in job_terms))
+    keep = set()
+    for i in ranked:
+        cost = estimate_tokens(rest[i]) + 1
+        if cost <= remaining:
+            keep.add(i)
+            remaining -= cost
+    condensed = '\n'.join(head + [line for i, line in enumerate(rest) if i in keep])
+    if not condensed:
+        return truncate_to_budget(text, token_budget)
+    return condensed
+
+ANALYSIS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'job_title': {'type': 'string'},
+        'company': {'type': 'string'},
+        'ats_score': {'type': 'integer'},
+        'missing_keywords': {'type': 'array', 'items': {'type': 'string'}},
+        'cv_improvements': {'type': 'string'},
+    },
+    'required': ['job_title', 'company', 'ats_score', 'missing_keywords', 'cv_improvements'],
+}
+
+ARTIFACT_SCHEMAS = {
+    'analysis': ANALYSIS_SCHEMA,
+    'cv_body': {'type': 'string'},
+    'cl_body': {'type': 'string'},
+    'message': {'type': 'string'},
+}
+
+def artifacts_config(fields):
+    """Generation config asking Gemini for a JSON object holding exactly these fields."""
+    return {
+        'response_mime_type': 'application/json',
+        'response_schema': {
+            'type': 'object',
+            'properties': {field: ARTIFACT_SCHEMAS[field] for field in fields},
+            'required': list(fields),
+        },
+    }
+
+class PromptBuilder:
+    """Builds the prompts of one job from shared parts.
+
+    The CV is condensed once under `cv_token_budget` and reused by every
+    stage; with `digest_templates` the LaTeX templates are replaced by their
+    template_digest().
+    """
+
+    def __init__(self, job_description, cv_text, cv_token_budget=2000, digest_templates=True):
+        self.job_description = (job_description or '').strip()
+        self.cv_text = condense_cv(cv_text, cv_token_budget, self.job_description)
+        self.digest_templates = digest_templates
+
+    def _template(self, template):
+        return template_digest(template) if self.digest_templates else template
+
+    def analysis(self):
+        return f"""
+        Act as an expert ATS (Applicant Tracking System) scanner.
+        Compare the following CV against the Job Description.
+
+        JOB DESCRIPTION:
+        {self.job_description}
+
+        CV CONTENT:
+        {self.cv_text}
+
+        Return a ONLY a JSON object with this exact structure:
+        {{
+            "job_title": "extracted job title",
+            "company": "extracted company name",
+            "ats_score": 85,
+            "missing_keywords": ["keyword1", "keyword2", "keyword3"],
+            "cv_improvements": "Short summary of what to change in the CV content to target this job."
+        }}
+        """
+
+    def cv_body(self, cv_template, language):
+        return f"""
+    You are an expert CV tailor.
+    I have a Master CV (Markdown) containing all my experiences, and a Job Description.
+    I also have a LaTeX CV template.
+
+    Your task is to rewrite the BODY of the LaTeX CV to target the Job Description, using the data from the Master CV.
+
+    GUIDELINES:
+    1. **Strict Structure**: You MUST use the exact LaTeX commands and structure defined in the template (e.g., use the defined \\entry and \\project commands).
+    2. **Content**: Select the most relevant projects/experiences. Rewrite the 'Profile' and 'Title'.
+    3. **No Markdown**: Do NOT use markdown formatting (no **, no # headers). Use LaTeX commands (\\textbf{{...}}).
+    4. **Language**: Write strictly in {language.upper()}.
+    5. **Reference**: Do strictly follow the template's custom commands.
+    6. **ONE PAGE ONLY**: Keep it concise.
+    7. **Output Format**: generate ONLY the LaTeX content for the body. Do NOT include \\documentclass, preamble, \\begin{{document}} or \\end{{document}}.
+
+    Master CV (Source of Truth):
+    {self.cv_text}
+
+    Job Description:
+    {self.job_description}
+
+    LaTeX CV Template (Structure to follow):
+    {self._template(cv_template)}
+
+    Return ONLY the content that goes INSIDE \\begin{{document}} ... \\end{{document}}.
+    """
+
+    def cl_body(self, cl_template, language):
+        return f"""
+    You are an expert career coach.
+    Write a professional Cover Letter body for the attached Job Description.
+
+    JOB DESCRIPTION:
+    {self.job_description}
+
+    CANDIDATE CV:
+    {self.cv_text}
+
+    TEMPLATE CONTEXT:
+    {self._template(cl_template)}
+
+    INSTRUCTIONS:
+    1. **Format**: Use the exact commands from the template (e.g., \\opening, \\closing).
+    2. **Content**: Write 3 paragraphs explaining why the candidate is a fit.
+    3. **Style**: Professional and enthusiastic. Write strictly in {language.upper()}.
+    4. **Output**: Return ONLY the body content (from \\opening to \\closing). Do NOT include \\documentclass or \\begin{{document}}.
+    """
+
+    def artifacts(self, cv_template, cl_template, language, fields):
+        """One prompt for several outputs at once, the CV and job description sent a single time.
+
+        fields is any subset of ARTIFACT_SCHEMAS, so a retry can ask only for
+        the fields that came back invalid.
+        """
+        lang_name = "French" if language == 'fr' else "English"
+        tasks = []
+        if 'analysis' in fields:
+            tasks.append("""
+    "analysis": act as an expert ATS (Applicant Tracking System) scanner and compare the CV against the job:
+        job_title and company extracted from the job description, ats_score from 0 to 100,
+        missing_keywords the CV lacks, and cv_improvements, a short summary of what to change in the CV.""")
+        if 'cv_body' in fields:
+            tasks.append(f"""
+    "cv_body": the BODY of the LaTeX CV rewritten to target the job, using the data from the Master CV.
+        - You MUST use the exact LaTeX commands and structure of the template below (e.g. \\entry and \\project).
+        - Select the most relevant projects/experiences. Rewrite the 'Profile' and 'Title'.
+        - No markdown (no **, no # headers): use LaTeX commands (\\textbf{{...}}). ONE PAGE ONLY.
+        - Only what goes INSIDE \\begin{{document}} ... \\end{{document}}, without \\documentclass or preamble.
+        - Write strictly in {language.upper()}.
+        LaTeX CV Template (Structure to follow):
+        {self._template(cv_template)}""")
+        if 'cl_body' in fields:
+            tasks.append(f"""
+    "cl_body": a professional cover letter body, from \\opening to \\closing, using the exact commands of the template below.
+        - 3 paragraphs explaining why the candidate is a fit. Professional and enthusiastic.
+        - No \\documentclass or \\begin{{document}}. Write strictly in {language.upper()}.
+        TEMPLATE CONTEXT:
+        {self._template(cl_template)}""")
+        if 'message' in fields:
+            tasks.append(f"""
+    "message": a short, engaging LinkedIn outreach message (<1000 chars, Subject + Body) from the candidate to a recruiter.
+        - Write strictly in {lang_name}. Professional, brief, and not robotic.
+        - No placeholders: candidate name from the CV (else "The Candidate"), recruiter "Hiring Team"
+          (unless a name is in the job description), company from the job description, real skills from the CV.""")
+
+        return f"""
+    You are an expert career coach and CV tailor.
+    Using the candidate's Master CV and the Job Description below, produce one JSON object with these fields:
+    {''.join(tasks)}
+
+    Master CV (Source of Truth):
+    {self.cv_text}
+
+    Job Description:
+    {self.job_description}
+
+    Return ONLY the JSON object with the fields {', '.join(fields)}. LaTeX backslashes must be escaped as JSON requires.
+    """
+
+    def message(self, language):
+        lang_name = "French" if language == 'fr' else "English"
+        return f"""
+        Act as the candidate described in the CV.
+        Write a short, engaging LinkedIn outreach message (<1000 chars) to a recruiter for this Job.
+
+        CONTEXT:
+        - My CV: {self.cv_text}
+        - Job Description: {self.job_description}
+
+        INSTRUCTIONS:
+        1. **Language**: Write strictly in {lang_name}.
+        2. **No Placeholders**: You MUST fill in the names/skills/company.
+           - Candidate Name: Extract from CV (if not found, use "The Candidate").
+           - Recruiter Name: "Hiring Team" (unless specific name found in JD).
+           - Company: Extract from JD.
+           - Skills: select real skills from CV relevant to JD.
+        3. **Tone**: Professional, brief, and not robotic.
+
+        Return ONLY the message text (Subject + Body).
+        """
@@ -0,0 +1,142 @@
+import os
+import contextlib
+import json
+import hashlib
+import threading
+import time
+import sqlite_tuning
+
+def sha256_text(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class ResultCache:
+    """Content-addressed cache of whole adaptation runs.
+
+    Entries are keyed on everything that determines a run's output and name
+    both PDFs in `store` (a pdf_store.PDFStore), so a hit can be served as an
+    already-completed job. Expired entries are dropped on access and the
+    least recently used ones are evicted once `max_bytes` is exceeded; their
+    PDFs are left to the janitor, as saved applications may share them.
+    """
+
+    def __init__(self, db_path, store, ttl=7 * 24 * 3600, max_bytes=512 * 1024 * 1024):
+        self.db_path = db_path
+        self.store = store
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            sqlite_tuning.enable_wal(conn)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    analysis TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    cv_pdf TEXT NOT NULL,
+                    cl_pdf TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hit_count INTEGER NOT NULL DEFAULT 0
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_results_last_access ON results (last_access)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite_tuning.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(cv_text, job_description, language, cv_template, cl_template, model_name):
+        parts = [cv_text or '', job_description or '', language or '',
+                 sha256_text(cv_template), sha256_text(cl_template), model_name]
+        return sha256_text(json.dumps(parts))
+
+    def get(self, key):
+        """Returns {'analysis', 'message', 'cv_pdf', 'cl_pdf'} for a live entry, else None."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT analysis, message, cv_pdf, cl_pdf, created_at FROM results WHERE key = ?",
+                (key,)).fetchone()
+            if row and now - row[4] <= self.ttl and self._files_exist(row[2], row[3]):
+                conn.execute("UPDATE results SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?",
+                             (now, key))
+                self._count(hit=True)
+                return {'analysis': json.loads(row[0]), 'message': row[1], 'cv_pdf': row[2], 'cl_pdf': row[3]}
+        if row:
+            # Expired, or its PDFs were removed from disk
+            self._delete(key)
+        self._count(hit=False)
+        return None
+
+    def put(self, key, cv_pdf_path, cl_pdf_path, analysis, message):
+        """Stores a completed run; its PDFs are filed into the store (a no-op when already there)."""
+        cv_pdf = self.store.put(cv_pdf_path)
+        cl_pdf = self.store.put(cl_pdf_path)
+        size = sum(os.path.getsize(self.store.path(f)) for f in (cv_pdf, cl_pdf))
+        size += len(message.encode('utf-8'))
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(key, analysis, message, cv_pdf, cl_pdf, size_bytes, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(analysis), message, cv_pdf, cl_pdf, size, now, now))
+        self.evict()
+
+    def evict(self):
+        """Drops expired entries, then least recently used ones down to max_bytes."""
+        with self._connect() as conn:
+            stale = conn.execute("SELECT key FROM results WHERE created_at < ?",
+                                 (time.time() - self.ttl,)).fetchall()
+            total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM results").fetchone()[0]
+            victims = [k for (k,) in stale]
+            if total > self.max_bytes:
+                for k, size in conn.execute("SELECT key, size_bytes FROM results ORDER BY last_access"):
+                    if total <= self.max_bytes:
+                        break
+                    if k not in victims:
+                        victims.append(k)
+                    total -= size
+        for k in victims:
+            self._delete(k)
+
+    def _delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def _files_exist(self, *filenames):
+        return all(self.store.exists(f) for f in filenames)
+
+    def referenced(self):
+        """Names of the PDFs the cache entries point to, for the janitor."""
+        with self._connect() as conn:
+            return {name for row in conn.execute("SELECT cv_pdf, cl_pdf FROM results") for name in row}
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._connect() as conn:
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM results").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'entries': entries,
+            'size_bytes': size,
+        }
@@ -1,123 +1,105 @@
-import os
-import app
-from app import adapt_cv_with_gemini, compile_latex, generate_cover_letter, generate_short_message
-
-# Job Description provided by the user
-job_description = """
-Contexte :
-Berger-Levrault mène depuis plusieurs années une démarche de numérique responsable portée par la DRIT, notamment à travers des travaux de recherche en Green IT. Des premières expérimentations ont permis de mesurer la consommation énergétique et les coûts des pipelines CI/CD, mais uniquement sur des applications de petite taille.
-
-Pour obtenir une vision représentative des environnements réels du groupe, il devient nécessaire d’étendre ces mesures à des applications plus variées et complexes, afin d'évaluer les impacts énergétiques et financiers des pratiques DevOps. 
-
-🎯 Objectif :
-Constituer un dataset structuré et représentatif pour analyse et apprentissage.
-Développer un prototype d’outil de recommandation FinOps/Green IT, basé sur les données collectées.
-Concevoir un tableau de bord de visualisation des métriques et recommandations.
- 
-🛠️ Missions :
-Exécuter et mesurer la consommation de ressources (CPU, mémoire, durée, coût, énergie, empreinte carbone estimée) lors des processus CI/CD.
-Instrumenter et exécuter des pipelines sur un panel d’applications variées (tailles, langages, architectures, charges).
-Identifier les facteurs influençant la consommation et les pistes d’optimisation afin de concevoir un moteur de recommandation.
-Étudier la transmission de l'étude au delà des pipeline CI-CD.
-
-Preferred experience
-Vous possédez des connaissances en développement logiciel et en intégration continue (Git, Jenkins, GitLab CI…).
-Vous vous intéressez aux thématiques Green IT et FinOps.Vous disposez de compétences en analyse de données (Python, Pandas, SQL, Jupyter).
-Vous avez des connaissances souhaitées en cloud computing, en monitoring (Prometheus, Grafana) ou en containers (Docker, Kubernetes).
-Vous faites preuve d’un esprit d’analyse, de rigueur, de curiosité scientifique et d’autonomie.
-Vous préparez un Master 2 et vous recherchez un stage de 6 mois débutant au printemps 2026.
+"""Batch CLI: adapts one master CV to many job descriptions.
+
+    python run_adaptation.py postings/*.txt --cv master_cv.md --language fr --concurrency 4
+
+Each posting file holds one job description, or several separated by a line
+containing only `---`. Items run through the same pipeline as the web app
+(process_job); a result line is printed as each one finishes, followed by a
+report ranked by ATS score, which is also written to --report as JSON.
+
+With --rank-only the postings are only scored with the local ATS scorer,
+without calling Gemini, to pick which ones are worth a full run.
 """
+import os
+import argparse
+import concurrent.futures
+import json
 
-def main():
-    print("Starting CV adaptation process...")
-    
-    # 1. Read LaTeX
-    cv_filename = 'CV.tex'
-    file_path = os.path.abspath(cv_filename)
-    
-    if not os.path.exists(file_path):
-        print(f"Error: {cv_filename} not found.")
-        return
+from ingest import store_upload
+
+def read_cv(path):
+    from app import app, cv_extractor
+    if path.lower().endswith('.pdf'):
+        with open(path, 'rb') as f:
+            digest, stored = store_upload(f, app.config['UPLOAD_FOLDER'])
+        return cv_extractor.extract(digest, stored)
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def read_job_descriptions(paths):
+    job_descriptions = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            parts = f.read().split('\n---\n')
+        job_descriptions += [part.strip() for part in parts if part.strip()]
+    return job_descriptions
 
-    print(f"Reading {cv_filename}...")
-    with open(file_path, 'r', encoding='utf-8') as f:
-        tex_content = f.read()
-    
-    # 1.5 Read Master CV
-    master_cv_path = os.path.abspath('master_cv.md')
-    print(f"Reading {master_cv_path}...")
-    if os.path.exists(master_cv_path):
-        with open(master_cv_path, 'r', encoding='utf-8') as f:
-            master_cv_content = f.read()
+def print_item(item):
+    if item['status'] == 'completed':
+        print(f"[{item['index'] + 1}] {item.get('ats_score')}% {item.get('job_title')} @ {item.get('company')}"
+              f" -> {item.get('cv_pdf')}, {item.get('cl_pdf')}{' (cached)' if item.get('cached') else ''}")
     else:
-        print("Warning: master_cv.md not found.")
-        master_cv_content = ""
-
-    # 2. Adapt CV with Gemini
-    print("Adapting CV with Gemini (this may take a few seconds)...")
-    try:
-        adapted_tex_content = adapt_cv_with_gemini(tex_content, job_description, master_cv_content)
-    except Exception as e:
-        print(f"Error during Gemini adaptation: {e}")
+        print(f"[{item['index'] + 1}] {item['status']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Adapt one CV to several job descriptions.")
+    parser.add_argument('postings', nargs='+', help="text files with job descriptions")
+    parser.add_argument('--cv', default='master_cv.md', help="master CV (.pdf, .md or .txt)")
+    parser.add_argument('--language', default='en', choices=['en', 'fr'])
+    parser.add_argument('--concurrency', type=int, default=3, help="items processed at once")
+    parser.add_argument('--no-cache', action='store_true', help="regenerate instead of reusing cached runs")
+    parser.add_argument('--rank-only', action='store_true', help="only rank the postings with the local ATS scorer")
+    parser.add_argument('--report', default=os.path.join('outputs', 'batch_report.json'))
+    args = parser.parse_args()
+
+    # Items are run here directly, not by the web app's queue consumers,
+    # and the stage pool is sized at import for --concurrency of them
+    os.environ['EMBEDDED_WORKERS'] = '0'
+    os.environ['JOB_THREADS'] = str(args.concurrency)
+    from app import JOBS, ats_scorer, create_batch, process_job, batch_item, batch_report
+
+    if not os.path.exists(args.cv):
+        parser.error(f"{args.cv} not found.")
+    cv_text = read_cv(args.cv)
+    job_descriptions = read_job_descriptions(args.postings)
+    if not job_descriptions:
+        parser.error("No job descriptions found.")
+
+    if args.rank_only:
+        analyses = ats_scorer.score_many(cv_text, job_descriptions)
+        ranking = sorted(enumerate(analyses), key=lambda pair: -pair[1]['ats_score'])
+        for index, analysis in ranking:
+            print(f"[{index + 1}] {analysis['ats_score']}% {analysis['job_title']} @ {analysis['company']}"
+                  f" - missing: {', '.join(analysis['missing_keywords']) or 'nothing'}")
         return
 
-    # Clean up markdown code blocks if Gemini adds them
-    if adapted_tex_content.startswith("```latex"): adapted_tex_content = adapted_tex_content[8:]
-    if adapted_tex_content.startswith("```"): adapted_tex_content = adapted_tex_content[3:]
-    if adapted_tex_content.endswith("```"): adapted_tex_content = adapted_tex_content[:-3]
-    
-    # Save adapted version
-    adapted_filename = f"adapted_{cv_filename}"
-    adapted_file_path = os.path.join(app.app.config['UPLOAD_FOLDER'], adapted_filename)
-    
-    print(f"Saving adapted LaTeX to {adapted_file_path}...")
-    with open(adapted_file_path, 'w', encoding='utf-8') as f:
-        f.write(adapted_tex_content)
-    
-    # 3. Compile CV to PDF
-    print("Compiling CV to PDF...")
-    try:
-        pdf_path = compile_latex(adapted_file_path, app.app.config['OUTPUT_FOLDER'])
-        print(f"Success! CV PDF generated at: {pdf_path}")
-    except Exception as e:
-        print(f"Error during CV compilation: {e}")
-
-    # 4. Generate Cover Letter
-    print("Generating Cover Letter...")
-    try:
-        cover_letter_tex = generate_cover_letter(job_description, master_cv_content)
-        
-        if cover_letter_tex.startswith("```latex"): cover_letter_tex = cover_letter_tex[8:]
-        if cover_letter_tex.startswith("```"): cover_letter_tex = cover_letter_tex[3:]
-        if cover_letter_tex.endswith("```"): cover_letter_tex = cover_letter_tex[:-3]
-
-        cl_filename = "Cover_Letter.tex"
-        cl_file_path = os.path.join(app.app.config['UPLOAD_FOLDER'], cl_filename)
-        
-        print(f"Saving Cover Letter LaTeX to {cl_file_path}...")
-        with open(cl_file_path, 'w', encoding='utf-8') as f:
-            f.write(cover_letter_tex)
-            
-        cl_pdf_path = compile_latex(cl_file_path, app.app.config['OUTPUT_FOLDER'])
-        print(f"Success! Cover Letter PDF generated at: {cl_pdf_path}")
-    except Exception as e:
-        print(f"Error during Cover Letter generation: {e}")
-
-    # 5. Generate Short Message
-    print("Generating Short Message...")
-    try:
-        short_message = generate_short_message(job_description, master_cv_content)
-        msg_filename = "short_message.txt"
-        msg_file_path = os.path.join(app.app.config['OUTPUT_FOLDER'], msg_filename)
-        
-        with open(msg_file_path, 'w', encoding='utf-8') as f:
-            f.write(short_message)
-        print(f"Success! Short message saved to: {msg_file_path}")
-        print("-" * 20)
-        print(short_message)
-        print("-" * 20)
-    except Exception as e:
-        print(f"Error during Short Message generation: {e}")
+    batch_id, pending = create_batch(cv_text, job_descriptions, language=args.language,
+                                     bypass_cache=args.no_cache)
+    job_ids = JOBS.get(batch_id)['items']
+    print(f"Batch {batch_id}: {len(job_descriptions)} job descriptions, "
+          f"{len(job_descriptions) - len(pending)} from cache.")
+    for index, job_id in enumerate(job_ids):
+        job = JOBS.get(job_id)
+        if job['status'] == 'completed':
+            print_item(batch_item(index, job_id, job))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = {pool.submit(process_job, job_id, **payload): job_id for job_id, payload in pending}
+        for future in concurrent.futures.as_completed(futures):
+            job_id = futures[future]
+            print_item(batch_item(job_ids.index(job_id), job_id, JOBS.get(job_id)))
+
+    report = batch_report(batch_id)
+    print("-" * 20)
+    print(f"{report['completed']}/{report['total']} completed, {report['failed']} failed, "
+          f"average ATS score: {report['average_ats_score']}")
+    for item in report['items']:
+        print_item(item)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {args.report}")
 
 if __name__ == "__main__":
     main()
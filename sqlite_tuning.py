@@ -0,0 +1,44 @@
+import sqlite3
+from sqlalchemy import event
+
+# Per-connection settings shared by the SQLAlchemy engine and the stdlib SQLite stores.
+# NORMAL only syncs at WAL checkpoints: a power loss can drop the last commits, never corrupt the file.
+PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': 10000,
+    'mmap_size': 64 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+WAL = True
+
+def configure(wal=True, **pragmas):
+    """Overrides the defaults above; call before any store opens its database."""
+    global WAL
+    WAL = wal
+    PRAGMAS.update(pragmas)
+
+def tune(conn):
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+def enable_wal(conn):
+    """WAL lets readers run during a write; the mode is stored in the file, so once per database is enough."""
+    if WAL:
+        conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+def connect(db_path, **kwargs):
+    return tune(sqlite3.connect(db_path, **kwargs))
+
+def tune_engine(engine):
+    """Applies WAL and PRAGMAS to every connection a SQLAlchemy engine opens (SQLite engines only)."""
+    if engine.dialect.name != 'sqlite':
+        return engine
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_conn, connection_record):
+        enable_wal(dbapi_conn)
+        tune(dbapi_conn)
+
+    return engine
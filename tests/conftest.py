@@ -0,0 +1,15 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope='session')
+def webapp(tmp_path_factory):
+    """The app module, imported against scratch directories with no queue consumers or janitor."""
+    scratch = tmp_path_factory.mktemp('app')
+    os.environ.update(INSTANCE_PATH=str(scratch / 'instance'), UPLOAD_FOLDER=str(scratch / 'uploads'),
+                      OUTPUT_FOLDER=str(scratch / 'outputs'), EMBEDDED_WORKERS='0', JANITOR_INTERVAL='0')
+    import app
+    app.app.config['TESTING'] = True
+    return app
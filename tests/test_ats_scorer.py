@@ -0,0 +1,77 @@
+import math
+import random
+from ats_scorer import ATSScorer, Document, SKILL_BY_SPELLING, extract_company, extract_title, find_skills
+
+CV = """Jane Doe - Software Engineer
+Python developer: Docker, K8s and Amazon Web Services. REST APIs with Flask, CI/CD with GitLab CI."""
+
+def test_find_skills_folds_synonyms_and_prefers_the_longest_spelling():
+    skills, normalized = find_skills("Google Cloud Platform, k8s and Spring Boot; some cloud too")
+    assert skills == ['gcp', 'kubernetes', 'spring', 'cloud computing']
+    assert ' cloud_computing ' in normalized and 'google' not in normalized
+
+def test_document_keeps_skills_and_ngrams():
+    doc = Document(CV)
+    assert {'python', 'docker', 'kubernetes', 'aws', 'flask', 'ci/cd', 'gitlab ci'} <= doc.skills
+    assert doc.terms['developer'] == 1
+    assert not any(term.isdigit() for term in doc.terms)
+
+def test_matching_cv_scores_higher():
+    scorer = ATSScorer()
+    posting = "Backend Engineer\nCompany: Acme\nWe need Python, Docker, Kubernetes and AWS for our APIs."
+    good = scorer.score(CV, posting)
+    bad = scorer.score("Pastry chef. Croissants, bread and cakes.", posting)
+    assert 0 <= bad['ats_score'] < good['ats_score'] <= 100
+    assert set(bad['missing_keywords']) >= {'python', 'docker'}
+    assert good['job_title'] == 'Backend Engineer' and good['company'] == 'Acme'
+
+def test_missing_keywords_are_capped_and_skills_come_first():
+    scorer = ATSScorer(max_missing=3)
+    analysis = scorer.score(CV, "Rust and Terraform engineer, strong reliability culture and ownership")
+    assert analysis['missing_keywords'][:2] == ['rust', 'terraform']
+    assert len(analysis['missing_keywords']) == 3
+
+def test_score_many_handles_edge_cases():
+    scorer = ATSScorer()
+    assert scorer.score_many(CV, []) == []
+    analyses = scorer.score_many(Document(CV), ['', 'Python', 'the and of'])
+    assert [a['job_title'] for a in analyses] == ['Job Application', 'Python', 'the and of']
+    assert all(0 <= a['ats_score'] <= 100 for a in analyses)
+
+def test_extractors():
+    assert extract_title("\n## Senior Data Engineer ##\nMore") == 'Senior Data Engineer'
+    assert extract_title('x' * 100) == 'Job Application'
+    assert extract_company("Great team, join Blue Ocean Labs today") == 'Blue Ocean Labs'
+    assert extract_company("No company here") == 'Unknown'
+
+def reference_similarity(cv, jobs):
+    """Dense TF-IDF cosine, term by term, to check the sparse batch computation against."""
+    docs = [cv] + jobs
+    df = {}
+    for doc in docs:
+        for term in doc.terms:
+            df[term] = df.get(term, 0) + 1
+    idf = {term: math.log((1 + len(docs)) / (1 + n)) + 1 for term, n in df.items()}
+    weigh = lambda doc: {term: (1 + math.log(count)) * idf[term] for term, count in doc.terms.items()}
+    cv_weights = weigh(cv)
+    cv_norm = math.sqrt(sum(w * w for w in cv_weights.values())) or 1.0
+    result = []
+    for job in jobs:
+        weights = weigh(job)
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        result.append(sum(w * cv_weights.get(term, 0) for term, w in weights.items()) / (norm * cv_norm))
+    return result
+
+def test_batch_matches_a_term_by_term_computation():
+    rng = random.Random(3)
+    words = list(SKILL_BY_SPELLING) + "build scalable services data teams own deliver production".split()
+    postings = [' '.join(rng.choice(words) for _ in range(40)) for _ in range(25)]
+    scorer = ATSScorer()
+    cv = Document(CV)
+    jobs = [Document(p) for p in postings]
+    for analysis, job, similarity in zip(scorer.score_many(cv, postings), jobs, reference_similarity(cv, jobs)):
+        required = len(job.skills)
+        coverage = len(job.skills & cv.skills) / required if required else 0
+        text_score = min(similarity / scorer.SIMILARITY_CEILING, 1.0)
+        blended = scorer.SKILL_WEIGHT * coverage + (1 - scorer.SKILL_WEIGHT) * text_score if required else text_score
+        assert abs(analysis['ats_score'] - blended * 100) <= 0.5 + 1e-6
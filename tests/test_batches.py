@@ -0,0 +1,46 @@
+import time
+import uuid
+import pytest
+
+@pytest.fixture
+def batch(webapp):
+    batch_id, items = str(uuid.uuid4()), [str(uuid.uuid4()) for _ in range(2)]
+    webapp.JOBS.create(batch_id, kind='batch', status='processing', items=items)
+    webapp.JOBS.create(items[0], status='completed', batch_id=batch_id,
+                       result={'cv_pdf': 'a.pdf', 'cl_pdf': 'b.pdf', 'analysis': {'ats_score': 70}})
+    webapp.JOBS.create(items[1], status='processing', batch_id=batch_id)
+    return batch_id, items
+
+def test_batch_status_does_not_write(webapp, batch):
+    batch_id, items = batch
+    webapp.JOBS.update(items[1], status='completed', result={'analysis': {'ats_score': 90}})
+    events = webapp.JOBS.events_since(batch_id)
+    response = webapp.app.test_client().get(f'/batch_status/{batch_id}')
+    report = response.get_json()
+    assert report['status'] == 'completed' and report['completed'] == 2
+    assert [item['ats_score'] for item in report['items']] == [90, 70]
+    assert webapp.JOBS.events_since(batch_id) == events
+    assert webapp.JOBS.status(batch_id) == 'processing'
+
+def test_batch_completes_when_its_last_item_finishes(webapp, batch):
+    batch_id, items = batch
+    webapp.settle_batch(batch_id)
+    assert webapp.JOBS.status(batch_id) == 'processing'
+    webapp.fail_job(items[1], RuntimeError('boom'), None, None, {}, time.perf_counter(), batch_id)
+    assert webapp.JOBS.status(batch_id) == 'completed'
+    report = webapp.batch_report(batch_id)
+    assert report['status'] == 'completed' and report['failed'] == 1
+
+def test_buried_item_settles_its_batch(webapp, batch):
+    batch_id, items = batch
+
+    class Task:
+        job_id = items[1]
+        attempts = 3
+        payload = {'batch_id': batch_id}
+
+    webapp.bury_task(Task)
+    assert webapp.JOBS.status(batch_id) == 'completed'
+
+def test_unknown_batch(webapp):
+    assert webapp.app.test_client().get('/batch_status/missing').status_code == 404
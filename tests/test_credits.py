@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from credits import CreditLedger
+
+@pytest.fixture
+def env(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'credits.db'}"
+    db = SQLAlchemy(app)
+
+    class User(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        plan_type = db.Column(db.String(20), default='free')
+        credits_used = db.Column(db.Integer, default=0)
+        last_reset = db.Column(db.DateTime, default=datetime.utcnow)
+
+    with app.app_context():
+        db.create_all()
+        yield db, User, CreditLedger(db, User, daily_credits=3)
+
+def add_user(db, User, **fields):
+    user = User(**fields)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def reload(db, user):
+    db.session.refresh(user)
+    return user
+
+def test_reserve_stops_at_the_daily_limit(env):
+    db, User, ledger = env
+    user = add_user(db, User)
+    assert isinstance(ledger.reserve(user, 2), datetime)
+    assert ledger.reserve(user, 2) is None
+    assert isinstance(ledger.reserve(user), datetime)
+    assert ledger.reserve(user) is None
+    assert reload(db, user).credits_used == 3
+    assert ledger.remaining(user) == 0
+
+def test_reserve_resets_an_expired_window(env):
+    db, User, ledger = env
+    user = add_user(db, User, credits_used=3, last_reset=datetime.utcnow() - timedelta(days=2))
+    assert ledger.remaining(user) == 3
+    assert ledger.reserve(user) is not None
+    user = reload(db, user)
+    assert user.credits_used == 1
+    assert datetime.utcnow() - user.last_reset < timedelta(minutes=1)
+
+def test_unlimited_plans_are_not_charged(env):
+    db, User, ledger = env
+    user = add_user(db, User, plan_type='pro', credits_used=0)
+    assert ledger.reserve(user, 10) is True
+    assert reload(db, user).credits_used == 0
+    assert ledger.remaining(user) is None
+
+def test_refund_gives_credits_back(env):
+    db, User, ledger = env
+    user = add_user(db, User)
+    reserved_at = ledger.reserve(user, 2)
+    ledger.refund(user.id, reserved_at, 2)
+    assert reload(db, user).credits_used == 0
+    ledger.refund(user.id, reserved_at, 2)
+    assert reload(db, user).credits_used == 0
+
+def test_refund_after_a_window_reset_is_dropped(env):
+    db, User, ledger = env
+    user = add_user(db, User)
+    reserved_at = ledger.reserve(user, 2)
+    user.last_reset = reserved_at + timedelta(seconds=1)
+    user.credits_used = 1
+    db.session.commit()
+    ledger.refund(user.id, reserved_at, 2)
+    assert reload(db, user).credits_used == 1
+
+def test_refund_ignores_unlimited_reservations(env):
+    db, User, ledger = env
+    user = add_user(db, User, credits_used=2)
+    ledger.refund(user.id, True, 2)
+    ledger.refund(user.id, None, 2)
+    assert reload(db, user).credits_used == 2
+
+def test_refund_joins_the_callers_session(env):
+    db, User, ledger = env
+    user = add_user(db, User)
+    reserved_at = ledger.reserve(user)
+    ledger.refund(user.id, reserved_at, session=db.session)
+    db.session.rollback()
+    assert reload(db, user).credits_used == 1
@@ -0,0 +1,86 @@
+import hashlib
+import io
+import os
+import pytest
+import ingest
+from ingest import TextExtractor, store_upload, upload_path
+
+def make_pdf(path, pages):
+    """Writes a PDF with one line of Helvetica text per page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += ''.join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, 'wb') as f:
+        f.write(out)
+    return path
+
+def test_store_upload_files_under_the_content_hash(tmp_path):
+    data = os.urandom(3 * ingest.CHUNK_SIZE + 17)
+    digest, path = store_upload(io.BytesIO(data), str(tmp_path))
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert path == upload_path(str(tmp_path), digest)
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+def test_identical_uploads_share_one_file(tmp_path):
+    first = store_upload(io.BytesIO(b'same'), str(tmp_path))
+    second = store_upload(io.BytesIO(b'same'), str(tmp_path))
+    other = store_upload(io.BytesIO(b'other'), str(tmp_path))
+    assert first == second
+    assert other[1] != first[1]
+    assert not [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith('.part')]
+
+def test_failed_upload_leaves_no_partial_file(tmp_path):
+    class Broken:
+        def read(self, size):
+            raise OSError('connection reset')
+
+    with pytest.raises(OSError):
+        store_upload(Broken(), str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+def test_extraction_is_cached_by_digest(tmp_path, monkeypatch):
+    pdf = make_pdf(str(tmp_path / 'cv.pdf'), ['Jane Doe', 'Python developer'])
+    extractor = TextExtractor(str(tmp_path / 'texts.db'), max_workers=1)
+    assert extractor.cached('abc') is None
+    text = extractor.extract('abc', pdf)
+    assert 'Jane Doe' in text and 'Python developer' in text
+
+    monkeypatch.setattr(ingest, '_extract_pages', lambda *args: pytest.fail("extracted twice"))
+    os.remove(pdf)
+    assert extractor.extract('abc', pdf) == text
+    assert TextExtractor(str(tmp_path / 'texts.db')).cached('abc') == text
+
+def test_large_pdfs_are_split_across_processes(tmp_path):
+    pages = [f'Page number {i}' for i in range(5)]
+    pdf = make_pdf(str(tmp_path / 'long.pdf'), pages)
+    extractor = TextExtractor(str(tmp_path / 'texts.db'), max_workers=2, parallel_pages=4)
+    try:
+        text = extractor.extract('long', pdf)
+        assert extractor._pool is not None
+    finally:
+        extractor.shutdown()
+    positions = [text.index(page) for page in pages]
+    assert positions == sorted(positions)
+
+def test_small_pdfs_skip_the_pool(tmp_path):
+    pdf = make_pdf(str(tmp_path / 'short.pdf'), ['One', 'Two'])
+    extractor = TextExtractor(str(tmp_path / 'texts.db'), max_workers=2, parallel_pages=4)
+    assert 'Two' in extractor.extract('short', pdf)
+    assert extractor._pool is None
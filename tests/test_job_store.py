@@ -0,0 +1,130 @@
+import threading
+import time
+import pytest
+import job_store
+from job_store import MemoryJobStore, SQLiteJobStore, create_job_store
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    return create_job_store(request.param, str(tmp_path / 'jobs.db'), ttl=3600, cache_bytes=1024 * 1024)
+
+def test_create_get_update(store):
+    store.create('j', logs=['Queued'])
+    job = store.get('j')
+    assert job['status'] == 'queued' and job['logs'] == ['Queued'] and job['result'] is None
+    store.update('j', status='processing', current_step=2)
+    store.append_log('j', 'Compiling')
+    job = store.get('j')
+    assert job['status'] == 'processing' and job['current_step'] == 2
+    assert job['logs'] == ['Queued', 'Compiling']
+    assert store.status('j') == 'processing'
+    assert store.get('missing') is None and store.status('missing') is None
+    assert store.count() == 1
+
+def test_returned_jobs_are_copies(store):
+    store.create('j', result={'files': ['a']})
+    store.get('j')['result']['files'].append('b')
+    assert store.get('j')['result'] == {'files': ['a']}
+
+def test_finished_job_is_served_updated(store):
+    store.create('j')
+    store.update('j', status='completed', result={'cv': 'x.pdf'})
+    assert store.get('j')['result'] == {'cv': 'x.pdf'}
+    store.update('j', result={'cv': 'y.pdf'})
+    assert store.get('j')['result'] == {'cv': 'y.pdf'}
+
+def test_concurrent_updates_of_different_fields_are_kept(store):
+    store.create('j')
+    threads = [threading.Thread(target=store.update, args=('j',), kwargs={f'field_{i}': i}) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    job = store.get('j')
+    assert all(job[f'field_{i}'] == i for i in range(8))
+
+def test_events_are_deltas_in_order(store):
+    store.create('j')
+    first = store.events_since('j')
+    assert [kind for _, kind, _ in first] == ['update']
+    store.append_log('j', 'Started')
+    store.update('j', status='processing')
+    events = store.events_since('j', first[-1][0])
+    assert [(kind, payload) for _, kind, payload in events] == [('log', 'Started'),
+                                                               ('update', {'status': 'processing'})]
+    assert store.events_since('j', events[-1][0]) == []
+
+def test_jobs_expire_after_their_ttl(store, monkeypatch):
+    store.create('j')
+    later = time.time() + 3601
+    monkeypatch.setattr(job_store.time, 'time', lambda: later)
+    assert store.get('j') is None
+    store.expire()
+    assert store.count() == 0
+
+def test_hot_cache_stays_under_its_cap(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / 'jobs.db'), cache_bytes=200)
+    for i in range(10):
+        store.create(f'j{i}', status='completed', result='x' * 50)
+        store.get(f'j{i}')
+    assert store._cache_size <= 200
+    assert store.get('j0')['result'] == 'x' * 50
+
+def test_unknown_store_kind():
+    with pytest.raises(ValueError):
+        create_job_store('redis', None, 1, 1)
+
+def test_memory_store_is_the_reference(tmp_path):
+    memory, sqlite = MemoryJobStore(), SQLiteJobStore(str(tmp_path / 'jobs.db'))
+    for store in (memory, sqlite):
+        store.create('j', logs=['a'])
+        store.update('j', status='processing', analysis={'score': 1})
+        store.append_log('j', 'b')
+    assert memory.get('j') == sqlite.get('j')
+
+def chunk_rows(store, job_id):
+    return [payload for _, kind, payload in store.events_since(job_id) if kind == 'chunk']
+
+def test_streamed_pieces_are_buffered_per_stage(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / 'jobs.db'), chunk_interval=60)
+    store.create('j', status='processing')
+    for piece in ('Dear ', 'hiring ', 'manager'):
+        store.append_chunk('j', 'message', piece)
+    store.append_chunk('j', 'cv', '\\section')
+    assert chunk_rows(store, 'j') == []
+    store.flush_chunks('j')
+    assert chunk_rows(store, 'j') == [{'stage': 'message', 'text': 'Dear hiring manager'},
+                                      {'stage': 'cv', 'text': '\\section'}]
+    assert store.get('j')['partial'] == {'message': 'Dear hiring manager', 'cv': '\\section'}
+
+def test_buffer_is_written_once_the_interval_passes(tmp_path, monkeypatch):
+    store = SQLiteJobStore(str(tmp_path / 'jobs.db'), chunk_interval=0.25)
+    store.create('j', status='processing')
+    clock = [100.0]
+    monkeypatch.setattr(job_store.time, 'monotonic', lambda: clock[0])
+    store.append_chunk('j', 'message', 'a')
+    clock[0] += 0.1
+    store.append_chunk('j', 'message', 'b')
+    assert chunk_rows(store, 'j') == []
+    clock[0] += 0.2
+    store.append_chunk('j', 'message', 'c')
+    assert chunk_rows(store, 'j') == [{'stage': 'message', 'text': 'abc'}]
+
+def test_log_lines_keep_their_place_after_buffered_pieces(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / 'jobs.db'), chunk_interval=60)
+    store.create('j', status='processing')
+    store.append_chunk('j', 'message', 'Hi')
+    store.append_log('j', 'Message done')
+    assert [kind for _, kind, _ in store.events_since('j')][-2:] == ['chunk', 'log']
+
+@pytest.mark.parametrize('status', ['completed', 'failed'])
+def test_chunks_are_dropped_when_the_job_finishes(store, status):
+    store.create('j', status='processing')
+    store.append_chunk('j', 'message', 'Hi')
+    if isinstance(store, SQLiteJobStore):
+        store.flush_chunks('j')
+    assert chunk_rows(store, 'j')
+    store.append_chunk('j', 'message', ' there')
+    store.update('j', status=status)
+    assert chunk_rows(store, 'j') == []
+    assert 'partial' not in store.get('j')
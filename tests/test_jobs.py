@@ -0,0 +1,41 @@
+import uuid
+import pytest
+
+JD = "Backend Engineer at ACME\nPython Docker"
+CV_TEXT = "Jane Doe\nPython developer"
+TEMPLATES = ("\\documentclass{article}\\begin{document}CV\\end{document}",
+             "\\documentclass{article}\\begin{document}CL\\end{document}")
+
+@pytest.fixture
+def cached_run(webapp, tmp_path, monkeypatch):
+    monkeypatch.setitem(webapp.app.config, 'RESULT_CACHE', True)
+    monkeypatch.setattr(webapp.cv_extractor, 'extract', lambda digest, path: CV_TEXT)
+    pdfs = []
+    for name in ('cv.pdf', 'cl.pdf'):
+        (tmp_path / name).write_bytes(b'%PDF-1.4\n' + name.encode())
+        pdfs.append(str(tmp_path / name))
+    key = webapp.result_cache_key(CV_TEXT, JD, 'en', TEMPLATES)
+    webapp.result_cache.put(key, *pdfs, {'ats_score': 77}, 'Hello')
+    return key
+
+def start(webapp, templates, **kwargs):
+    job_id = str(uuid.uuid4())
+    webapp.JOBS.create(job_id)
+    return job_id, webapp.begin_job(job_id, JD, None, None, 'en', None, 'digest', {}, templates, **kwargs)
+
+def test_uploaded_cv_replays_a_cached_run(webapp, cached_run):
+    job_id, started = start(webapp, TEMPLATES)
+    assert started is None
+    job = webapp.JOBS.get(job_id)
+    assert job['status'] == 'completed' and job['cached'] is True
+    assert job['result']['analysis'] == {'ats_score': 77} and job['message_text'] == 'Hello'
+    assert job['logs'][-2:] == ["Loaded from cache.", "Done!"]
+
+def test_cache_key_of_an_upload_covers_the_templates(webapp, cached_run):
+    job_id, started = start(webapp, (TEMPLATES[0] + '%', TEMPLATES[1]))
+    assert started == (CV_TEXT, webapp.result_cache_key(CV_TEXT, JD, 'en', (TEMPLATES[0] + '%', TEMPLATES[1])))
+    assert webapp.JOBS.status(job_id) == 'processing'
+
+def test_no_cache_skips_the_replay(webapp, cached_run):
+    job_id, started = start(webapp, TEMPLATES, bypass_cache=True)
+    assert started == (CV_TEXT, cached_run)
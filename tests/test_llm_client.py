@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import pytest
+import llm_client
+from google.api_core import exceptions as api_exceptions
+from llm_client import CircuitBreaker, LLMClient, LLMDeadlineExceeded, LLMUnavailable
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_client.time, 'monotonic', clock)
+    return clock
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+def test_opens_after_the_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow() is True
+    breaker.record_failure()
+    assert breaker.state == 'open' and breaker.opened == 1
+    assert breaker.allow() is False
+    assert breaker.retry_in() == 10
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+def test_single_probe_after_the_reset_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    open_breaker(breaker)
+    clock.now += 10
+    assert breaker.allow() == 'probe'
+    assert breaker.state == 'half-open'
+    assert breaker.allow() is False
+
+def test_successful_probe_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    open_breaker(breaker)
+    clock.now += 10
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.allow() is True
+
+def test_failed_probe_reopens_for_a_full_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    open_breaker(breaker)
+    clock.now += 10
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and breaker.opened == 1
+    assert breaker.retry_in() == 10
+    assert breaker.allow() is False
+
+def test_released_probe_goes_to_the_next_caller(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    open_breaker(breaker)
+    clock.now += 10
+    breaker.allow()
+    breaker.release()
+    assert breaker.state == 'open'
+    assert breaker.allow() == 'probe'
+
+def test_expired_deadline_does_not_take_the_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    client = LLMClient(breaker=breaker)
+    open_breaker(breaker)
+    clock.now += 10
+    with pytest.raises(LLMDeadlineExceeded):
+        client._attempt_timeout(clock.now, 30)
+    assert client._attempt_timeout(clock.now + 5, 30) == (5, True)
+    with pytest.raises(LLMUnavailable):
+        client._attempt_timeout(clock.now + 5, 30)
+
+def client_calling(breaker, call, monkeypatch):
+    client = LLMClient(breaker=breaker, max_attempts=1)
+    monkeypatch.setattr(client, 'model', lambda name: None)
+    monkeypatch.setattr(client, '_call', lambda *args: call())
+    return client
+
+def half_open(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    open_breaker(breaker)
+    clock.now += 10
+    return breaker
+
+def test_probe_success_closes_the_circuit(clock, monkeypatch):
+    breaker = half_open(clock)
+    assert client_calling(breaker, lambda: 'ok', monkeypatch).generate('hi') == 'ok'
+    assert breaker.state == 'closed'
+
+def test_probe_with_a_retryable_error_reopens(clock, monkeypatch):
+    breaker = half_open(clock)
+
+    def unavailable():
+        raise api_exceptions.ServiceUnavailable('down')
+
+    with pytest.raises(api_exceptions.ServiceUnavailable):
+        client_calling(breaker, unavailable, monkeypatch).generate('hi')
+    assert breaker.state == 'open' and breaker.retry_in() == 10
+
+def test_probe_with_a_refused_request_is_handed_back(clock, monkeypatch):
+    breaker = half_open(clock)
+
+    def refused():
+        raise api_exceptions.InvalidArgument('bad prompt')
+
+    with pytest.raises(api_exceptions.InvalidArgument):
+        client_calling(breaker, refused, monkeypatch).generate('hi')
+    assert breaker.state == 'open' and breaker.failures == 1
+    assert breaker.allow() == 'probe'
+
+def test_refused_request_does_not_reset_failures(clock, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=3)
+    breaker.record_failure()
+
+    def refused():
+        raise api_exceptions.InvalidArgument('bad prompt')
+
+    with pytest.raises(api_exceptions.InvalidArgument):
+        client_calling(breaker, refused, monkeypatch).generate('hi')
+    assert breaker.failures == 1
+
+def test_async_calls_use_the_cache_off_the_event_loop(tmp_path, monkeypatch):
+    cache = llm_client.ResponseCache(str(tmp_path / 'responses.db'))
+    threads = []
+    for method in ('get', 'put'):
+        original = getattr(cache, method)
+        def traced(*args, original=original):
+            threads.append(threading.current_thread())
+            return original(*args)
+        monkeypatch.setattr(cache, method, traced)
+    client = LLMClient(cache=cache)
+    monkeypatch.setattr(client, 'model', lambda name: None)
+    async def answer(*args):
+        return 'ok'
+    monkeypatch.setattr(client, '_acall', answer)
+    assert asyncio.run(client.agenerate('hi')) == 'ok'
+    assert asyncio.run(client.agenerate('hi')) == 'ok'
+    assert len(threads) == 3 and threading.main_thread() not in threads
@@ -0,0 +1,67 @@
+import json
+import os
+import pytest
+from model_registry import ModelRegistry, STAGES, load_catalog
+
+CATALOG = {'gemini-2.0-flash', 'gemini-2.0-flash-lite', 'gemini-2.5-pro'}
+
+def test_load_catalog_keeps_text_models(tmp_path):
+    path = tmp_path / 'models.txt'
+    path.write_text("models/gemini-2.0-flash\nmodels/embedding-001\n"
+                    "models/gemini-2.5-pro\tgenerateContent,countTokens\nmodels/imagen-3\tpredict\n\n")
+    assert load_catalog(str(path)) == {'gemini-2.0-flash', 'gemini-2.5-pro'}
+    assert load_catalog(str(tmp_path / 'missing.txt')) is None
+
+def test_unrouted_stages_use_the_default():
+    registry = ModelRegistry('models/gemini-2.0-flash', catalog=CATALOG)
+    assert all(registry.route(stage) == ('gemini-2.0-flash', {}) for stage in STAGES)
+
+def test_routes_set_models_and_generation_settings():
+    registry = ModelRegistry('gemini-2.0-flash', catalog=CATALOG, routes={
+        'analysis': 'gemini-2.0-flash-lite',
+        'cv': {'model': 'gemini-2.5-pro', 'temperature': 0.2},
+        'message': {'max_output_tokens': 256},
+    })
+    assert registry.route('analysis') == ('gemini-2.0-flash-lite', {})
+    assert registry.route('cv') == ('gemini-2.5-pro', {'temperature': 0.2})
+    assert registry.route('message') == ('gemini-2.0-flash', {'max_output_tokens': 256})
+    registry.route('cv')[1]['temperature'] = 1.0
+    assert registry.route('cv')[1] == {'temperature': 0.2}
+
+@pytest.mark.parametrize('routes', [
+    {'summary': 'gemini-2.0-flash'},
+    {'cv': 'gpt-4'},
+    {'cv': {'model': 'gemini-2.0-flash', 'seed': 1}},
+    {'cv': 3},
+    ['cv'],
+])
+def test_invalid_routes_are_rejected(routes):
+    with pytest.raises(ValueError):
+        ModelRegistry('gemini-2.0-flash', catalog=CATALOG, routes=routes)
+
+def test_unknown_default_model_is_rejected():
+    with pytest.raises(ValueError):
+        ModelRegistry('gemini-9', catalog=CATALOG)
+
+def test_overrides_are_shared_through_the_file(tmp_path):
+    path = str(tmp_path / 'routes.json')
+    first = ModelRegistry('gemini-2.0-flash', catalog=CATALOG, overrides_path=path, check_interval=0)
+    second = ModelRegistry('gemini-2.0-flash', catalog=CATALOG, overrides_path=path, check_interval=0)
+    signature = second.signature()
+    first.set_overrides({'cv': {'model': 'gemini-2.5-pro', 'top_k': 4}})
+    with open(path) as f:
+        assert json.load(f) == {'cv': {'model': 'gemini-2.5-pro', 'top_k': 4}}
+    assert second.route('cv') == ('gemini-2.5-pro', {'top_k': 4})
+    assert second.signature() != signature
+    first.set_overrides({})
+    assert second.route('cv') == ('gemini-2.0-flash', {})
+    assert second.signature() == signature
+
+def test_broken_override_file_keeps_the_previous_routes(tmp_path):
+    path = str(tmp_path / 'routes.json')
+    registry = ModelRegistry('gemini-2.0-flash', catalog=CATALOG, overrides_path=path, check_interval=0)
+    registry.set_overrides({'cv': 'gemini-2.5-pro'})
+    with open(path, 'w') as f:
+        f.write('{not json')
+    os.utime(path, ns=(1, 1))
+    assert registry.route('cv') == ('gemini-2.5-pro', {})
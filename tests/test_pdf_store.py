@@ -0,0 +1,83 @@
+import os
+import time
+import pytest
+from janitor import Janitor
+from pdf_store import PDFStore, file_sha256
+
+@pytest.fixture
+def store(tmp_path):
+    (tmp_path / 'legacy').mkdir()
+    return PDFStore(str(tmp_path / 'pdf'), legacy_dir=str(tmp_path / 'legacy'))
+
+def write(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+    return str(path)
+
+def age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+def test_put_files_under_the_content_hash(tmp_path, store):
+    src = write(tmp_path / 'CV_job.pdf', b'%PDF cv')
+    name = store.put(src)
+    assert name == file_sha256(src) + '.pdf'
+    assert store.path(name) == os.path.join(store.root, name[:2], name[2:4], name)
+    assert store.exists(name) and os.path.exists(src)
+
+def test_put_with_move_consumes_the_source(tmp_path, store):
+    src = write(tmp_path / 'a.pdf', b'%PDF a')
+    name = store.put(src, move=True)
+    assert store.exists(name) and not os.path.exists(src)
+    again = write(tmp_path / 'b.pdf', b'%PDF a')
+    assert store.put(again, move=True) == name and not os.path.exists(again)
+
+def test_storing_known_content_refreshes_its_age(tmp_path, store):
+    name = store.put(write(tmp_path / 'a.pdf', b'%PDF a'))
+    age(store.path(name), 3600)
+    store.put(write(tmp_path / 'b.pdf', b'%PDF a'))
+    assert time.time() - os.path.getmtime(store.path(name)) < 60
+
+def test_legacy_names_are_looked_up_flat(tmp_path, store):
+    write(tmp_path / 'legacy' / 'CV_old.pdf', b'%PDF old')
+    assert store.exists('CV_old.pdf')
+    assert store.path('../../etc/CV_old.pdf') == str(tmp_path / 'legacy' / 'CV_old.pdf')
+    assert {name for name, *_ in store.files()} == {'CV_old.pdf'}
+
+def test_remove_keeps_recent_files(tmp_path, store):
+    name = store.put(write(tmp_path / 'a.pdf', b'%PDF a'))
+    assert store.remove(name, min_age=60) == 0 and store.exists(name)
+    assert store.remove(name) == len(b'%PDF a') and not store.exists(name)
+    assert store.remove(name) == 0
+
+def test_janitor_keeps_referenced_and_recent_pdfs(tmp_path, store):
+    names = {key: store.put(write(tmp_path / f'{key}.pdf', f'%PDF {key}'.encode()))
+             for key in ('saved', 'old', 'recent')}
+    age(store.path(names['saved']), 40 * 86400)
+    age(store.path(names['old']), 40 * 86400)
+    janitor = Janitor(store, lambda: {names['saved']}, retention=30 * 86400, min_age=3600)
+    sweep = janitor.sweep()
+    assert sweep['removed'] == 1 and sweep['referenced'] == 1
+    assert store.exists(names['saved']) and store.exists(names['recent']) and not store.exists(names['old'])
+    assert janitor.last_sweep is sweep
+
+def test_janitor_trims_the_oldest_pdfs_past_max_bytes(tmp_path, store):
+    names = [store.put(write(tmp_path / f'{i}.pdf', b'%PDF ' + bytes([65 + i]) * 100)) for i in range(3)]
+    for i, name in enumerate(names):
+        age(store.path(name), 7200 - i * 60)
+    Janitor(store, set, max_bytes=250, min_age=3600).sweep()
+    assert [store.exists(name) for name in names] == [False, True, True]
+
+def test_janitor_prunes_scratch_and_uploads(tmp_path, store):
+    scratch, uploads = tmp_path / 'build', tmp_path / 'uploads'
+    (scratch / 'failed-job').mkdir(parents=True)
+    (scratch / 'running-job').mkdir()
+    (uploads / 'ab').mkdir(parents=True)
+    old_upload = write(uploads / 'ab' / 'old.pdf', b'x')
+    new_upload = write(uploads / 'ab' / 'new.pdf', b'y')
+    age(scratch / 'failed-job', 7200)
+    age(old_upload, 8 * 86400)
+    Janitor(store, set, min_age=3600, scratch_dirs=[str(scratch)], upload_dir=str(uploads),
+            upload_retention=7 * 86400).sweep()
+    assert os.listdir(scratch) == ['running-job']
+    assert not os.path.exists(old_upload) and os.path.exists(new_upload)
@@ -0,0 +1,74 @@
+import os
+import pytest
+from prompts import PromptBuilder, condense_cv, estimate_tokens, split_line, template_digest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CV = """Jane Doe
+jane@example.com | +33 6 00 00 00 00
+
+Experience
+Built Python APIs with Flask and PostgreSQL at Acme.
+Ran the company bake sale and the book club.
+Deployed services on Kubernetes with Docker and Terraform.
+Hobbies: sailing, chess and gardening."""
+
+def test_short_cv_is_only_tidied():
+    assert condense_cv("Jane   Doe\n\n\n\nPython", 100) == "Jane Doe\n\nPython"
+
+@pytest.mark.parametrize('budget', [0, 1, 5, 12, 20, 40, 80])
+def test_condensed_cv_always_fits(budget):
+    for text in (CV, 'x' * 5000, 'word ' * 2000, CV.replace('\n', ' ') * 20):
+        assert estimate_tokens(condense_cv(text, budget, 'Python Kubernetes')) <= budget
+
+def test_head_and_relevant_lines_are_kept_in_order():
+    cv = CV + "\n" + "\n".join(f"Organised charity event number {i}." for i in range(10))
+    condensed = condense_cv(cv, 65, "Backend engineer: Python, Flask, Kubernetes, Docker")
+    lines = condensed.splitlines()
+    assert lines[0] == 'Jane Doe'
+    assert 'Deployed services on Kubernetes with Docker and Terraform.' in lines
+    assert 'Hobbies: sailing, chess and gardening.' not in lines
+    original = [line for line in cv.splitlines() if line]
+    assert [original.index(line) for line in lines] == sorted(original.index(line) for line in lines)
+
+def test_single_line_cv_is_split_instead_of_dropped():
+    one_line = ' '.join(["Python developer with Kubernetes"] + ['filler text'] * 200)
+    condensed = condense_cv(one_line, 200, 'Kubernetes')
+    assert condensed.startswith('Python developer with Kubernetes')
+    assert estimate_tokens(condensed) <= 200
+
+def test_split_line_cuts_at_spaces():
+    pieces = split_line('abc ' * 100, max_chars=50)
+    assert all(len(piece) <= 50 for piece in pieces)
+    assert ' '.join(pieces).split() == ['abc'] * 100
+    assert split_line('x' * 120, max_chars=50) == ['x' * 50, 'x' * 50, 'x' * 20]
+
+def read(name):
+    with open(os.path.join(ROOT, name), encoding='utf-8') as f:
+        return f.read()
+
+def test_template_digest_keeps_commands_and_drops_the_preamble():
+    template = read('CV.tex')
+    digest = template_digest(template)
+    assert len(digest) < len(template)
+    assert '\\usepackage' not in digest and '\\documentclass' not in digest
+    assert digest.startswith("Custom commands")
+    assert '\\begin{document}' not in digest
+
+def test_template_digest_of_a_custom_command():
+    template = ("\\documentclass{article}\n\\newcommand{\\role}[2]{\\textbf{#1} #2}\n"
+                "\\begin{document}\n% example\n\\role{Engineer}{Acme}\n" + 'Lorem ipsum ' * 20 + "\n\\end{document}")
+    digest = template_digest(template)
+    assert '\\role{#1}{#2}' in digest
+    assert '% example' not in digest
+    assert 'Lorem ipsum Lorem' in digest and digest.count('Lorem') < 20
+
+def test_template_without_preamble_is_only_stripped():
+    assert template_digest("\\section{A} % note\n\n\\item B") == "\\section{A}\n\\item B"
+
+def test_builder_uses_the_digest_when_asked():
+    template = read('CV.tex')
+    digested = PromptBuilder('Python job', CV).cv_body(template, 'en')
+    full = PromptBuilder('Python job', CV, digest_templates=False).cv_body(template, 'en')
+    assert template_digest(template) in digested and template not in digested
+    assert template in full
@@ -0,0 +1,59 @@
+import os
+import time
+import pytest
+from pdf_store import PDFStore
+import result_cache
+from result_cache import ResultCache
+
+@pytest.fixture
+def store(tmp_path):
+    return PDFStore(str(tmp_path / 'pdf'))
+
+def pdf(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(b'%PDF-1.4\n' + content)
+    return str(path)
+
+def make_key(**changes):
+    parts = dict(cv_text='cv', job_description='job', language='en', cv_template='\\CV', cl_template='\\CL',
+                 model_name='gemini')
+    parts.update(changes)
+    return ResultCache.make_key(**parts)
+
+def test_key_covers_every_input():
+    base = make_key()
+    assert make_key() == base
+    for field in ('cv_text', 'job_description', 'language', 'cv_template', 'cl_template', 'model_name'):
+        assert make_key(**{field: 'changed'}) != base
+
+def test_put_then_get(tmp_path, store):
+    cache = ResultCache(str(tmp_path / 'results.db'), store)
+    assert cache.get('k') is None
+    cache.put('k', pdf(tmp_path, 'cv.pdf', b'cv'), pdf(tmp_path, 'cl.pdf', b'cl'), {'score': 80}, 'Hello')
+    hit = cache.get('k')
+    assert hit['analysis'] == {'score': 80} and hit['message'] == 'Hello'
+    assert store.exists(hit['cv_pdf']) and store.exists(hit['cl_pdf'])
+    assert cache.referenced() == {hit['cv_pdf'], hit['cl_pdf']}
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+def test_expired_entries_are_dropped(tmp_path, store, monkeypatch):
+    cache = ResultCache(str(tmp_path / 'results.db'), store, ttl=60)
+    cache.put('k', pdf(tmp_path, 'cv.pdf', b'cv'), pdf(tmp_path, 'cl.pdf', b'cl'), {}, '')
+    later = time.time() + 61
+    monkeypatch.setattr(result_cache.time, 'time', lambda: later)
+    assert cache.get('k') is None
+    assert cache.stats()['entries'] == 0
+
+def test_entry_with_a_missing_pdf_is_a_miss(tmp_path, store):
+    cache = ResultCache(str(tmp_path / 'results.db'), store)
+    cache.put('k', pdf(tmp_path, 'cv.pdf', b'cv'), pdf(tmp_path, 'cl.pdf', b'cl'), {}, '')
+    os.remove(store.path(cache.referenced().pop()))
+    assert cache.get('k') is None
+    assert cache.stats()['entries'] == 0
+
+def test_least_recently_used_entries_are_evicted(tmp_path, store):
+    cache = ResultCache(str(tmp_path / 'results.db'), store, max_bytes=100)
+    cache.put('old', pdf(tmp_path, 'a.pdf', b'a' * 20), pdf(tmp_path, 'b.pdf', b'b' * 20), {}, '')
+    cache.put('new', pdf(tmp_path, 'c.pdf', b'c' * 20), pdf(tmp_path, 'd.pdf', b'd' * 20), {}, '')
+    assert cache.get('old') is None
+    assert cache.get('new') is not None
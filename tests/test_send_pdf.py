@@ -0,0 +1,59 @@
+import os
+import pytest
+
+CONTENT = b'%PDF-1.4\n' + bytes(range(256)) * 8 + b'\n%%EOF\n'
+
+@pytest.fixture
+def stored(webapp, tmp_path):
+    src = tmp_path / 'CV.pdf'
+    src.write_bytes(CONTENT)
+    return webapp.pdf_store.put(str(src))
+
+@pytest.fixture
+def client(webapp):
+    return webapp.app.test_client()
+
+def test_stored_pdf_has_a_strong_etag_and_is_immutable(client, stored):
+    response = client.get(f'/view/{stored}')
+    assert response.status_code == 200 and response.data == CONTENT
+    assert response.headers['ETag'] == f'"{stored[:-4]}"'
+    assert response.cache_control.immutable and response.cache_control.public
+    assert response.cache_control.max_age == 365 * 24 * 3600
+    assert response.headers['Content-Disposition'].startswith('inline')
+
+def test_matching_etag_gets_304_without_a_body(client, stored):
+    response = client.get(f'/view/{stored}', headers={'If-None-Match': f'"{stored[:-4]}"'})
+    assert response.status_code == 304 and response.data == b''
+    assert response.headers['ETag'] == f'"{stored[:-4]}"'
+
+def test_304_does_not_touch_the_disk(client, stored, webapp):
+    os.remove(webapp.pdf_store.path(stored))
+    response = client.get(f'/view/{stored}', headers={'If-None-Match': f'"{stored[:-4]}"'})
+    assert response.status_code == 304
+    assert client.get(f'/view/{stored}').status_code == 404
+
+def test_range_requests_are_served_partially(client, stored):
+    response = client.get(f'/view/{stored}', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == CONTENT[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(CONTENT)}'
+
+def test_download_is_an_attachment(client, stored):
+    response = client.get(f'/download/{stored}')
+    assert response.headers['Content-Disposition'].startswith('attachment')
+
+def test_legacy_and_unknown_names(client, webapp):
+    with open(os.path.join(webapp.app.config['OUTPUT_FOLDER'], 'CV_legacy-job.pdf'), 'wb') as f:
+        f.write(CONTENT)
+    response = client.get('/view/CV_legacy-job.pdf')
+    assert response.status_code == 200
+    assert response.cache_control.max_age == 3600 and not response.cache_control.immutable
+    assert client.get('/view/' + 'a' * 64 + '.pdf').status_code == 404
+    assert client.get('/view/missing.pdf').status_code == 404
+
+def test_x_accel_redirect_hands_the_file_to_the_proxy(client, stored, webapp, monkeypatch):
+    monkeypatch.setitem(webapp.app.config, 'PDF_SENDFILE', 'x-accel-redirect')
+    response = client.get(f'/view/{stored}')
+    assert response.status_code == 200 and response.data == b''
+    assert response.headers['X-Accel-Redirect'] == f'/_outputs/pdf/{stored[:2]}/{stored[2:4]}/{stored}'
+    assert response.headers['ETag'] == f'"{stored[:-4]}"'
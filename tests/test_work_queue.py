@@ -0,0 +1,163 @@
+import time
+import pytest
+import work_queue
+from work_queue import QueueFull, QueueWorker, SQLiteWorkQueue
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteWorkQueue(str(tmp_path / 'queue.db'), visibility_timeout=60, max_attempts=2)
+
+def test_claim_in_arrival_order(queue):
+    queue.enqueue('first', {'n': 1})
+    queue.enqueue('second', {'n': 2})
+    claimed = [queue.claim('w') for _ in range(2)]
+    assert [task.job_id for task in claimed] == ['first', 'second']
+    assert claimed[0].payload == {'n': 1} and claimed[0].attempts == 1
+    assert queue.claim('w') is None
+    assert queue.depth() == 2
+
+def test_claimed_task_is_invisible_until_its_timeout(queue, monkeypatch):
+    queue.enqueue('a', {})
+    assert queue.claim('w1') is not None
+    assert queue.claim('w2') is None
+    later = time.time() + 61
+    monkeypatch.setattr(work_queue.time, 'time', lambda: later)
+    task = queue.claim('w2')
+    assert task.job_id == 'a' and task.attempts == 2
+
+def test_heartbeat_extends_the_claim(queue, monkeypatch):
+    task_id = queue.enqueue('a', {})
+    queue.claim('w1')
+    now = time.time()
+    monkeypatch.setattr(work_queue.time, 'time', lambda: now + 50)
+    queue.heartbeat([task_id], 'w1')
+    monkeypatch.setattr(work_queue.time, 'time', lambda: now + 70)
+    assert queue.claim('w2') is None
+
+def test_complete_removes_the_task(queue):
+    task_id = queue.enqueue('a', {})
+    queue.claim('w')
+    queue.complete(task_id, 'w')
+    assert queue.depth() == 0 and queue.position('a') is None
+
+def test_fail_retries_then_buries(queue):
+    task_id = queue.enqueue('a', {})
+    queue.claim('w')
+    queue.fail(task_id, 'w', 'boom')
+    retry = queue.claim('w')
+    assert retry.id == task_id and retry.attempts == 2
+    queue.fail(task_id, 'w', 'boom')
+    assert queue.claim('w') is None
+    assert queue.depth() == 0
+
+def test_fail_by_another_worker_is_ignored(queue):
+    task_id = queue.enqueue('a', {})
+    queue.claim('w1')
+    queue.fail(task_id, 'w2', 'boom')
+    assert queue.position('a') == 0
+
+def test_reap_dead_buries_tasks_of_dead_workers(queue, monkeypatch):
+    task_id = queue.enqueue('a', {})
+    queue.claim('w1')
+    now = time.time()
+    monkeypatch.setattr(work_queue.time, 'time', lambda: now + 61)
+    queue.claim('w2')
+    assert queue.reap_dead() == []
+    monkeypatch.setattr(work_queue.time, 'time', lambda: now + 122)
+    dead = queue.reap_dead()
+    assert [task.id for task in dead] == [task_id]
+    assert queue.depth() == 0
+
+def test_position_counts_tasks_ahead(queue):
+    queue.enqueue('a', {})
+    queue.enqueue('b', {})
+    assert queue.position('a') == 1 and queue.position('b') == 2
+    queue.claim('w')
+    assert queue.position('a') == 0 and queue.position('b') == 1
+    assert queue.position('missing') is None
+
+def run_worker(queue, handler, until):
+    worker = QueueWorker(queue, handler, concurrency=1, poll_interval=0.01)
+    worker.start()
+    deadline = time.time() + 5
+    while not until() and time.time() < deadline:
+        time.sleep(0.01)
+    worker.stop()
+    return worker
+
+def test_worker_runs_and_completes_tasks(queue):
+    seen = []
+    queue.enqueue('a', {'n': 1})
+    queue.enqueue('b', {'n': 2})
+    run_worker(queue, lambda task: seen.append(task.payload['n']), lambda: len(seen) == 2)
+    assert seen == [1, 2]
+    assert queue.depth() == 0
+
+def test_worker_survives_a_failure_it_cannot_record(queue, monkeypatch):
+    handled = []
+
+    def handler(task):
+        handled.append(task.job_id)
+        if task.job_id == 'bad':
+            raise RuntimeError('handler failed')
+
+    def broken_fail(*args):
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(queue, 'fail', broken_fail)
+    queue.enqueue('bad', {})
+    queue.enqueue('good', {})
+    worker = run_worker(queue, handler, lambda: 'good' in handled)
+    assert handled == ['bad', 'good']
+    assert worker.in_flight() == 0
+    assert not any(thread.is_alive() for thread in worker._threads)
+
+def test_max_depth_rejects_without_inserting(queue):
+    queue.enqueue('a', {}, max_depth=2)
+    queue.enqueue('b', {}, max_depth=2)
+    with pytest.raises(QueueFull) as error:
+        queue.enqueue('c', {}, max_depth=2, retry_after=7)
+    assert error.value.retry_after == 7
+    assert queue.depth() == 2
+    with pytest.raises(QueueFull):
+        queue.enqueue_many([('d', {}), ('e', {})], max_depth=3)
+    assert queue.depth() == 2
+
+def test_max_per_owner_limits_each_owner(queue):
+    queue.enqueue('a', {}, owner='u1', max_per_owner=2)
+    queue.enqueue('b', {}, owner='u1', max_per_owner=2)
+    with pytest.raises(QueueFull):
+        queue.enqueue('c', {}, owner='u1', max_per_owner=2)
+    queue.enqueue('d', {}, owner='u2', max_per_owner=2)
+    queue.enqueue('e', {}, max_per_owner=2)
+
+def test_owner_slot_frees_when_the_job_completes(queue):
+    task_id = queue.enqueue('a', {}, owner='u1', max_per_owner=1)
+    with pytest.raises(QueueFull):
+        queue.enqueue('b', {}, owner='u1', max_per_owner=1)
+    queue.claim('w')
+    queue.complete(task_id, 'w')
+    queue.enqueue('b', {}, owner='u1', max_per_owner=1)
+
+def test_claim_by_priority_then_arrival(queue):
+    queue.enqueue('free', {}, priority=1)
+    queue.enqueue('pro-1', {})
+    queue.enqueue('pro-2', {})
+    assert queue.position('free') == 3
+    assert [queue.claim('w').job_id for _ in range(3)] == ['pro-1', 'pro-2', 'free']
+
+def test_a_batch_counts_as_one_job_of_its_owner(queue):
+    queue.enqueue_many([('b1', {}), ('b2', {}), ('b3', {})], owner='u1', batch_id='batch', max_per_owner=2)
+    queue.enqueue('single', {}, owner='u1', max_per_owner=2)
+    with pytest.raises(QueueFull):
+        queue.enqueue('third', {}, owner='u1', max_per_owner=2)
+
+def test_batch_limit_caps_running_items(queue):
+    queue.enqueue_many([('b1', {}), ('b2', {}), ('b3', {})], batch_id='batch', batch_limit=2)
+    queue.enqueue('other', {})
+    first, second = queue.claim('w'), queue.claim('w')
+    assert (first.job_id, second.job_id) == ('b1', 'b2')
+    assert queue.claim('w').job_id == 'other'
+    assert queue.claim('w') is None
+    queue.complete(first.id, 'w')
+    assert queue.claim('w').job_id == 'b3'
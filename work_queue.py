@@ -0,0 +1,280 @@
+import os
+import json
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import sqlite_tuning
+
+class QueueFull(Exception):
+    """Raised by enqueue() when admission limits are reached; retry_after is in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class Task:
+    def __init__(self, id, job_id, payload, attempts, created_at=None):
+        self.id = id
+        self.job_id = job_id
+        self.payload = payload
+        self.attempts = attempts
+        # time.time() of the enqueue
+        self.created_at = created_at
+
+class SQLiteWorkQueue:
+    """Durable job queue in a SQLite file, safe to consume from several processes.
+
+    A claimed task stays invisible to other workers for `visibility_timeout`
+    seconds. Workers extend that with heartbeat() while they run it, so a
+    task only becomes claimable again when its worker has died. After
+    `max_attempts` claims it is moved to 'dead' instead (see reap_dead).
+
+    Tasks are claimed by ascending priority, then in arrival order.
+    """
+
+    def __init__(self, db_path, visibility_timeout=600, max_attempts=3):
+        self.db_path = db_path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._conn()
+        sqlite_tuning.enable_wal(conn)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'ready',
+                priority INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                batch_id TEXT,
+                batch_limit INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                visible_at REAL NOT NULL,
+                claimed_by TEXT,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )""")
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(tasks)")]
+        for column, kind in (('owner', 'TEXT'), ('batch_id', 'TEXT'), ('batch_limit', 'INTEGER')):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {kind}")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_tasks_claim ON tasks (status, priority, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_tasks_owner ON tasks (owner, status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_tasks_job ON tasks (job_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_tasks_batch ON tasks (batch_id, status)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite_tuning.connect(self.db_path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, job_id, payload, priority=0, owner=None, **limits):
+        return self.enqueue_many([(job_id, payload)], priority=priority, owner=owner, **limits)[0]
+
+    def enqueue_many(self, tasks, priority=0, owner=None, batch_id=None, batch_limit=None,
+                     max_depth=None, max_per_owner=None, retry_after=30):
+        """Adds [(job_id, payload)] tasks and returns their ids.
+
+        Raises QueueFull if that would exceed max_depth pending tasks overall,
+        or if the owner already has max_per_owner jobs pending (a batch counts
+        as one). The limits are checked and the rows inserted in one
+        transaction. At most batch_limit tasks of one batch run at once.
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if max_depth is not None:
+                depth = conn.execute("SELECT COUNT(*) FROM tasks WHERE status IN ('ready', 'claimed')").fetchone()[0]
+                if depth + len(tasks) > max_depth:
+                    raise QueueFull("The server is busy. Please try again shortly.", retry_after)
+            if max_per_owner is not None and owner is not None:
+                running = conn.execute("""
+                    SELECT COUNT(DISTINCT COALESCE(batch_id, job_id)) FROM tasks
+                    WHERE owner = ? AND status IN ('ready', 'claimed')""", (owner,)).fetchone()[0]
+                if running >= max_per_owner:
+                    raise QueueFull(f"You already have {running} jobs in progress. "
+                                    "Please wait for one to finish.", retry_after)
+            ids = []
+            for job_id, payload in tasks:
+                cursor = conn.execute(
+                    "INSERT INTO tasks (job_id, payload, priority, owner, batch_id, batch_limit, visible_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, json.dumps(payload), priority, owner, batch_id, batch_limit, now, now))
+                ids.append(cursor.lastrowid)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return ids
+
+    def claim(self, worker_id):
+        """Atomically takes the next runnable task, or returns None."""
+        now = time.time()
+        conn = self._conn()
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can never pick the same row
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("""
+                SELECT id, job_id, payload, attempts, created_at FROM tasks t
+                WHERE (status = 'ready' OR (status = 'claimed' AND visible_at <= ?)) AND attempts < ?
+                  AND (batch_limit IS NULL OR batch_limit > (
+                      SELECT COUNT(*) FROM tasks b
+                      WHERE b.batch_id = t.batch_id AND b.status = 'claimed' AND b.visible_at > ?))
+                ORDER BY priority, id LIMIT 1""", (now, self.max_attempts, now)).fetchone()
+            if row:
+                conn.execute("UPDATE tasks SET status = 'claimed', claimed_by = ?, attempts = attempts + 1, "
+                             "visible_at = ? WHERE id = ?", (worker_id, now + self.visibility_timeout, row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if not row:
+            return None
+        return Task(row[0], row[1], json.loads(row[2]), row[3] + 1, row[4])
+
+    def heartbeat(self, task_ids, worker_id):
+        if not task_ids:
+            return
+        marks = ', '.join('?' * len(task_ids))
+        self._conn().execute(
+            f"UPDATE tasks SET visible_at = ? WHERE id IN ({marks}) AND claimed_by = ? AND status = 'claimed'",
+            [time.time() + self.visibility_timeout, *task_ids, worker_id])
+
+    def complete(self, task_id, worker_id):
+        self._conn().execute("UPDATE tasks SET status = 'done', claimed_by = NULL WHERE id = ? AND claimed_by = ?",
+                             (task_id, worker_id))
+
+    def fail(self, task_id, worker_id, error):
+        """Returns a task to the queue after an error, or buries it once out of attempts."""
+        self._conn().execute("""
+            UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'ready' END,
+                             claimed_by = NULL, visible_at = ?, last_error = ?
+            WHERE id = ? AND claimed_by = ?""", (self.max_attempts, time.time(), str(error), task_id, worker_id))
+
+    def reap_dead(self):
+        """Buries tasks whose worker died on their last attempt and returns them."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("""
+                SELECT id, job_id, payload, attempts FROM tasks
+                WHERE status = 'claimed' AND visible_at <= ? AND attempts >= ?""",
+                                (time.time(), self.max_attempts)).fetchall()
+            conn.executemany("UPDATE tasks SET status = 'dead', claimed_by = NULL WHERE id = ?",
+                             [(row[0],) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [Task(row[0], row[1], json.loads(row[2]), row[3]) for row in rows]
+
+    def purge(self, older_than):
+        """Deletes finished tasks created more than older_than seconds ago."""
+        self._conn().execute("DELETE FROM tasks WHERE status IN ('done', 'dead') AND created_at < ?",
+                             (time.time() - older_than,))
+
+    def position(self, job_id):
+        """1-based place of a waiting job in claim order, 0 once it is running, None if unknown."""
+        conn = self._conn()
+        row = conn.execute("SELECT id, status, priority FROM tasks WHERE job_id = ? ORDER BY id DESC LIMIT 1",
+                           (job_id,)).fetchone()
+        if not row or row[1] not in ('ready', 'claimed'):
+            return None
+        if row[1] == 'claimed':
+            return 0
+        ahead = conn.execute("""
+            SELECT COUNT(*) FROM tasks
+            WHERE status = 'ready' AND (priority < ? OR (priority = ? AND id < ?))""",
+                             (row[2], row[2], row[0])).fetchone()[0]
+        return ahead + 1
+
+    def depth(self):
+        """Tasks waiting or running."""
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM tasks WHERE status IN ('ready', 'claimed')").fetchone()[0]
+
+class QueueWorker:
+    """Consumes a work queue with a fixed number of threads.
+
+    handler(task) does the work; an exception from it sends the task back
+    through queue.fail(). on_dead(task) is called for tasks that used up
+    their attempts because their worker kept dying.
+    """
+
+    def __init__(self, queue, handler, concurrency=5, poll_interval=0.5, on_dead=None):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.on_dead = on_dead
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._consume, name=f"queue-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._maintain, name="queue-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, wait=True):
+        self._stop.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    def _consume(self):
+        while not self._stop.is_set():
+            try:
+                task = self.queue.claim(self.worker_id)
+            except sqlite3.Error as e:
+                print(f"Queue claim failed: {e}")
+                task = None
+            if task is None:
+                self._stop.wait(self.poll_interval)
+                continue
+
+            with self._lock:
+                self._in_flight.add(task.id)
+            try:
+                self.handler(task)
+                self.queue.complete(task.id, self.worker_id)
+            except Exception as e:
+                print(f"Task {task.id} (job {task.job_id}) failed: {e}")
+                try:
+                    self.queue.fail(task.id, self.worker_id, e)
+                except Exception as fail_error:
+                    # No longer heartbeated, the task is handed out again once its claim expires
+                    print(f"Could not record the failure of task {task.id}: {fail_error}")
+            finally:
+                with self._lock:
+                    self._in_flight.discard(task.id)
+
+    def _maintain(self):
+        interval = max(self.queue.visibility_timeout / 3, 1)
+        while not self._stop.wait(interval):
+            try:
+                with self._lock:
+                    task_ids = list(self._in_flight)
+                self.queue.heartbeat(task_ids, self.worker_id)
+                for task in self.queue.reap_dead():
+                    if self.on_dead:
+                        self.on_dead(task)
+            except Exception as e:
+                print(f"Queue maintenance failed: {e}")
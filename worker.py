@@ -0,0 +1,76 @@
+"""Standalone queue worker: runs adaptation jobs enqueued by the web app.
+
+    python worker.py --concurrency 8
+
+Run as many of these as the host can take; they share instance/queue.db
+with the web processes, which can then be started with EMBEDDED_WORKERS=0.
+With --metrics-port, the worker's own metrics (those of the jobs it runs) are
+served at http://<host>:<port>/metrics for Prometheus.
+"""
+import os
+import argparse
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from metrics import CONTENT_TYPE
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def serve_metrics(port, registry):
+    MetricsHandler.registry = registry
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Run CV adaptation jobs from the work queue.")
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('WORKER_CONCURRENCY', 5)),
+                        help="jobs processed at once (default: WORKER_CONCURRENCY or 5); "
+                             "ASYNC_MAX_JOBS with EXECUTION_ENGINE=async")
+    parser.add_argument('--metrics-port', type=int, default=int(os.getenv('WORKER_METRICS_PORT', 0)),
+                        help="serve /metrics on this port (default: WORKER_METRICS_PORT, 0 disables)")
+    args = parser.parse_args()
+
+    # The web app's own consumer threads are not wanted in a dedicated worker,
+    # and its stage pool is sized at import for the jobs run here
+    os.environ['EMBEDDED_WORKERS'] = '0'
+    os.environ['JOB_THREADS'] = str(args.concurrency)
+    from app import app, start_queue_worker, metrics_registry
+
+    if app.config['JOB_STORE'] == 'memory':
+        print("Warning: JOB_STORE=memory keeps progress inside this process; the web app will not see it.")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    if args.metrics_port:
+        serve_metrics(args.metrics_port, metrics_registry)
+    worker = start_queue_worker(args.concurrency)
+    if app.config['EXECUTION_ENGINE'] == 'async':
+        print(f"Worker {worker.worker_id} consuming with up to {worker.concurrency} jobs on an event loop.")
+    else:
+        print(f"Worker {worker.worker_id} consuming with {args.concurrency} threads.")
+    stop.wait()
+    print("Stopping: finishing jobs in progress...")
+    worker.stop(wait=True)
+
+if __name__ == '__main__':
+    main()